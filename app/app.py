@@ -1,42 +1,77 @@
 import os
+import re
+import hmac
+import threading
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import yaml
-from flask import Flask, request, abort
-from linebot import LineBotApi, WebhookHandler
+from flask import Flask, request, abort, send_from_directory, jsonify
+from linebot import LineBotApi, WebhookParser
 from linebot.exceptions import InvalidSignatureError
 from linebot.models import MessageEvent, TextMessage, TextSendMessage, ImageMessage, ImageSendMessage
-from flasgger import Swagger
 
 # OCR module
-from utils.ocr_cloudvision import extract_text_from_image, parse_total_amount
-from utils.invoice_processing import is_uniform_invoice, process_uniform_invoice
-from utils.cwa import get_radar_image_url, get_rainfall_image_url, get_temperature_image_url, get_qpf_image_url
-# Logging
+from utils.ocr_cloudvision import extract_documents_from_image, parse_total_amount
+from utils.einvoice_qr import decode_einvoices
+from utils.invoice_processing import (
+    is_uniform_invoice,
+    process_uniform_invoice,
+    process_invoice,
+    set_invoice_archive,
+    set_winning_numbers_store,
+    get_winning_numbers_for_period,
+    fetch_winning_numbers_page,
+    is_drawn,
+    ETAX_WINNING_NUMBER_URLS,
+)
+from utils.invoice_archive import InvoiceArchive, recheck_pending_invoices
+from utils.winning_numbers_store import WinningNumbersStore, sync_winning_numbers
+from utils.periodic import PeriodicTask
+from utils.weather_images import WeatherImageCache
+from utils.radar_frames import RadarFrameStore, collect_radar_frame
+from utils.cwa import (
+    get_radar_image_url, get_rainfall_image_url, get_temperature_image_url, get_qpf_image_url, gather_with_deadline,
+)
+from utils.job_queue import JobQueue, JobConsumerPool, JobDeferred
+from utils.line_delivery import get_source_id, deliver_messages
+from utils.ledger import ExpenseLedger, month_key, parse_amount
+from utils.lanes import Lane
+from utils.rate_limit import TokenBucketLimiter, rate_limit_rules
+from utils.cache import configure_cache_backend, create_cache_backend
+from utils.sampling_profiler import SamplingProfiler
+from utils.readiness import build_readiness, render_metrics
+from utils.structured_logging import configure_logging, log_event
+from utils.reply_summary import DocumentResult, build_image_reply
+from utils.memory_budget import ByteBudget, MemoryBudgetExceeded, ImageTooLargeError, estimate_image_bytes, track_stage
 import logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 app = Flask(__name__)
-swagger = Swagger(app, config={
-    "headers": [],
-    'specs': [
-        {
-            'endpoint': 'linebot',
-            'route': '/linebot.json',
-            'rule_filter': lambda rule: True,  # include all endpoints
-            'model_filter': lambda tag: True,  # include all models
-        }
-    ],
-    'static_url_path': '/flasgger_static',
-    'swagger_ui': True,
-    'specs_route': '/apidocs/'
-})
+
+# API docs，可用 ENABLE_APIDOCS=0 關閉以省下 flasgger 的載入時間
+if os.environ.get('ENABLE_APIDOCS', '1') == '1':
+    from flasgger import Swagger
+    swagger = Swagger(app, config={
+        "headers": [],
+        'specs': [
+            {
+                'endpoint': 'linebot',
+                'route': '/linebot.json',
+                'rule_filter': lambda rule: True,  # include all endpoints
+                'model_filter': lambda tag: True,  # include all models
+            }
+        ],
+        'static_url_path': '/flasgger_static',
+        'swagger_ui': True,
+        'specs_route': '/apidocs/'
+    })
 
 # Get LINE Channel Secret and Access Token from Environment Variables
 CHANNEL_ACCESS_TOKEN = os.getenv('CHANNEL_ACCESS_TOKEN')
 CHANNEL_SECRET = os.getenv('CHANNEL_SECRET')
 
 line_bot_api = LineBotApi(CHANNEL_ACCESS_TOKEN)
-handler = WebhookHandler(CHANNEL_SECRET)
+parser = WebhookParser(CHANNEL_SECRET)
 
 # Get directory of this file
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -48,12 +83,108 @@ config_path = os.path.join(current_dir, '..', 'config.yaml')
 with open(config_path, 'r') as yml:
     config = yaml.safe_load(yml)
 
+# Logging，JSON 紀錄由背景 thread 寫出，依類別抽樣並遮蔽使用者 id 與收據文字
+LOGGING_CONFIG = config['logging']
+configure_logging(
+    level=os.environ.get('LOG_LEVEL', LOGGING_CONFIG['level']),
+    queue_size=LOGGING_CONFIG['queue_size'],
+    max_message_chars=LOGGING_CONFIG['max_message_chars'],
+    sample_rates=LOGGING_CONFIG['sample_rates'],
+)
+
 # Get host and port
 HOST = config['server']['host']
 PORT = config['server']['port']
 
+# Durable job queue for image processing
+JOB_QUEUE_CONFIG = config['job_queue']
+IMAGE_SPOOL_DIR = os.path.join(current_dir, '..', JOB_QUEUE_CONFIG['image_dir'])
+os.makedirs(IMAGE_SPOOL_DIR, exist_ok=True)
+job_queue = JobQueue(
+    os.path.join(current_dir, '..', JOB_QUEUE_CONFIG['path']),
+    lease_seconds=JOB_QUEUE_CONFIG['lease_seconds'],
+    max_attempts=JOB_QUEUE_CONFIG['max_attempts'],
+)
+# 同一位使用者連續傳送的圖片，在時間窗內到達的合併處理並回覆一則摘要（0 表示每張各自回覆）
+IMAGE_COALESCE_WINDOW = JOB_QUEUE_CONFIG['coalesce_window']
+IMAGE_COALESCE_MAX_IMAGES = JOB_QUEUE_CONFIG['coalesce_max_images']
+# 圖片解碼與 OCR 的記憶體預算（每個 process），額度不足時工作排隊等待，逾時則稍後重試
+IMAGE_MEMORY_CONFIG = config['image_memory']
+image_budget = ByteBudget('image', IMAGE_MEMORY_CONFIG['budget_bytes'])
+IMAGE_BUDGET_WAIT = IMAGE_MEMORY_CONFIG['wait_seconds']
+IMAGE_BUDGET_RETRY_DELAY = IMAGE_MEMORY_CONFIG['retry_delay']
+IMAGE_MAX_DOWNLOAD_BYTES = IMAGE_MEMORY_CONFIG['max_download_bytes']
+# 合併處理時同時分析的圖片數，有設定 VISION_BATCH_WINDOW_MS 時 OCR 會合併成一次 batch 呼叫
+IMAGE_COALESCE_CONCURRENCY = 4
+
+# Expense ledger
+ledger = ExpenseLedger(os.path.join(current_dir, '..', config['ledger']['path']))
+
+# 由電子發票 QR Code 記帳時使用的消費類別
+EINVOICE_CATEGORY = '電子發票'
+
+# Invoice archive, pending invoices are checked in bulk after the draw
+invoice_archive = InvoiceArchive(os.path.join(current_dir, '..', config['invoice_archive']['path']))
+set_invoice_archive(invoice_archive)
+
+# Local winning numbers store, kept up to date by a background sync job
+WINNING_NUMBERS_CONFIG = config['winning_numbers']
+winning_numbers_store = WinningNumbersStore(os.path.join(current_dir, '..', WINNING_NUMBERS_CONFIG['path']))
+set_winning_numbers_store(winning_numbers_store)
+
+# Weather images are cached locally with a small preview, served from /weather-images/
+WEATHER_IMAGES_CONFIG = config['weather_images']
+WEATHER_IMAGE_DIR = os.path.join(current_dir, '..', WEATHER_IMAGES_CONFIG['dir'])
+weather_image_cache = WeatherImageCache(
+    WEATHER_IMAGE_DIR,
+    preview_max_edge=WEATHER_IMAGES_CONFIG['preview_max_edge'],
+    keep=WEATHER_IMAGES_CONFIG['keep'],
+    check_interval=WEATHER_IMAGES_CONFIG['check_interval'],
+)
+# 快取的圖片檔名含時間戳記，內容不會再變動
+WEATHER_IMAGE_MAX_AGE = 365 * 24 * 3600
+
+# Recent radar frames and the pre-rendered loop, collected in the background
+RADAR_FRAMES_CONFIG = config['radar_frames']
+RADAR_FRAME_DIR = os.path.join(current_dir, '..', RADAR_FRAMES_CONFIG['dir'])
+radar_frame_store = RadarFrameStore(
+    RADAR_FRAME_DIR,
+    capacity=RADAR_FRAMES_CONFIG['capacity'],
+    frame_max_edge=RADAR_FRAMES_CONFIG['frame_max_edge'],
+    frame_duration_ms=RADAR_FRAMES_CONFIG['frame_duration_ms'],
+)
+
+# Priority lanes for webhook events
+LANES_CONFIG = config['lanes']
+IMAGE_MAX_BACKLOG = LANES_CONFIG['image']['max_backlog']
+
+# Per-user / per-group rate limits, shared by all workers
+RATE_LIMITS_CONFIG = config['rate_limits']
+rate_limiter = TokenBucketLimiter(
+    os.path.join(current_dir, '..', RATE_LIMITS_CONFIG['path']),
+    rate_limit_rules(RATE_LIMITS_CONFIG),
+)
+
 load_dotenv()
 
+# Shared cache backend (CWA URLs, LLM answers)，可用環境變數 CACHE_BACKEND 覆寫
+CACHE_CONFIG = config['cache']
+configure_cache_backend(create_cache_backend(
+    os.environ.get('CACHE_BACKEND', CACHE_CONFIG['backend']),
+    path=os.path.join(current_dir, '..', CACHE_CONFIG['path']),
+    max_bytes=CACHE_CONFIG['max_bytes'],
+    url=os.environ.get('REDIS_URL'),
+))
+
+# On-demand sampling profiler；未設定 ADMIN_TOKEN 時管理端點一律回 404
+PROFILER_CONFIG = config['profiler']
+PROFILE_DIR = os.path.join(current_dir, '..', PROFILER_CONFIG['dir'])
+profiler = SamplingProfiler(PROFILE_DIR, interval=PROFILER_CONFIG['interval'])
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+
+# 對外的 https 網址（例如 https://{your-heroku-app-name}.herokuapp.com），設定後天氣圖改由本服務提供
+PUBLIC_BASE_URL = os.getenv('PUBLIC_BASE_URL', '').rstrip('/')
+
 
 @app.route("/callback", methods=['POST'])
 def callback():
@@ -86,171 +217,468 @@ def callback():
     """
     signature = request.headers['X-Line-Signature']
     body = request.get_data(as_text=True)
-    app.logger.info("Request body: " + body)
+    try:
+        events = parser.parse(body, signature)
+    except InvalidSignatureError:
+        abort(400)
+    log_event('webhook', "LINE webhook", events=len(events), bytes=len(body))
+
+    # profiler 比例模式下抽中的請求，其事件處理會被取樣
+    profile = profiler.should_sample()
+    for event in events:
+        dispatch_event(event, profile)
+
+    return 'OK'
+
+
+# 文字指令與圖片各自有通道與並行上限，圖片再多也不會讓文字指令排隊
+lanes = {
+    'text': Lane('text', LANES_CONFIG['text']['concurrency'], LANES_CONFIG['text']['max_pending']),
+    'image': Lane('image', LANES_CONFIG['image']['concurrency'], LANES_CONFIG['image']['max_pending']),
+}
+
+BUSY_TEXT = {
+    'text': "⚡ 目前訊息太多了，請稍後再試。",
+    'image': "\u2764 目前要處理的圖片太多了QQ \u2764\n請稍後再傳一次",
+}
+
+
+def event_lane(event):
+    # 事件所屬的通道，不處理的事件回傳 None
+    if isinstance(event, MessageEvent):
+        if isinstance(event.message, TextMessage):
+            return 'text'
+        if isinstance(event.message, ImageMessage):
+            return 'image'
+    return None
+
+
+def dispatch_event(event, profile=False):
+    lane = event_lane(event)
+    if lane is None:
+        return
+    handle = handle_text if lane == 'text' else handle_image
+    if profile:
+        handle = profiler.track(handle)
+    if not lanes[lane].submit(handle, event):
+        logging.warning(f"通道 {lane} 已滿，略過事件")
+        reply_busy(event, lane)
+
 
-    # 新增：嘗試解析 userId 與 text 並 logging
+def reply_busy(event, lane):
+    # 被拒絕的事件只回覆固定訊息，不做任何處理
     try:
-        import json
-        json_data = json.loads(body)
-        events = json_data.get('events', [])
-        if events:
-            event = events[0]
-            user_id = event.get('source', {}).get('userId', None)
-            text = event.get('message', {}).get('text', None)
-            logging.info(f"LINE Request - userId: {user_id}, text: {text}")
+        line_bot_api.reply_message(event.reply_token, TextSendMessage(text=BUSY_TEXT[lane]))
     except Exception as e:
-        logging.warning(f"解析 userId/text 失敗: {e}")
+        logging.error(f"回覆忙碌訊息失敗: {e}")
+
+
+def is_image_backlog_full():
+    return job_queue.depth() >= IMAGE_MAX_BACKLOG
+
+
+THROTTLED_TEXT = {
+    'image': "\u2764 圖片傳得太快了QQ \u2764\n請休息一下再傳",
+    'weather': "⚡ 查詢太頻繁了，請稍後再試。",
+}
+
 
+def is_rate_limited(event, kind):
+    # 使用者或所在的群組 / 聊天室用完額度時回傳 True
+    source = event.source
+    group_id = getattr(source, 'group_id', None) or getattr(source, 'room_id', None)
+    if rate_limiter.allow(kind, getattr(source, 'user_id', None), group_id):
+        return False
+    logging.info(f"請求頻率超過上限：{kind}")
+    return True
+
+
+def reply_throttled(event, kind):
+    # 超過頻率上限只回覆固定訊息，不呼叫 Vision、LLM 或 CWA
     try:
-        handler.handle(body, signature)
-    except InvalidSignatureError:
-        abort(400)
+        line_bot_api.reply_message(event.reply_token, TextSendMessage(text=THROTTLED_TEXT[kind]))
+    except Exception as e:
+        logging.error(f"回覆頻率限制訊息失敗: {e}")
 
-    return 'OK'
+
+# 天氣指令：取得圖片網址的函式、產品名稱與快取用的產品代號
+WEATHER_COMMANDS = {
+    "@雷達": (get_radar_image_url, "雷達回波圖", "radar"),
+    "@溫度": (get_temperature_image_url, "溫度分布圖", "temperature"),
+    "@雨量": (get_rainfall_image_url, "雨量圖", "rainfall"),
+    "@定量降水": (get_qpf_image_url, "定量降水預報圖", "qpf"),
+}
+# 一次回覆上面所有天氣圖，各產品同時取得並共用同一個期限（秒）
+WEATHER_DASHBOARD_COMMAND = "@天氣"
+WEATHER_DASHBOARD_TIMEOUT = float(os.environ.get('WEATHER_DASHBOARD_TIMEOUT', 8))
+
+
+def is_weather_command(user_text):
+    return user_text in WEATHER_COMMANDS or user_text == WEATHER_DASHBOARD_COMMAND
 
 
-@handler.add(MessageEvent, message=TextMessage)
 def handle_text(event):
     user_text = event.message.text.strip()
-    if user_text == "@雷達":
-        import asyncio
-        try:
-            radar_url = asyncio.run(get_radar_image_url())
-            if radar_url:
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    ImageSendMessage(original_content_url=radar_url, preview_image_url=radar_url)
-                )
-            else:
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    TextSendMessage(text="⚡ 取得雷達回波圖失敗，請稍後再試。")
-                )
-        except Exception as e:
-            logging.error(f"取得雷達回波圖時發生錯誤: {e}")
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text="⚡ 取得雷達回波圖時發生錯誤，請稍後再試。")
-            )
+    reply_text = build_ledger_reply(event.source.user_id, user_text)
+    if reply_text:
+        line_bot_api.reply_message(event.reply_token, TextSendMessage(text=reply_text))
         return
-    if user_text == "@溫度":
-        import asyncio
-        try:
-            temperature_url = asyncio.run(get_temperature_image_url())
-            if temperature_url:
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    ImageSendMessage(original_content_url=temperature_url, preview_image_url=temperature_url)
-                )
-            else:
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    TextSendMessage(text="⚡ 取得溫度分布圖失敗，請稍後再試。")
-                )
-        except Exception as e:
-            logging.error(f"取得溫度分布圖時發生錯誤: {e}")
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text="⚡ 取得溫度分布圖時發生錯誤，請稍後再試。")
-            )
+    if is_weather_command(user_text):
+        if is_rate_limited(event, 'weather'):
+            reply_throttled(event, 'weather')
+            return
+        line_bot_api.reply_message(event.reply_token, asyncio.run(build_weather_reply(user_text)))
         return
-    if user_text == "@雨量":
-        import asyncio
-        try:
-            rainfall_url = asyncio.run(get_rainfall_image_url())
-            if rainfall_url:
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    ImageSendMessage(original_content_url=rainfall_url, preview_image_url=rainfall_url)
-                )
-            else:
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    TextSendMessage(text="⚡ 取得雨量圖失敗，請稍後再試。")
-                )
-        except Exception as e:
-            logging.error(f"取得雨量圖時發生錯誤: {e}")
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text="⚡ 取得雨量圖時發生錯誤，請稍後再試。")
-            )
-        return
-    if user_text == "@定量降水":
-        import asyncio
-        try:
-            qpf_url = asyncio.run(get_qpf_image_url())
-            if qpf_url:
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    ImageSendMessage(original_content_url=qpf_url, preview_image_url=qpf_url)
-                )
-            else:
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    TextSendMessage(text="⚡ 取得定量降水預報圖失敗，請稍後再試。")
-                )
-        except Exception as e:
-            logging.error(f"取得定量降水預報圖時發生錯誤: {e}")
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text="⚡ 取得定量降水預報圖時發生錯誤，請稍後再試。")
-            )
+    radar_message = build_radar_history_reply(user_text)
+    if radar_message:
+        line_bot_api.reply_message(event.reply_token, radar_message)
         return
     # 其他文字訊息暫不處理
-    print(f"Get Message: {event.message}")
+    log_event('message', "未處理的文字訊息", user_id=event.source.user_id, text=user_text)
     # line_bot_api.reply_message(
     #     event.reply_token,
     #     TextSendMessage(text=reply_text)
     # )
 
 
-@handler.add(MessageEvent, message=ImageMessage)
+def build_ledger_reply(user_id, user_text):
+    # 記帳查詢指令，不是記帳指令時回傳 None
+    if user_text == "@本月支出":
+        summary = ledger.monthly_total(user_id)
+        if summary['count'] == 0:
+            return f"\u2764 {summary['month']} 還沒有支出紀錄喔 \u2764"
+        return f"\u2764 {summary['month']} 支出 \u2764\n總計：{summary['total']:,.0f} 元\n共 {summary['count']} 筆"
+    if user_text == "@分類統計":
+        month = month_key()
+        categories = ledger.category_totals(user_id, month)
+        if not categories:
+            return f"\u2764 {month} 還沒有支出紀錄喔 \u2764"
+        lines = [f"{item['category']}：{item['total']:,.0f} 元（{item['count']} 筆）" for item in categories]
+        return f"\u2764 {month} 分類統計 \u2764\n" + "\n".join(lines)
+    return None
+
+
+async def build_weather_reply(user_text):
+    # 取得天氣圖片網址，回傳圖片訊息或錯誤提示
+    if user_text == WEATHER_DASHBOARD_COMMAND:
+        return await build_weather_dashboard_reply()
+    get_image_url, name, product = WEATHER_COMMANDS[user_text]
+    try:
+        image_url = await get_image_url()
+        if image_url:
+            return await build_weather_image_message(product, image_url)
+        return TextSendMessage(text=f"⚡ 取得{name}失敗，請稍後再試。")
+    except Exception as e:
+        logging.error(f"取得{name}時發生錯誤: {e}")
+        return TextSendMessage(text=f"⚡ 取得{name}時發生錯誤，請稍後再試。")
+
+
+async def build_weather_dashboard_reply():
+    # 四種天氣圖各一則圖片訊息（加上說明共不超過 LINE 單次回覆的 5 則），逾時或失敗的產品以文字說明
+    results = await gather_with_deadline(
+        {command: fetch_weather_image_message(command) for command in WEATHER_COMMANDS}, WEATHER_DASHBOARD_TIMEOUT)
+    messages = [message for message in results.values() if message is not None]
+    missing = [WEATHER_COMMANDS[command][1] for command, message in results.items() if message is None]
+    if missing:
+        messages.append(TextSendMessage(text=f"⚡ {'、'.join(missing)}暫時取不到，請稍後再試。"))
+    return messages
+
+
+async def fetch_weather_image_message(command):
+    get_image_url, _, product = WEATHER_COMMANDS[command]
+    image_url = await get_image_url()
+    if not image_url:
+        return None
+    return await build_weather_image_message(product, image_url)
+
+
+# 例如 @雷達 30、@雷達30分鐘前
+RADAR_HISTORY_PATTERN = re.compile(r'@雷達\s*(\d{1,3})\s*(?:分鐘前|分鐘|分)?')
+
+
+def build_radar_history_reply(user_text):
+    # 雷達動畫與 N 分鐘前的雷達回波圖只讀取背景收集的影格，不呼叫上游；不是這兩個指令時回傳 None
+    if user_text == "@雷達動畫":
+        loop = radar_frame_store.latest_loop()
+        latest = radar_frame_store.latest_frame()
+        if not PUBLIC_BASE_URL or loop is None or latest is None:
+            return TextSendMessage(text="⚡ 雷達動畫還沒準備好，請稍後再試。")
+        return ImageSendMessage(
+            original_content_url=f"{PUBLIC_BASE_URL}/radar-frames/{loop}",
+            preview_image_url=f"{PUBLIC_BASE_URL}/radar-frames/{latest.filename}",
+        )
+    match = RADAR_HISTORY_PATTERN.fullmatch(user_text)
+    if match:
+        minutes = int(match.group(1))
+        frame = radar_frame_store.frame_minutes_ago(minutes)
+        if not PUBLIC_BASE_URL or frame is None:
+            return TextSendMessage(text=f"⚡ 目前沒有 {minutes} 分鐘前的雷達回波圖。")
+        frame_url = f"{PUBLIC_BASE_URL}/radar-frames/{frame.filename}"
+        return ImageSendMessage(original_content_url=frame_url, preview_image_url=frame_url)
+    return None
+
+
+async def build_weather_image_message(product, image_url):
+    # 有對外網址時改用本地快取的原圖與小尺寸預覽圖，聊天列表不必下載原圖
+    if PUBLIC_BASE_URL:
+        cached = await weather_image_cache.get_async(product, image_url)
+        if cached:
+            return ImageSendMessage(
+                original_content_url=f"{PUBLIC_BASE_URL}/weather-images/{cached.original}",
+                preview_image_url=f"{PUBLIC_BASE_URL}/weather-images/{cached.preview}",
+            )
+    return ImageSendMessage(original_content_url=image_url, preview_image_url=image_url)
+
+
 def handle_image(event):
     # Handle image
     handle_image_message(event)
 
 
 def handle_image_message(event):
-    # Download image from line
+    if is_rate_limited(event, 'image'):
+        reply_throttled(event, 'image')
+        return
+
+    # 佇列已經積壓太多時不再下載圖片
+    if is_image_backlog_full():
+        reply_busy(event, 'image')
+        return
+
+    # Download image from line, 先落地再交給工作佇列，worker 重啟也不會遺失
     message_content = line_bot_api.get_message_content(event.message.id)
-    temp_file_path = f"{event.message.id}.jpg"
+    image_path = image_spool_path(event.message.id)
+    if is_download_too_large(message_content):
+        reply_image_too_large(event)
+        return
+
+    with track_stage('download'):
+        size = 0
+        with open(image_path, 'wb') as fd:
+            for chunk in message_content.iter_content():
+                size += len(chunk)
+                if size > IMAGE_MAX_DOWNLOAD_BYTES:
+                    break
+                fd.write(chunk)
+    if size > IMAGE_MAX_DOWNLOAD_BYTES:
+        os.remove(image_path)
+        reply_image_too_large(event)
+        return
+
+    payload = build_image_job_payload(event, image_path)
+    if profiler.is_tracked():
+        # 被取樣的請求，後續的 OCR 工作也一併取樣
+        payload['profile'] = True
+    # 延後到時間窗結束才處理，期間同一位使用者傳來的圖片會一併領取
+    job_queue.enqueue('image', payload, delay=IMAGE_COALESCE_WINDOW)
 
-    with open(temp_file_path, 'wb') as fd:
-        for chunk in message_content.iter_content():
-            fd.write(chunk)
 
-    # Use OCR
-    text = extract_text_from_image(temp_file_path)
+IMAGE_TOO_LARGE_TEXT = "\u2764 這張圖片太大了QQ \u2764\n請縮小後再傳一次"
 
-    print(f"OCR result:{text}")
 
-    # Get Message
-    kind, message = process_receipt_or_invoice(text)
-    print(f"kind: {kind}")
-    print(f"message: {message}")
+def is_download_too_large(message_content):
+    # 有 Content-Length 時在下載前直接拒絕，沒有時在下載過程中檢查
+    content_length = message_content.response.headers.get('content-length')
+    return content_length is not None and int(content_length) > IMAGE_MAX_DOWNLOAD_BYTES
 
-    # Reply Message
+
+def reply_image_too_large(event):
+    try:
+        line_bot_api.reply_message(event.reply_token, TextSendMessage(text=IMAGE_TOO_LARGE_TEXT))
+    except Exception as e:
+        logging.error(f"回覆圖片過大訊息失敗: {e}")
+
+
+def image_spool_path(message_id):
+    return os.path.join(IMAGE_SPOOL_DIR, f"{message_id}.jpg")
+
+
+def build_image_job_payload(event, image_path):
+    payload = {
+        'message_id': event.message.id,
+        'image_path': image_path,
+        'reply_token': event.reply_token,
+        'received_at': event.timestamp / 1000,
+        'target_id': get_source_id(event),
+        'user_id': event.source.user_id,
+    }
+    if IMAGE_COALESCE_WINDOW > 0:
+        # 同一個聊天中同一位使用者的圖片合併處理
+        payload['group_key'] = f"{payload['target_id']}:{payload['user_id']}"
+    return payload
+
+
+def process_image_job(job):
+    jobs = claim_image_burst(job)
+    if len(jobs) == 1:
+        outcomes = [try_analyze_image_job(job)]
+    else:
+        with ThreadPoolExecutor(max_workers=min(len(jobs), IMAGE_COALESCE_CONCURRENCY)) as executor:
+            outcomes = list(executor.map(try_analyze_image_job, jobs))
+    errors = [error for _, error in outcomes]
+    succeeded = [(item, results) for item, (results, error) in zip(jobs, outcomes) if error is None]
+    reply_text = build_image_reply([results for _, results in succeeded if results is not None])
+    if reply_text:
+        try:
+            deliver_job_reply(latest_payload([item for item, _ in succeeded]), TextSendMessage(text=reply_text))
+        except Exception as e:
+            # 回覆失敗時成功的圖片也要重試；帳本以 source_key 去重，重試不會重複記帳
+            errors = [error or e for error in errors]
+    for given_up, error in finish_image_burst(jobs, errors):
+        notify_job_failed(given_up, error)
+    if errors[0] is not None:
+        # 第一筆工作由 consumer pool 重試、延後或放棄
+        raise errors[0]
+
+
+def try_analyze_image_job(job):
+    # 每張圖片各自成功或失敗，回傳 (分析結果, 例外)，一張失敗不影響同一批的其他圖片
+    try:
+        return analyze_image_job(job), None
+    except Exception as e:
+        logging.error(f"分析工作 {job.id} 的圖片失敗：{e}")
+        return None, e
+
+
+def analyze_image_job(job):
+    # 分析一張圖片中的每份單據，圖片已不存在時回傳 None
+    payload = job.payload
+    image_path = payload['image_path']
+    if not os.path.exists(image_path):
+        logging.warning(f"工作 {job.id} 的圖片已不存在：{image_path}")
+        return None
+
+    # 圖片解碼與 OCR 期間持有記憶體預算，之後的 AI 分析只需要文字
+    try:
+        with image_budget.reserve(estimate_image_bytes(image_path), IMAGE_BUDGET_WAIT):
+            # 電子發票先在本地解 QR Code，解得出來就不需要 OCR 與 AI
+            with track_stage('qr_decode'):
+                records = decode_einvoices(image_path)
+            if not records:
+                # Use OCR, 一次 OCR 取得照片中並排的每一份文件
+                with track_stage('ocr'):
+                    documents = extract_documents_from_image(image_path) or ['']
+    except MemoryBudgetExceeded as e:
+        # 忙碌不是圖片的問題，稍後重新排隊且不計入重試次數
+        raise JobDeferred(str(e), IMAGE_BUDGET_RETRY_DELAY) from e
+    except ImageTooLargeError as e:
+        # 重試結果也一樣，直接回覆圖片過大並完成工作
+        logging.warning(f"工作 {job.id} 的圖片過大：{e}")
+        return [DocumentResult('unknown', IMAGE_TOO_LARGE_TEXT)]
+    if records:
+        return [process_einvoice_record(record, payload.get('user_id'), payload.get('target_id'))
+                for record in records]
+    results = []
+    with track_stage('analyze'):
+        for index, text in enumerate(documents):
+            # Get Message
+            kind, message = process_receipt_or_invoice(text, payload.get('user_id'), payload.get('target_id'))
+            log_event('ocr', "單據處理完成", job_id=job.id, kind=kind, user_id=payload.get('user_id'),
+                      ocr_text=text, message_text=message)
+            results.append(build_document_result(kind, message, payload.get('user_id'),
+                                                 receipt_source_key(payload, index)))
+    return results
+
+
+def claim_image_burst(job):
+    # 一併領取同一位使用者在時間窗內傳來、還在等待的其他圖片
+    group_key = job.payload.get('group_key')
+    if not group_key:
+        return [job]
+    return [job] + job_queue.claim_group(job.kind, group_key, f"{os.getpid()}-burst-{job.id}",
+                                         IMAGE_COALESCE_MAX_IMAGES - 1)
+
+
+def finish_image_burst(jobs, errors):
+    """
+    errors 為每筆工作的例外（成功為 None）。第一筆工作由 consumer pool 完成或重試，合併領取的其他工作在這裡處理：
+    成功的完成並刪除圖片，失敗的各自退回佇列，回傳重試次數已用盡的 (工作, 例外)
+    """
+    given_up = []
+    for job, error in zip(jobs[1:], errors[1:]):
+        if error is None:
+            job_queue.complete(job)
+        elif isinstance(error, JobDeferred):
+            job_queue.defer(job, str(error), error.delay)
+        elif not job_queue.fail(job, str(error)):
+            given_up.append((job, error))
+    for job, error in zip(jobs, errors):
+        if error is None and os.path.exists(job.payload['image_path']):
+            os.remove(job.payload['image_path'])
+    return given_up
+
+
+def latest_payload(jobs):
+    # 以最後收到的圖片回覆，它的 reply token 最可能還有效
+    return max((job.payload for job in jobs), key=lambda payload: payload.get('received_at') or 0)
+
+
+def receipt_source_key(payload, index):
+    # 帳本以 LINE 訊息與照片中的單據序號識別收據，工作重試時不會重複記帳
+    return f"line:{payload['message_id']}:{index}"
+
+
+def einvoice_source_key(record):
+    # 同一張電子發票不論從哪張照片解出都只記一次
+    return f"einvoice:{record.number}:{record.date}"
+
+
+def build_document_result(kind, message, user_id, source_key=None):
+    # Reply Message，收據分析成功時記到帳本
     if kind == 'receipt' and type(message) is dict:
         amount = message["amount"]
         category = message["category"]
-        reply_text = f"\u2764 看起來是一張收據喔 \u2764\n支出已追蹤：{amount}\n消費類別：{category}"
-    elif kind == 'invoice':
+        if ledger.record_expense(user_id, amount, category, source='receipt', source_key=source_key):
+            reply_text = f"\u2764 看起來是一張收據喔 \u2764\n支出已追蹤：{amount}\n消費類別：{category}"
+            return DocumentResult('receipt', reply_text, amount=parse_amount(amount), category=category)
+        reply_text = f"\u2764 看起來是一張收據喔 \u2764\n金額：{amount}\n消費類別：{category}\n但沒辦法記到帳本QQ"
+        return DocumentResult('unknown', reply_text)
+    if kind == 'invoice':
         reply_text = f"\u2764 看起來是一張發票喔 \u2764\n試圖幫你兌獎：{message}"
-    elif kind == 'receipt' and type(message) is str:
-        reply_text = "\u2764 看起來是一張收據喔 \u2764\n但分析時出了些問題QQ"
-    else:
-        reply_text = "\u2764 你餵我吃了什麼？ \u2764\n我只吃發票或收據喔!"
-    line_bot_api.reply_message(
-        event.reply_token,
-        TextSendMessage(text=reply_text)
+        return DocumentResult('invoice', reply_text, detail=message)
+    if kind == 'receipt' and type(message) is str:
+        return DocumentResult('unknown', "\u2764 看起來是一張收據喔 \u2764\n但分析時出了些問題QQ")
+    return DocumentResult('unknown', "\u2764 你餵我吃了什麼？ \u2764\n我只吃發票或收據喔!")
+
+
+def process_einvoice_record(record, user_id, target_id):
+    # QR Code 已含號碼、日期與金額，直接兌獎並記帳
+    result = process_invoice(record.number, record.period_info, user_id, target_id)
+    reply_text = f"\u2764 看起來是一張電子發票喔 \u2764\n試圖幫你兌獎：{result}"
+    if ledger.record_expense(user_id, record.total, EINVOICE_CATEGORY, when=record.date, source='einvoice_qr',
+                             source_key=einvoice_source_key(record)):
+        reply_text += f"\n支出已追蹤：{record.total}"
+        return DocumentResult('einvoice', reply_text, amount=parse_amount(record.total),
+                              category=EINVOICE_CATEGORY, detail=result)
+    return DocumentResult('einvoice', reply_text, detail=result)
+
+
+def deliver_job_reply(payload, messages):
+    # reply token 還有效就 reply，處理太久則改用 push
+    deliver_messages(
+        line_bot_api,
+        messages,
+        reply_token=payload.get('reply_token'),
+        received_at=payload.get('received_at'),
+        target_id=payload.get('target_id'),
+        ttl=JOB_QUEUE_CONFIG['reply_token_ttl'],
     )
-    os.remove(temp_file_path)
 
 
-def process_receipt_or_invoice(text):
+JOB_FAILED_TEXT = "\u2764 處理圖片時出了些問題QQ \u2764\n請稍後再傳一次"
+
+
+def notify_job_failed(job, error):
+    deliver_job_reply(job.payload, TextSendMessage(text=JOB_FAILED_TEXT))
+    image_path = job.payload.get('image_path')
+    if image_path and os.path.exists(image_path):
+        os.remove(image_path)
+
+
+def process_receipt_or_invoice(text, user_id=None, target_id=None):
     if is_uniform_invoice(text):
         # 發票，處理發票邏輯
-        result = process_uniform_invoice(text)
+        result = process_uniform_invoice(text, user_id, target_id)
         return 'invoice', result
     else:
         # 收據，處理收據邏輯
@@ -258,12 +686,279 @@ def process_receipt_or_invoice(text):
         return 'receipt', amount
 
 
+@app.route("/weather-images/<path:filename>")
+def weather_image(filename):
+    """
+    本地快取的天氣圖片
+    ---
+    get:
+      summary: 天氣圖片與預覽圖
+      parameters:
+        - in: path
+          name: filename
+          required: true
+          type: string
+      responses:
+        200:
+          description: 圖片
+        404:
+          description: 圖片不存在或已被清除
+    """
+    return send_immutable_file(WEATHER_IMAGE_DIR, filename)
+
+
+@app.route("/radar-frames/<path:filename>")
+def radar_frame(filename):
+    """
+    最近的雷達回波影格與動畫
+    ---
+    get:
+      summary: 雷達回波影格 (frame-*.png) 與動畫 (loop-*.png, APNG)
+      parameters:
+        - in: path
+          name: filename
+          required: true
+          type: string
+      responses:
+        200:
+          description: 圖片
+        404:
+          description: 影格不存在或已被淘汰
+    """
+    return send_immutable_file(RADAR_FRAME_DIR, filename)
+
+
+def send_immutable_file(directory, filename):
+    # 檔名含時間戳記，內容不會再變動，可以長期快取
+    response = send_from_directory(directory, filename, max_age=WEATHER_IMAGE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def require_admin():
+    # 管理端點需帶 Authorization: Bearer <ADMIN_TOKEN>，未設定 ADMIN_TOKEN 時視為不存在
+    if not ADMIN_TOKEN:
+        abort(404)
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not hmac.compare_digest(token, ADMIN_TOKEN):
+        abort(403)
+
+
+@app.route("/admin/profile", methods=['GET', 'POST'])
+def admin_profile():
+    """
+    取樣式 profiler（僅限管理者）
+    ---
+    get:
+      summary: 目前的取樣狀態與已完成的結果
+    post:
+      summary: 開始取樣
+      parameters:
+        - in: query
+          name: seconds
+          type: number
+          description: 取樣秒數（預設 30，上限 600）
+        - in: query
+          name: fraction
+          type: number
+          description: 只取樣這個比例的 /callback 請求（0~1），省略時取樣整個 process
+      responses:
+        202:
+          description: 已開始取樣
+        409:
+          description: 已在取樣中
+    """
+    require_admin()
+    if request.method == 'GET':
+        return jsonify(profiler.status())
+    try:
+        seconds = min(float(request.args.get('seconds', 30)), 600)
+        fraction = float(request.args['fraction']) if 'fraction' in request.args else None
+    except ValueError:
+        abort(400)
+    if fraction is not None and not 0 < fraction <= 1:
+        abort(400)
+    try:
+        profile_id = profiler.start(seconds, fraction)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify({'id': profile_id, 'seconds': seconds, 'fraction': fraction}), 202
+
+
+@app.route("/admin/profile/<path:filename>")
+def admin_profile_file(filename):
+    """
+    下載取樣結果（僅限管理者）
+    ---
+    get:
+      summary: "{id}.collapsed 為 collapsed stack（flamegraph.pl / speedscope），{id}.json 為各函式的取樣數"
+      parameters:
+        - in: path
+          name: filename
+          required: true
+          type: string
+      responses:
+        200:
+          description: 取樣結果
+    """
+    require_admin()
+    return send_from_directory(PROFILE_DIR, filename, as_attachment=True)
+
+
 @app.route("/healthz")
 def healthz():
     """Health check endpoint for Kubernetes probe."""
     return "ok", 200
 
 
+def readiness_report(lane_stats=None):
+    # ASGI 模式有自己的通道，由 app.asgi 傳入
+    if lane_stats is None:
+        lane_stats = {name: lane.stats() for name, lane in lanes.items()}
+    warm = dict(warm_up_state, winning_numbers=bool(winning_numbers_store.periods()))
+    try:
+        queue_counts = job_queue.counts()
+    except Exception as e:
+        logging.error(f"讀取工作佇列失敗：{e}")
+        queue_counts = None
+    return build_readiness(queue_counts, IMAGE_MAX_BACKLOG, lane_stats, warm)
+
+
+@app.route("/readyz")
+def readyz():
+    """
+    Readiness probe
+    ---
+    get:
+      summary: 工作佇列積壓、各通道負載、外部服務斷路器與預熱狀態
+      responses:
+        200:
+          description: 可以接收流量（佇列積壓或通道已滿只列在 busy 中）
+        503:
+          description: 尚未預熱完成或工作佇列無法讀取
+    """
+    report = readiness_report()
+    return jsonify(report), 200 if report['ready'] else 503
+
+
+@app.route("/metrics")
+def metrics():
+    """
+    Prometheus metrics（佇列積壓、通道負載、斷路器、快取與記憶體）
+    ---
+    get:
+      summary: Prometheus text format
+      responses:
+        200:
+          description: metrics
+    """
+    return render_metrics(readiness_report()), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+def run_image_job(job):
+    if job.payload.get('profile'):
+        return profiler.track(process_image_job)(job)
+    return process_image_job(job)
+
+
+def create_job_consumer_pool(consumers):
+    return JobConsumerPool(
+        job_queue,
+        {'image': run_image_job},
+        consumers=consumers,
+        on_give_up=notify_job_failed,
+    )
+
+
+def notify_invoice_winners(winners, period_info):
+    # 同一個對象的中獎發票合併成一則 push
+    grouped = {}
+    for winner in winners:
+        grouped.setdefault(winner['target_id'] or winner['user_id'], []).append(winner)
+    for target_id, items in grouped.items():
+        lines = [f"{item['invoice_number']}：{item['prize']}" for item in items]
+        reply_text = (f"\u2764 {period_info['year']}年第{period_info['period']}期發票開獎囉 \u2764\n"
+                      "恭喜中獎！\n" + "\n".join(lines))
+        try:
+            line_bot_api.push_message(target_id, TextSendMessage(text=reply_text))
+        except Exception as e:
+            logging.error(f"通知中獎發票失敗 {target_id}: {e}")
+
+
+def sync_winning_numbers_and_recheck():
+    # 先同步中獎號碼，再對已開獎期別的存檔發票批次兌獎
+    sync_winning_numbers(winning_numbers_store, fetch_winning_numbers_page, ETAX_WINNING_NUMBER_URLS)
+    recheck_pending_invoices(invoice_archive, get_winning_numbers_for_period, notify_invoice_winners, is_drawn)
+
+
+winning_numbers_sync_task = PeriodicTask(
+    'winning-numbers-sync',
+    WINNING_NUMBERS_CONFIG['sync_interval'],
+    sync_winning_numbers_and_recheck,
+)
+
+
+def collect_radar_frames():
+    collect_radar_frame(radar_frame_store, weather_image_cache, asyncio.run(get_radar_image_url()))
+
+
+radar_frames_task = PeriodicTask(
+    'radar-frames',
+    RADAR_FRAMES_CONFIG['collect_interval'],
+    collect_radar_frames,
+)
+
+
+def start_background_workers(consumers):
+    # 工作 consumer、中獎號碼同步、發票批次兌獎與雷達影格收集都在有 consumer 的 process 中執行
+    if consumers <= 0:
+        return None
+    pool = create_job_consumer_pool(consumers)
+    pool.start()
+    winning_numbers_sync_task.start()
+    radar_frames_task.start()
+    return pool
+
+
+# 重量級套件改為第一次使用時才載入；preload 模式下由 gunicorn master 先載入再 fork
+HEAVY_MODULES = [
+    'google.cloud.vision',
+    'google.oauth2.service_account',
+    'google.api_core.exceptions',
+    'openai',
+    'google.generativeai',
+    'cv2',
+    'aiohttp',
+]
+
+
+# readiness 在重量級套件載入完成前回報尚未就緒，第一個請求不必等待匯入
+warm_up_state = {'modules': False}
+
+
+def warm_up():
+    # 在 fork 前載入，讓各 worker 共用這些唯讀的記憶體分頁
+    import importlib
+    for module in HEAVY_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            logging.warning(f"預先載入 {module} 失敗：{e}")
+    warm_up_state['modules'] = True
+
+
+# 每個 web process 內建的 consumer 數量，可用環境變數 JOB_CONSUMERS 覆寫（設為 0 則交給 app.worker）
+JOB_CONSUMERS = int(os.environ.get('JOB_CONSUMERS', JOB_QUEUE_CONFIG['consumers']))
+# 背景 thread 不會跟著 fork 複製，preload 模式下改由 gunicorn post_fork 啟動
+if os.environ.get('DEFER_BACKGROUND_WORKERS') == '1':
+    job_consumer_pool = None
+else:
+    job_consumer_pool = start_background_workers(JOB_CONSUMERS)
+    # 沒有 preload 時在背景預熱，預熱完成前 /readyz 回報尚未就緒
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+
+
 if __name__ == "__main__":
     # Detect if it is in Heroku
     if 'PORT' in os.environ:
@@ -272,4 +967,5 @@ if __name__ == "__main__":
     else:
         port = PORT
         host = HOST
+    profiler.install_signal_handler(seconds=PROFILER_CONFIG['signal_seconds'])
     app.run(host=host, port=port)
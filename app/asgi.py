@@ -0,0 +1,362 @@
+import os
+import asyncio
+import logging
+import contextlib
+
+# 工作 consumer 與中獎號碼同步改在 event loop 中執行，不啟動 app.app 內建的 consumer thread
+os.environ.setdefault('DEFER_BACKGROUND_WORKERS', '1')
+
+from a2wsgi import WSGIMiddleware  # noqa: E402
+from starlette.applications import Starlette  # noqa: E402
+from starlette.responses import PlainTextResponse, JSONResponse  # noqa: E402
+from starlette.routing import Route, Mount  # noqa: E402
+from linebot import AsyncLineBotApi  # noqa: E402
+from linebot.exceptions import InvalidSignatureError  # noqa: E402
+from linebot.models import TextSendMessage  # noqa: E402
+
+from app.app import (  # noqa: E402
+    app as flask_app,
+    CHANNEL_ACCESS_TOKEN,
+    JOB_QUEUE_CONFIG,
+    WINNING_NUMBERS_CONFIG,
+    RADAR_FRAMES_CONFIG,
+    JOB_FAILED_TEXT,
+    LANES_CONFIG,
+    BUSY_TEXT,
+    THROTTLED_TEXT,
+    parser,
+    event_lane,
+    is_image_backlog_full,
+    is_rate_limited,
+    job_queue,
+    invoice_archive,
+    winning_numbers_store,
+    build_ledger_reply,
+    build_weather_reply,
+    is_weather_command,
+    build_radar_history_reply,
+    build_document_result,
+    receipt_source_key,
+    process_einvoice_record,
+    image_spool_path,
+    build_image_job_payload,
+    claim_image_burst,
+    finish_image_burst,
+    latest_payload,
+    IMAGE_COALESCE_WINDOW,
+    IMAGE_BUDGET_WAIT,
+    IMAGE_BUDGET_RETRY_DELAY,
+    IMAGE_MAX_DOWNLOAD_BYTES,
+    IMAGE_TOO_LARGE_TEXT,
+    image_budget,
+    is_download_too_large,
+    notify_invoice_winners,
+    readiness_report,
+    warm_up,
+    radar_frame_store,
+    weather_image_cache,
+)
+from utils.ocr_cloudvision import extract_documents_from_image_async, parse_total_amount_async  # noqa: E402
+from utils.einvoice_qr import decode_einvoices  # noqa: E402
+from utils.invoice_processing import (  # noqa: E402
+    is_uniform_invoice,
+    process_uniform_invoice,
+    get_winning_numbers_for_period,
+    fetch_winning_numbers_page_async,
+    is_drawn,
+    ETAX_WINNING_NUMBER_URLS,
+)
+from utils.invoice_archive import recheck_pending_invoices  # noqa: E402
+from utils.structured_logging import log_event  # noqa: E402
+from utils.winning_numbers_store import sync_winning_numbers_async  # noqa: E402
+from utils.etax import get_async_etax_fetcher  # noqa: E402
+from utils.cwa import get_radar_image_url  # noqa: E402
+from utils.radar_frames import collect_radar_frame  # noqa: E402
+from utils.periodic import run_periodically  # noqa: E402
+from utils.job_queue import AsyncJobConsumerPool, JobDeferred  # noqa: E402
+from utils.line_delivery import deliver_messages_async  # noqa: E402
+from utils.lanes import AsyncLane  # noqa: E402
+from utils.readiness import render_metrics  # noqa: E402
+from utils.reply_summary import DocumentResult, build_image_reply  # noqa: E402
+from utils.memory_budget import (  # noqa: E402
+    MemoryBudgetExceeded, ImageTooLargeError, estimate_image_bytes, track_stage,
+)
+
+# 單一 process 同時處理的工作上限，可用環境變數 ASYNC_JOB_CONCURRENCY 覆寫（設為 0 則交給 app.worker）
+ASYNC_JOB_CONCURRENCY = int(os.environ.get('ASYNC_JOB_CONCURRENCY', JOB_QUEUE_CONFIG['async_concurrency']))
+
+# AsyncLineBotApi 使用的 aiohttp session 綁定 event loop，於 lifespan 中建立
+async_line_bot_api = None
+
+# 文字指令與圖片各自有並行上限與 thread pool，圖片的 CPU / SQLite 工作不會卡住文字指令
+lanes = {
+    name: AsyncLane(name, LANES_CONFIG[name]['async_concurrency'], LANES_CONFIG[name]['max_pending'],
+                    threads=LANES_CONFIG[name]['concurrency'])
+    for name in ('text', 'image')
+}
+
+# 忙碌回覆不經過已滿的通道，保留參照避免 task 被回收
+_busy_replies = set()
+
+
+async def callback(request):
+    """
+    LINE Bot Webhook Callback（非同步版本）
+    驗證簽章後立即回應，事件在背景 task 中處理
+    """
+    signature = request.headers.get('X-Line-Signature', '')
+    body = (await request.body()).decode('utf-8')
+    try:
+        events = parser.parse(body, signature)
+    except InvalidSignatureError:
+        return PlainTextResponse('Invalid signature', status_code=400)
+    log_event('webhook', "LINE webhook", events=len(events), bytes=len(body))
+
+    for event in events:
+        lane = event_lane(event)
+        if lane is None:
+            continue
+        handle = handle_text if lane == 'text' else handle_image
+        if not lanes[lane].spawn(handle, event):
+            logging.warning(f"通道 {lane} 已滿，略過事件")
+            task = asyncio.create_task(reply_busy(event, lane))
+            _busy_replies.add(task)
+            task.add_done_callback(_busy_replies.discard)
+    return PlainTextResponse('OK')
+
+
+async def healthz(request):
+    """Health check endpoint for Kubernetes probe."""
+    return PlainTextResponse('ok')
+
+
+async def asgi_readiness_report():
+    report = await asyncio.to_thread(readiness_report, {name: lane.stats() for name, lane in lanes.items()})
+    report['queue']['in_flight'] = job_consumer_pool.in_flight
+    return report
+
+
+async def readyz(request):
+    report = await asgi_readiness_report()
+    return JSONResponse(report, status_code=200 if report['ready'] else 503)
+
+
+async def metrics(request):
+    report = await asgi_readiness_report()
+    return PlainTextResponse(render_metrics(report), media_type='text/plain; version=0.0.4')
+
+
+async def reply_busy(event, lane):
+    try:
+        await async_line_bot_api.reply_message(event.reply_token, TextSendMessage(text=BUSY_TEXT[lane]))
+    except Exception as e:
+        logging.error(f"回覆忙碌訊息失敗: {e}")
+
+
+async def reply_throttled(event, kind):
+    try:
+        await async_line_bot_api.reply_message(event.reply_token, TextSendMessage(text=THROTTLED_TEXT[kind]))
+    except Exception as e:
+        logging.error(f"回覆頻率限制訊息失敗: {e}")
+
+
+async def reply_image_too_large(event):
+    try:
+        await async_line_bot_api.reply_message(event.reply_token, TextSendMessage(text=IMAGE_TOO_LARGE_TEXT))
+    except Exception as e:
+        logging.error(f"回覆圖片過大訊息失敗: {e}")
+
+
+async def handle_text(event):
+    user_text = event.message.text.strip()
+    reply_text = await lanes['text'].run_blocking(build_ledger_reply, event.source.user_id, user_text)
+    if reply_text:
+        await async_line_bot_api.reply_message(event.reply_token, TextSendMessage(text=reply_text))
+        return
+    if is_weather_command(user_text):
+        if await lanes['text'].run_blocking(is_rate_limited, event, 'weather'):
+            await reply_throttled(event, 'weather')
+            return
+        await async_line_bot_api.reply_message(event.reply_token, await build_weather_reply(user_text))
+        return
+    radar_message = await lanes['text'].run_blocking(build_radar_history_reply, user_text)
+    if radar_message:
+        await async_line_bot_api.reply_message(event.reply_token, radar_message)
+
+
+async def handle_image(event):
+    if await lanes['image'].run_blocking(is_rate_limited, event, 'image'):
+        await reply_throttled(event, 'image')
+        return
+
+    # 佇列已經積壓太多時不再下載圖片
+    if await lanes['image'].run_blocking(is_image_backlog_full):
+        await reply_busy(event, 'image')
+        return
+
+    # 下載圖片後落地並寫入工作佇列，與同步模式共用同一個佇列
+    message_content = await async_line_bot_api.get_message_content(event.message.id)
+    image_path = image_spool_path(event.message.id)
+    if is_download_too_large(message_content):
+        await reply_image_too_large(event)
+        return
+
+    with track_stage('download'):
+        size = 0
+        with open(image_path, 'wb') as fd:
+            async for chunk in message_content.iter_content():
+                size += len(chunk)
+                if size > IMAGE_MAX_DOWNLOAD_BYTES:
+                    break
+                fd.write(chunk)
+    if size > IMAGE_MAX_DOWNLOAD_BYTES:
+        os.remove(image_path)
+        await reply_image_too_large(event)
+        return
+
+    await lanes['image'].run_blocking(
+        job_queue.enqueue, 'image', build_image_job_payload(event, image_path), IMAGE_COALESCE_WINDOW)
+    job_consumer_pool.wake()
+
+
+async def process_image_job(job):
+    jobs = await asyncio.to_thread(claim_image_burst, job)
+    # 合併的圖片同時分析，有設定 VISION_BATCH_WINDOW_MS 時 OCR 會合併成一次 batch 呼叫
+    outcomes = await asyncio.gather(*[try_analyze_image_job(item) for item in jobs])
+    errors = [error for _, error in outcomes]
+    succeeded = [(item, results) for item, (results, error) in zip(jobs, outcomes) if error is None]
+    reply_text = build_image_reply([results for _, results in succeeded if results is not None])
+    if reply_text:
+        try:
+            await deliver_job_reply(latest_payload([item for item, _ in succeeded]), TextSendMessage(text=reply_text))
+        except Exception as e:
+            errors = [error or e for error in errors]
+    for given_up, error in await asyncio.to_thread(finish_image_burst, jobs, errors):
+        await notify_job_failed(given_up, error)
+    if errors[0] is not None:
+        raise errors[0]
+
+
+async def try_analyze_image_job(job):
+    try:
+        return await analyze_image_job(job), None
+    except Exception as e:
+        logging.error(f"分析工作 {job.id} 的圖片失敗：{e}")
+        return None, e
+
+
+async def analyze_image_job(job):
+    payload = job.payload
+    image_path = payload['image_path']
+    if not os.path.exists(image_path):
+        logging.warning(f"工作 {job.id} 的圖片已不存在：{image_path}")
+        return None
+    user_id = payload.get('user_id')
+    target_id = payload.get('target_id')
+
+    # QR Code 解碼、兌獎與記帳都是本地 CPU / SQLite 工作，放到圖片通道的 thread pool 執行
+    run_blocking = lanes['image'].run_blocking
+    # 圖片解碼與 OCR 期間持有記憶體預算，之後的 AI 分析只需要文字
+    size = await run_blocking(estimate_image_bytes, image_path)
+    try:
+        async with image_budget.reserve_async(size, IMAGE_BUDGET_WAIT):
+            with track_stage('qr_decode'):
+                records = await run_blocking(decode_einvoices, image_path)
+            if not records:
+                with track_stage('ocr'):
+                    documents = await extract_documents_from_image_async(image_path) or ['']
+    except MemoryBudgetExceeded as e:
+        raise JobDeferred(str(e), IMAGE_BUDGET_RETRY_DELAY) from e
+    except ImageTooLargeError as e:
+        logging.warning(f"工作 {job.id} 的圖片過大：{e}")
+        return [DocumentResult('unknown', IMAGE_TOO_LARGE_TEXT)]
+    if records:
+        return [await run_blocking(process_einvoice_record, record, user_id, target_id) for record in records]
+    results = []
+    with track_stage('analyze'):
+        for index, text in enumerate(documents):
+            if is_uniform_invoice(text):
+                result = await run_blocking(process_uniform_invoice, text, user_id, target_id)
+                kind, message = 'invoice', result
+            else:
+                kind, message = 'receipt', await parse_total_amount_async(text)
+            log_event('ocr', "單據處理完成", job_id=job.id, kind=kind, user_id=user_id,
+                      ocr_text=text, message_text=message)
+            results.append(await run_blocking(build_document_result, kind, message, user_id,
+                                              receipt_source_key(payload, index)))
+    return results
+
+
+async def deliver_job_reply(payload, messages):
+    await deliver_messages_async(
+        async_line_bot_api,
+        messages,
+        reply_token=payload.get('reply_token'),
+        received_at=payload.get('received_at'),
+        target_id=payload.get('target_id'),
+        ttl=JOB_QUEUE_CONFIG['reply_token_ttl'],
+    )
+
+
+async def notify_job_failed(job, error):
+    await deliver_job_reply(job.payload, TextSendMessage(text=JOB_FAILED_TEXT))
+    image_path = job.payload.get('image_path')
+    if image_path and os.path.exists(image_path):
+        os.remove(image_path)
+
+
+async def sync_winning_numbers_and_recheck():
+    await sync_winning_numbers_async(winning_numbers_store, fetch_winning_numbers_page_async, ETAX_WINNING_NUMBER_URLS)
+    await asyncio.to_thread(
+        recheck_pending_invoices, invoice_archive, get_winning_numbers_for_period, notify_invoice_winners, is_drawn)
+
+
+async def collect_radar_frames():
+    radar_url = await get_radar_image_url()
+    await asyncio.to_thread(collect_radar_frame, radar_frame_store, weather_image_cache, radar_url)
+
+
+job_consumer_pool = AsyncJobConsumerPool(
+    job_queue,
+    {'image': process_image_job},
+    concurrency=max(ASYNC_JOB_CONCURRENCY, 1),
+    on_give_up=notify_job_failed,
+)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    global async_line_bot_api
+    import aiohttp
+    from linebot.aiohttp_async_http_client import AiohttpAsyncHttpClient
+
+    session = aiohttp.ClientSession()
+    async_line_bot_api = AsyncLineBotApi(CHANNEL_ACCESS_TOKEN, AiohttpAsyncHttpClient(session))
+    background_tasks = [asyncio.create_task(asyncio.to_thread(warm_up))]
+    if ASYNC_JOB_CONCURRENCY > 0:
+        job_consumer_pool.start()
+        background_tasks.append(asyncio.create_task(run_periodically(
+            'winning-numbers-sync', WINNING_NUMBERS_CONFIG['sync_interval'], sync_winning_numbers_and_recheck)))
+        background_tasks.append(asyncio.create_task(run_periodically(
+            'radar-frames', RADAR_FRAMES_CONFIG['collect_interval'], collect_radar_frames)))
+    try:
+        yield
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        await job_consumer_pool.stop(timeout=30)
+        await get_async_etax_fetcher().close()
+        await session.close()
+
+
+app = Starlette(
+    routes=[
+        Route('/callback', callback, methods=['POST']),
+        Route('/healthz', healthz),
+        Route('/readyz', readyz),
+        Route('/metrics', metrics),
+        # API 文件 (/apidocs/) 與其他路由沿用 Flask app
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ],
+    lifespan=lifespan,
+)
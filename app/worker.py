@@ -0,0 +1,31 @@
+import os
+import signal
+import argparse
+import logging
+import threading
+
+# 獨立的 consumer process 不需要 web process 內建的 consumer
+os.environ['JOB_CONSUMERS'] = '0'
+
+from app.app import start_background_workers  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="從工作佇列取出圖片工作並處理，並定期同步中獎號碼、對存檔發票批次兌獎")
+    parser.add_argument('--consumers', type=int, default=4, help="consumer thread 數量")
+    args = parser.parse_args()
+
+    pool = start_background_workers(args.consumers)
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    signal.signal(signal.SIGINT, lambda *_: stopped.set())
+    stopped.wait()
+
+    logging.info("停止工作 consumer")
+    if pool is not None:
+        pool.stop(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+比較中獎號碼頁面的抓取與解析效能：
+原本的 requests.get + BeautifulSoup 全樹解析 vs. EtaxFetcher（連線池、條件式請求）+ lxml XPath 解析
+使用 tests/fixtures 內保存的頁面，並以本地 HTTP server 模擬財政部網站
+
+python -m benchmarks.bench_etax
+"""
+import os
+import re
+import time
+import threading
+import functools
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import requests
+from bs4 import BeautifulSoup
+
+from utils.etax import EtaxFetcher, parse_winning_numbers_html
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'fixtures')
+FIXTURES = ['etax_index.html', 'etax_last_number.html']
+
+
+def parse_with_beautifulsoup(html):
+    # 原本 get_winning_numbers 的解析方式，作為比較基準
+    soup = BeautifulSoup(html, 'lxml')
+    title = soup.find('a', href="lastNumber.html").get_text(strip=True)
+    period_match = re.search(r'(\d+)年(\d+)-(\d+)月', title)
+    period_info = {'year': int(period_match.group(1)) + 1911, 'period': (int(period_match.group(2)) + 1) // 2}
+    winning_numbers = {'special_prize': [], 'grand_prize': [], 'first_prize': [], 'additional_sixth_prize': []}
+    special_prize = soup.find_all('span', {'class': 'font-weight-bold etw-color-red'})
+    if special_prize:
+        winning_numbers['special_prize'].append(special_prize[0].get_text(strip=True))
+        winning_numbers['grand_prize'].append(special_prize[1].get_text(strip=True))
+    first_prize = soup.find_all('span', {'class': 'font-weight-bold'})
+    if first_prize:
+        for i in range(2, 8, 2):
+            first_prize_numbers = first_prize[i].get_text(strip=True) + first_prize[i + 1].get_text(strip=True)
+            winning_numbers['first_prize'].append(first_prize_numbers)
+            winning_numbers['additional_sixth_prize'].append(first_prize[i + 1].get_text(strip=True))
+    return period_info, winning_numbers
+
+
+def fetch_with_requests(url):
+    response = requests.get(url)
+    response.encoding = 'utf-8'
+    return parse_with_beautifulsoup(response.text)
+
+
+def timeit(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def main(parse_iterations=300, fetch_iterations=100):
+    pages = {}
+    for name in FIXTURES:
+        with open(os.path.join(FIXTURE_DIR, name), 'rb') as f:
+            pages[name] = f.read()
+
+    print("== 解析 (ms/次) ==")
+    for name, content in pages.items():
+        # 原本的期別取自 lastNumber.html 分頁連結，不一定是本頁的期別，只比對中獎號碼
+        assert parse_with_beautifulsoup(content.decode('utf-8'))[1] == parse_winning_numbers_html(content)[1]
+        old = timeit(lambda: parse_with_beautifulsoup(content.decode('utf-8')), parse_iterations)
+        new = timeit(lambda: parse_winning_numbers_html(content), parse_iterations)
+        print(f"{name}: BeautifulSoup {old:.3f} / lxml XPath {new:.3f} (x{old / new:.1f})")
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(QuietHandler, directory=FIXTURE_DIR))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        print("== 抓取 + 解析 (ms/次) ==")
+        fetcher = EtaxFetcher()
+        for name in FIXTURES:
+            url = f"http://127.0.0.1:{server.server_address[1]}/{name}"
+            old = timeit(lambda: fetch_with_requests(url), fetch_iterations)
+            new = timeit(lambda: fetcher.fetch(url), fetch_iterations)
+            print(f"{name}: requests.get + BeautifulSoup {old:.3f} / EtaxFetcher {new:.3f} (x{old / new:.1f})")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+比較上傳 Vision 前有無前處理的差異：上傳大小、前處理時間，
+以及（有設定 GOOGLE_APPLICATION_CREDENTIALS_JSON 時）Vision 延遲與兩者 OCR 文字的相似度
+
+python -m benchmarks.bench_image_preprocess <收據照片資料夾>
+"""
+import os
+import io
+import sys
+import time
+import difflib
+
+from PIL import Image, ImageDraw
+
+from utils.image_preprocess import prepare_image_for_ocr
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def synthetic_receipt():
+    # 沒有提供照片時，產生一張手機解析度的假收據
+    image = Image.effect_noise((3024, 4032), 25).convert('RGB')
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((600, 300, 2400, 3700), fill=(245, 245, 240))
+    for i, line in enumerate(['STARBUCKS COFFEE', 'Latte Tall 120', 'Sandwich 95', 'TOTAL 215', 'AB-12345678']):
+        draw.text((700, 400 + i * 150), line, fill=(20, 20, 20))
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=95)
+    return output.getvalue()
+
+
+def load_fixtures(directory):
+    if not directory:
+        return [('synthetic.jpg', synthetic_receipt())]
+    fixtures = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(directory, name), 'rb') as f:
+                fixtures.append((name, f.read()))
+    return fixtures
+
+
+def vision_text(client, content):
+    from google.cloud import vision
+    start = time.perf_counter()
+    response = client.text_detection(image=vision.Image(content=content))
+    elapsed = (time.perf_counter() - start) * 1000
+    text = response.text_annotations[0].description if response.text_annotations else ''
+    return text, elapsed
+
+
+def main(directory=None):
+    client = None
+    if 'GOOGLE_APPLICATION_CREDENTIALS_JSON' in os.environ:
+        from utils.ocr_cloudvision import get_vision_client
+        client = get_vision_client()
+
+    total_before = total_after = 0
+    for name, content in load_fixtures(directory):
+        start = time.perf_counter()
+        prepared = prepare_image_for_ocr(content)
+        prepare_ms = (time.perf_counter() - start) * 1000
+        total_before += len(content)
+        total_after += len(prepared)
+        size = Image.open(io.BytesIO(prepared)).size
+        line = f"{name}: {len(content) / 1024:.0f}KB -> {len(prepared) / 1024:.0f}KB {size} 前處理 {prepare_ms:.0f}ms"
+        if client is not None:
+            original_text, original_ms = vision_text(client, content)
+            prepared_text, prepared_ms = vision_text(client, prepared)
+            similarity = difflib.SequenceMatcher(None, original_text, prepared_text).ratio()
+            line += f" | Vision {original_ms:.0f}ms -> {prepared_ms:.0f}ms 文字相似度 {similarity:.3f}"
+        print(line)
+    print(f"總上傳量：{total_before / 1024:.0f}KB -> {total_after / 1024:.0f}KB ({total_after / total_before:.0%})")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
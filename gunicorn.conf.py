@@ -0,0 +1,32 @@
+import os
+
+# gunicorn 預設會讀取工作目錄下的 gunicorn.conf.py，命令列參數（-w、-b）會覆寫這裡的設定
+bind = f"0.0.0.0:{os.environ.get('PORT', 5500)}"
+# 未設定 GUNICORN_WORKERS 時沿用 gunicorn 的預設（WEB_CONCURRENCY 或 1），Procfile 的 worker 數不會因這個檔案改變
+if 'GUNICORN_WORKERS' in os.environ:
+    workers = int(os.environ['GUNICORN_WORKERS'])
+
+# GUNICORN_PRELOAD=1：master 先載入 app 與重量級套件再 fork，worker 啟動更快並共用唯讀記憶體
+preload_app = os.environ.get('GUNICORN_PRELOAD', '0') == '1'
+
+if preload_app:
+    # 背景 thread 不會跟著 fork 複製，改在每個 worker fork 之後啟動
+    os.environ['DEFER_BACKGROUND_WORKERS'] = '1'
+
+
+def when_ready(server):
+    if preload_app:
+        from app.app import warm_up
+        warm_up()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from app.app import start_background_workers, JOB_CONSUMERS
+        start_background_workers(JOB_CONSUMERS)
+
+
+def post_worker_init(worker):
+    # gunicorn 初始化 worker 時會重設 signal，之後才能掛上 profiler 的 SIGUSR2（請送給 worker，master 的 USR2 是升級）
+    from app.app import profiler, PROFILER_CONFIG
+    profiler.install_signal_handler(seconds=PROFILER_CONFIG['signal_seconds'])
@@ -0,0 +1,107 @@
+from utils.cache import TieredCache, SQLiteCacheBackend, cache_stats
+
+import os
+import time
+import asyncio
+import tempfile
+import threading
+import unittest
+
+
+class TestTieredCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.backend = SQLiteCacheBackend(os.path.join(self.tmp_dir.name, 'cache.db'))
+
+    def tearDown(self):
+        self.backend.db.close()
+        self.tmp_dir.cleanup()
+
+    def test_lru_and_ttl(self):
+        cache = TieredCache('test_lru', max_entries=2, default_ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        # b 最久沒有被使用，先被淘汰
+        self.assertIsNone(cache.get('b'))
+        cache.set('d', {'x': 1}, ttl=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('d'))
+        stats = cache.stats()
+        self.assertEqual(stats['l1_hits'], 1)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['evictions'], 2)
+        self.assertIn('test_lru', cache_stats())
+
+    def test_second_tier_shared_between_workers(self):
+        worker_a = TieredCache('test_shared', backend=self.backend)
+        worker_b = TieredCache('test_shared', backend=self.backend)
+        worker_a.set('url', 'https://example.com/radar.png')
+        self.assertEqual(worker_b.get('url'), 'https://example.com/radar.png')
+        self.assertEqual(worker_b.stats()['l2_hits'], 1)
+        # 第二次由第一層命中
+        worker_b.get('url')
+        self.assertEqual(worker_b.stats()['l1_hits'], 1)
+
+    def test_size_eviction(self):
+        self.backend.max_bytes = 300
+        cache = TieredCache('test_size', backend=self.backend)
+        for i in range(10):
+            cache.set(f"key{i}", 'x' * 50)
+        self.assertGreater(self.backend.evict(), 0)
+        self.assertIsNone(self.backend.get('test_size:key0'))
+        self.assertIsNotNone(self.backend.get('test_size:key9'))
+
+    def test_stampede_protection(self):
+        cache = TieredCache('test_stampede', backend=self.backend)
+        calls = []
+
+        def loader():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_load('key', loader)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['value'] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertGreater(cache.stats()['waits'], 0)
+
+    def test_release_only_own_lock(self):
+        worker_a = TieredCache('test_lock_owner', backend=self.backend, lock_ttl=0.05)
+        worker_b = TieredCache('test_lock_owner', backend=self.backend, lock_ttl=30)
+        token_a = worker_a._acquire('key')
+        time.sleep(0.06)
+        # A 的鎖已過期並被 B 取得，A 較晚釋放時不能刪掉 B 的鎖
+        token_b = worker_b._acquire('key')
+        self.assertIsNotNone(token_b)
+        worker_a._release('key', token_a)
+        self.assertIsNone(worker_a._acquire('key'))
+        worker_b._release('key', token_b)
+        self.assertIsNotNone(worker_a._acquire('key'))
+
+    def test_get_or_load_async(self):
+        cache = TieredCache('test_async')
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return 'value'
+
+        async def run():
+            return await asyncio.gather(*[cache.get_or_load_async('key', loader) for _ in range(5)])
+
+        self.assertEqual(asyncio.run(run()), ['value'] * 5)
+        self.assertEqual(len(calls), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
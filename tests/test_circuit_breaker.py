@@ -0,0 +1,85 @@
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError, get_circuit_breaker, circuit_states
+
+import time
+import asyncio
+import unittest
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_opens_after_failures_and_recovers(self):
+        breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=0.05)
+
+        def fail():
+            raise TimeoutError('timeout')
+
+        for _ in range(2):
+            with self.assertRaises(TimeoutError):
+                breaker.call(fail)
+        self.assertEqual(breaker.state, 'open')
+        # 開啟期間直接拒絕，不呼叫外部服務
+        with self.assertRaises(CircuitOpenError):
+            breaker.call(lambda: 'ok')
+
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, 'half_open')
+        self.assertTrue(breaker.allow())
+        # 試探進行中時不放行其他呼叫
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.call(lambda: 'ok'), 'ok')
+        self.assertEqual(breaker.snapshot(), {'state': 'closed', 'failures': 0})
+
+    def test_failed_trial_reopens(self):
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        self.assertFalse(breaker.allow())
+
+    def test_cancelled_trial_releases_half_open(self):
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+
+        async def slow_probe():
+            await asyncio.sleep(5)
+            return 'ok'
+
+        async def run():
+            task = asyncio.ensure_future(breaker.call_async(slow_probe))
+            await asyncio.sleep(0.01)
+            # 整體期限已到，試探被取消
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(run())
+        # 取消視為失敗：重新開啟並計時，之後可以再試探，不會永遠卡在半開
+        self.assertEqual(breaker.state, 'open')
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_stale_trial_times_out(self):
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        # 試探放行後一直沒有回報
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+
+    def test_registry(self):
+        breaker = get_circuit_breaker('test_registry')
+        self.assertIs(get_circuit_breaker('test_registry'), breaker)
+        self.assertEqual(circuit_states()['test_registry']['state'], 'closed')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+from utils import cwa
+from utils.cwa import gather_with_deadline
+from utils.circuit_breaker import CircuitBreaker
+
+import time
+import asyncio
+import unittest
+from unittest import mock
+
+
+class TestGatherWithDeadline(unittest.TestCase):
+
+    def test_partial_results_within_one_deadline(self):
+        cancelled = []
+
+        async def product(value, delay):
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                cancelled.append(value)
+                raise
+            return value
+
+        async def broken():
+            raise RuntimeError('CWA 502')
+
+        started = time.perf_counter()
+        results = asyncio.run(gather_with_deadline({
+            'radar': product('radar.png', 0.05),
+            'rainfall': product('rainfall.png', 0.05),
+            'temperature': product('temperature.jpg', 5),
+            'qpf': broken(),
+        }, timeout=0.2))
+
+        # 同時執行：總耗時只到期限，不是各查詢加總
+        self.assertLess(time.perf_counter() - started, 1)
+        self.assertEqual(results, {'radar': 'radar.png', 'rainfall': 'rainfall.png', 'temperature': None, 'qpf': None})
+        self.assertEqual(cancelled, ['temperature.jpg'])
+
+    def test_cancelled_probe_releases_circuit(self):
+        breaker = CircuitBreaker('cwa_test', failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+
+        async def stalled(dataset_id, product_url_path):
+            await asyncio.sleep(5)
+
+        with mock.patch.object(cwa, '_cwa_circuit', breaker), \
+                mock.patch.object(cwa, '_fetch_cwa_product_url', stalled):
+            results = asyncio.run(gather_with_deadline({
+                'radar': cwa._fetch_with_circuit('O-A0058-001', ['ProductURL']),
+            }, timeout=0.05))
+
+        self.assertEqual(results, {'radar': None})
+        # 被期限取消的試探算一次失敗，reset_timeout 後可以再試探
+        self.assertEqual(breaker.state, 'open')
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+
+    def test_stalled_upstream_fails_within_client_timeout(self):
+        breaker = CircuitBreaker('cwa_test', failure_threshold=1, reset_timeout=30)
+
+        async def stall(reader, writer):
+            # 接受連線但永遠不回應
+            await asyncio.sleep(5)
+            writer.close()
+
+        async def run():
+            server = await asyncio.start_server(stall, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                with mock.patch.object(cwa, '_cwa_circuit', breaker), \
+                        mock.patch.object(cwa, 'CWA_API_BASE', f'http://127.0.0.1:{port}/'), \
+                        mock.patch.object(cwa, 'CWA_TIMEOUT', 0.1):
+                    return await cwa._fetch_with_circuit('O-A0058-001', ['ProductURL'])
+            finally:
+                server.close()
+
+        started = time.perf_counter()
+        self.assertIsNone(asyncio.run(run()))
+        self.assertLess(time.perf_counter() - started, 2)
+        # 逾時以失敗結束並回報斷路器
+        self.assertEqual(breaker.state, 'open')
+
+
+if __name__ == '__main__':
+    unittest.main()
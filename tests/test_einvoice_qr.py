@@ -0,0 +1,50 @@
+from utils.einvoice_qr import parse_einvoice_qr, decode_einvoice, load_cv2
+
+import os
+import tempfile
+import unittest
+from datetime import date
+
+cv2 = load_cv2()
+
+# 發票字軌 AB12345678、民國 113/11/15、隨機碼 4821、銷售額 0x4C4、總計 0x500 (1280)、買方 00000000、賣方 12345678
+LEFT_QR = ("AB12345678" "1131115" "4821" "000004C4" "00000500" "00000000" "12345678"
+           "ydXZt4LAN1UHN/j1juVcRA==" ":**********:3:3:1:拿鐵:1:120:")
+
+
+class TestEInvoiceQR(unittest.TestCase):
+
+    def test_parse_einvoice_qr(self):
+        record = parse_einvoice_qr(LEFT_QR)
+        self.assertEqual(record.number, 'AB12345678')
+        self.assertEqual(record.date, date(2024, 11, 15))
+        self.assertEqual(record.period_info, {'year': 2024, 'period': 6, 'month': '11-12月'})
+        self.assertEqual(record.total, 1280)
+        self.assertEqual(record.random_code, '4821')
+        self.assertEqual(record.seller_id, '12345678')
+        self.assertTrue(record.is_uniform_invoice)
+
+    def test_parse_other_qr(self):
+        # 右側 QR Code 與一般網址不是電子發票資訊
+        self.assertIsNone(parse_einvoice_qr("**:拿鐵:1:120"))
+        self.assertIsNone(parse_einvoice_qr("https://line.me"))
+        self.assertIsNone(parse_einvoice_qr("AB12345678" "1131345" "4821" "000004C400000500" "0000000012345678"))
+
+    @unittest.skipIf(cv2 is None, "opencv 未安裝")
+    def test_decode_einvoice_image(self):
+        qr_image = cv2.QRCodeEncoder.create().encode(LEFT_QR)
+        qr_image = cv2.resize(qr_image, None, fx=8, fy=8, interpolation=cv2.INTER_NEAREST)
+        qr_image = cv2.copyMakeBorder(qr_image, 80, 80, 80, 80, cv2.BORDER_CONSTANT, value=255)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            image_path = os.path.join(tmp_dir, 'einvoice.png')
+            cv2.imwrite(image_path, qr_image)
+            record = decode_einvoice(image_path)
+        self.assertIsNotNone(record)
+        self.assertEqual(record.number, 'AB12345678')
+
+    def test_decode_missing_file(self):
+        self.assertIsNone(decode_einvoice('/not/exist.jpg'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+from utils.etax import EtaxFetcher, AsyncEtaxFetcher, parse_winning_numbers_html
+
+import os
+import asyncio
+import unittest
+from unittest.mock import MagicMock, AsyncMock
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURE_DIR, name), 'rb') as f:
+        return f.read()
+
+
+class TestEtax(unittest.TestCase):
+
+    def test_parse_winning_numbers_html(self):
+        period_info, winning_numbers = parse_winning_numbers_html(read_fixture('etax_index.html'))
+        self.assertEqual(period_info, {'year': 2024, 'period': 5})
+        self.assertEqual(winning_numbers, {
+            'special_prize': ['87510041'],
+            'grand_prize': ['32220522'],
+            'first_prize': ['21981893', '19324400', '93475309'],
+            'additional_sixth_prize': ['893', '400', '309'],
+        })
+
+        # str 與 bytes 結果相同
+        html = read_fixture('etax_last_number.html')
+        self.assertEqual(parse_winning_numbers_html(html.decode('utf-8')), parse_winning_numbers_html(html))
+
+    def test_each_page_yields_its_own_period(self):
+        # 兩個頁面都有指向另一頁的分頁連結，期別以本頁所在的分頁為準
+        index_period, index_numbers = parse_winning_numbers_html(read_fixture('etax_index.html'))
+        last_period, last_numbers = parse_winning_numbers_html(read_fixture('etax_last_number.html'))
+        self.assertEqual(index_period, {'year': 2024, 'period': 5})
+        self.assertEqual(last_period, {'year': 2024, 'period': 4})
+        self.assertEqual(last_numbers['special_prize'], ['95264941'])
+        self.assertNotEqual(index_numbers, last_numbers)
+
+    def test_period_from_active_link_or_heading(self):
+        red = '<span class="font-weight-bold etw-color-red">{}</span>'
+        prizes = red.format('12345678') * 2 + ('<span class="font-weight-bold">12345</span>' + red.format('678')) * 3
+        # etw-on 標在連結本身
+        html = ('<ul><li><a href="index.html">113年11-12月</a></li>'
+                '<li><a href="lastNumber.html" class="etw-on">113年09-10月</a></li></ul>' + prizes)
+        self.assertEqual(parse_winning_numbers_html(html)[0], {'year': 2024, 'period': 5})
+        # 沒有分頁時以頁面標題為準，不採用指向其他頁面的連結
+        html = '<a href="lastNumber.html">113年09-10月</a><h2>113年11-12月 統一發票中獎號碼</h2>' + prizes
+        self.assertEqual(parse_winning_numbers_html(html)[0], {'year': 2024, 'period': 6})
+
+    def test_parse_invalid_page(self):
+        with self.assertRaises(Exception):
+            parse_winning_numbers_html('<html><body>維護中</body></html>')
+
+    def test_conditional_get(self):
+        fetcher = EtaxFetcher()
+        fetcher.session = MagicMock()
+        first = MagicMock(status_code=200, content=read_fixture('etax_index.html'),
+                          headers={'ETag': '"abc"', 'Last-Modified': 'Mon, 25 Nov 2024 05:30:00 GMT'})
+        not_modified = MagicMock(status_code=304, content=b'', headers={})
+        fetcher.session.get.side_effect = [first, not_modified]
+
+        result = fetcher.fetch('https://invoice.etax.nat.gov.tw/index.html')
+        self.assertEqual(fetcher.fetch('https://invoice.etax.nat.gov.tw/index.html'), result)
+
+        _, kwargs = fetcher.session.get.call_args
+        self.assertEqual(kwargs['headers']['If-None-Match'], '"abc"')
+        self.assertEqual(kwargs['headers']['If-Modified-Since'], 'Mon, 25 Nov 2024 05:30:00 GMT')
+        self.assertEqual(kwargs['timeout'], fetcher.timeout)
+
+    def test_error_status(self):
+        fetcher = EtaxFetcher()
+        fetcher.session = MagicMock()
+        fetcher.session.get.return_value = MagicMock(status_code=500, headers={})
+        with self.assertRaises(Exception):
+            fetcher.fetch('https://invoice.etax.nat.gov.tw/index.html')
+
+    def test_async_conditional_get(self):
+        fetcher = AsyncEtaxFetcher()
+        headers = {'ETag': '"abc"', 'Last-Modified': 'Mon, 25 Nov 2024 05:30:00 GMT'}
+        fetcher._get = AsyncMock(side_effect=[(200, headers, read_fixture('etax_index.html')), (304, {}, b'')])
+
+        async def fetch_twice():
+            first = await fetcher.fetch('https://invoice.etax.nat.gov.tw/index.html')
+            second = await fetcher.fetch('https://invoice.etax.nat.gov.tw/index.html')
+            return first, second
+
+        first, second = asyncio.run(fetch_twice())
+        self.assertEqual(first, second)
+        self.assertEqual(first[0], {'year': 2024, 'period': 5})
+        _, conditional_headers = fetcher._get.call_args.args
+        self.assertEqual(conditional_headers['If-None-Match'], '"abc"')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+from utils.image_preprocess import prepare_image_for_ocr
+
+import io
+import unittest
+from PIL import Image
+
+
+def make_jpeg(size, orientation=None, mode='RGB'):
+    image = Image.effect_noise(size, 60).convert(mode)
+    output = io.BytesIO()
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    image.save(output, 'JPEG', quality=95, exif=exif)
+    return output.getvalue()
+
+
+class TestImagePreprocess(unittest.TestCase):
+
+    def test_downscale_and_grayscale(self):
+        content = make_jpeg((4000, 3000))
+        prepared = prepare_image_for_ocr(content, max_edge=1600, quality=80)
+        self.assertLess(len(prepared), len(content))
+        image = Image.open(io.BytesIO(prepared))
+        self.assertEqual(image.format, 'JPEG')
+        self.assertEqual(image.mode, 'L')
+        self.assertEqual(max(image.size), 1600)
+
+    def test_orientation_applied_and_exif_stripped(self):
+        # orientation 6：需要順時針轉 90 度，轉正後變成直式
+        content = make_jpeg((3000, 2000), orientation=6)
+        image = Image.open(io.BytesIO(prepare_image_for_ocr(content, max_edge=1500)))
+        self.assertEqual(image.size, (1000, 1500))
+        self.assertNotIn(0x0112, image.getexif())
+
+    def test_small_image_kept(self):
+        content = make_jpeg((200, 100), mode='L')
+        image = Image.open(io.BytesIO(prepare_image_for_ocr(content, max_edge=1600)))
+        self.assertEqual(image.size, (200, 100))
+
+
+if __name__ == '__main__':
+    unittest.main()
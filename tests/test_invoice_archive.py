@@ -0,0 +1,64 @@
+from utils.invoice_archive import InvoiceArchive, build_prize_lookup, lookup_prize, recheck_pending_invoices
+from utils.invoice_processing import check_prize
+
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+WINNING_NUMBERS = {
+    'special_prize': ['12345678'],
+    'grand_prize': ['23456789'],
+    'first_prize': ['34567890', '45678901'],
+    'additional_sixth_prize': ['890', '123'],
+}
+
+
+class TestInvoiceArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.archive = InvoiceArchive(os.path.join(self.tmp_dir.name, 'invoices.db'))
+        self.period_info = {'year': 2024, 'period': 6}
+
+    def tearDown(self):
+        self.archive.db.close()
+        self.tmp_dir.cleanup()
+
+    def test_lookup_prize_matches_check_prize(self):
+        lookup = build_prize_lookup(WINNING_NUMBERS)
+        for invoice_number in ['AB12345678', 'AB23456789', 'AB34567890', 'AB04567890', 'AB00008901',
+                               'AB00000890', 'AB00000123', 'AB00000000', 'AB45678900']:
+            self.assertEqual(lookup_prize(invoice_number, lookup), check_prize(invoice_number, WINNING_NUMBERS),
+                             invoice_number)
+
+    def test_add_pending_is_idempotent(self):
+        self.assertTrue(self.archive.add_pending('U1', 'AB12345678', self.period_info))
+        self.assertFalse(self.archive.add_pending('U1', 'AB12345678', self.period_info))
+        self.assertEqual(self.archive.pending_periods(), [self.period_info])
+
+    def test_recheck_period(self):
+        self.archive.add_pending('U1', 'AB12345678', self.period_info, target_id='G1')
+        self.archive.add_pending('U1', 'AB00000000', self.period_info)
+        self.archive.add_pending('U2', 'CD00000890', self.period_info)
+        self.archive.add_pending('U2', 'CD12345678', {'year': 2025, 'period': 1})
+
+        winners = self.archive.recheck_period(self.period_info, WINNING_NUMBERS)
+        self.assertEqual(sorted(winner['invoice_number'] for winner in winners), ['AB12345678', 'CD00000890'])
+        self.assertEqual(self.archive.pending_periods(), [{'year': 2025, 'period': 1}])
+        # 再跑一次不會重複通知
+        self.assertEqual(self.archive.recheck_period(self.period_info, WINNING_NUMBERS), [])
+
+    def test_recheck_pending_invoices(self):
+        self.archive.add_pending('U1', 'AB12345678', self.period_info)
+        self.archive.add_pending('U1', 'AB12345678', {'year': 2025, 'period': 1})
+        fetch = MagicMock(return_value=WINNING_NUMBERS)
+        notify = MagicMock()
+        recheck_pending_invoices(self.archive, fetch, notify, is_drawn=lambda info: info['year'] == 2024)
+        fetch.assert_called_once_with(self.period_info)
+        notify.assert_called_once()
+        self.assertEqual(self.archive.pending_periods(), [{'year': 2025, 'period': 1}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+from utils.invoice_calendar import (
+    InvoiceCalendar, compute_period, ETAX_LATEST_URL, ETAX_PREVIOUS_URL,
+)
+
+import unittest
+from datetime import datetime
+
+
+class TestInvoiceCalendar(unittest.TestCase):
+
+    def setUp(self):
+        self.now = datetime(2025, 3, 26)
+        self.calendar = InvoiceCalendar(2020, 2030, clock=lambda: self.now)
+
+    def test_table_matches_computed_dates(self):
+        self.assertEqual(len(self.calendar), 66)
+        entry = self.calendar.get(2024, 6)
+        self.assertEqual((entry.draw_date, entry.redeem_deadline), (datetime(2025, 1, 25), datetime(2025, 5, 5)))
+        # 範圍外的期別即時計算
+        self.assertEqual(self.calendar.get(1999, 3), compute_period(1999, 3))
+        with self.assertRaises(ValueError):
+            self.calendar.get(2024, 7)
+
+    def test_clock_and_periods(self):
+        self.assertEqual(self.calendar.period_at().key, (2025, 2))
+        self.assertEqual(self.calendar.latest_drawn().key, (2025, 1))
+        self.assertEqual([entry.key for entry in self.calendar.redeemable_periods()], [(2025, 1), (2024, 6)])
+        self.now = datetime(2025, 5, 6)
+        self.assertEqual([entry.key for entry in self.calendar.redeemable_periods()], [(2025, 1)])
+        self.assertEqual(self.calendar.latest_drawn(datetime(2040, 1, 10)).key, (2039, 5))
+        self.assertEqual(self.calendar.latest_drawn(datetime(2070, 1, 26)).key, (2069, 6))
+
+    def test_redeemable_mask(self):
+        invoices = [
+            {'year': 2025, 'period': 1},
+            {'year': 2024, 'period': 6},
+            {'year': 2024, 'period': 5},
+            {'year': 2025, 'period': 2},
+            {'year': 2025, 'period': None},
+        ]
+        self.assertEqual(self.calendar.redeemable_mask(invoices), [True, True, False, False, False])
+        self.assertEqual(self.calendar.redeemable_mask(invoices[:4]),
+                         [self.calendar.is_redeemable(info) for info in invoices[:4]])
+
+    def test_etax_source(self):
+        self.assertEqual(self.calendar.etax_source({'year': 2025, 'period': 1}), ETAX_LATEST_URL)
+        self.assertEqual(self.calendar.etax_source({'year': 2024, 'period': 6}), ETAX_PREVIOUS_URL)
+        self.assertIsNone(self.calendar.etax_source({'year': 2024, 'period': 5}))
+        self.assertIsNone(self.calendar.etax_source({'year': 2025, 'period': 2}))
+
+
+if __name__ == '__main__':
+    unittest.main()
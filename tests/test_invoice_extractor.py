@@ -0,0 +1,58 @@
+from utils.invoice_extractor import extract_invoice_record, extract_invoice_records
+
+import unittest
+from datetime import date
+
+SAMPLE_INVOICE = """
+全家便利商店
+電子發票證明聯
+113年11-12月
+DY-21294127
+2024-11-15 12:30:45
+隨機碼:4821 總計:$1,280
+賣方:12345678 買方:
+"""
+
+
+class TestInvoiceExtractor(unittest.TestCase):
+
+    def test_extract_invoice_record(self):
+        record = extract_invoice_record(SAMPLE_INVOICE)
+        self.assertTrue(record.is_uniform_invoice)
+        self.assertEqual(record.number, 'DY-21294127')
+        self.assertEqual(record.period_info, {'year': 2024, 'period': 6, 'month': '11-12月'})
+        self.assertEqual(record.date, date(2024, 11, 15))
+        self.assertEqual(record.total, 1280)
+        self.assertEqual(record.seller_id, '12345678')
+        self.assertEqual(record.random_code, '4821')
+        self.assertEqual(record.confidence['number'], 1.0)
+        self.assertEqual(record.confidence['period'], 1.0)
+
+    def test_minguo_date_and_spaced_number(self):
+        record = extract_invoice_record("統一發票 113/09/01 AB 12345678")
+        self.assertEqual(record.number, 'AB12345678')
+        self.assertEqual(record.date, date(2024, 9, 1))
+        self.assertIsNone(record.period_info)
+
+    def test_confidence_drops_with_conflicting_candidates(self):
+        record = extract_invoice_record("電子發票 AB12345678 CD87654321 113年12-13月")
+        self.assertEqual(record.number, 'AB12345678')
+        self.assertEqual(record.candidates['number'], ['AB12345678', 'CD87654321'])
+        self.assertLess(record.confidence['number'], 1.0)
+        self.assertEqual(record.confidence['period'], 0.0)
+
+    def test_not_invoice(self):
+        record = extract_invoice_record("Starbucks Coffee Total: $9.50")
+        self.assertFalse(record.is_uniform_invoice)
+        self.assertIsNone(record.period_info)
+        self.assertEqual(record.confidence['number'], 0.0)
+
+    def test_extract_invoice_records(self):
+        records = list(extract_invoice_records([SAMPLE_INVOICE, "收據"]))
+        self.assertEqual(len(records), 2)
+        self.assertTrue(records[0].is_uniform_invoice)
+        self.assertFalse(records[1].is_uniform_invoice)
+
+
+if __name__ == '__main__':
+    unittest.main()
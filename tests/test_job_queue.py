@@ -0,0 +1,193 @@
+from utils.job_queue import JobQueue, JobConsumerPool, AsyncJobConsumerPool, JobDeferred
+from utils.line_delivery import deliver_messages, deliver_messages_async, is_reply_token_valid
+
+import os
+import time
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import MagicMock, AsyncMock
+
+
+class TestJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.queue = JobQueue(os.path.join(self.tmp_dir.name, 'jobs.db'), lease_seconds=60, max_attempts=2)
+
+    def tearDown(self):
+        self.queue.db.close()
+        self.tmp_dir.cleanup()
+
+    def test_enqueue_claim_complete(self):
+        job_id = self.queue.enqueue('image', {'image_path': 'a.jpg'})
+        self.assertEqual(self.queue.depth(), 1)
+
+        job = self.queue.claim('worker-1')
+        self.assertEqual(job.id, job_id)
+        self.assertEqual(job.payload['image_path'], 'a.jpg')
+        self.assertEqual(job.attempts, 1)
+        # 已被領取的工作不會再被其他 consumer 領取
+        self.assertIsNone(self.queue.claim('worker-2'))
+
+        self.assertTrue(self.queue.complete(job))
+        self.assertEqual(self.queue.depth(), 0)
+
+    def test_claim_group_takes_pending_burst(self):
+        first_id = self.queue.enqueue('image', {'group_key': 'C1:U1'})
+        second_id = self.queue.enqueue('image', {'group_key': 'C1:U1'}, delay=60)
+        self.queue.enqueue('image', {'group_key': 'C1:U2'})
+
+        first = self.queue.claim('worker-1')
+        self.assertEqual(first.id, first_id)
+        # 時間窗還沒結束的同組工作也一併領取，其他使用者的不受影響
+        group = self.queue.claim_group('image', 'C1:U1', 'worker-1', limit=10)
+        self.assertEqual([job.id for job in group], [second_id])
+        self.assertEqual(group[0].attempts, 1)
+        self.assertEqual(self.queue.claim_group('image', 'C1:U1', 'worker-1', limit=10), [])
+        self.assertEqual(self.queue.claim('worker-2').payload['group_key'], 'C1:U2')
+
+    def test_expired_lease_is_reclaimed(self):
+        self.queue.lease_seconds = 0
+        self.queue.enqueue('image', {})
+        first = self.queue.claim('worker-1')
+        # 模擬 worker 中途重啟，租約過期後由其他 consumer 接手
+        second = self.queue.claim('worker-2')
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(second.attempts, 2)
+
+    def test_expired_lease_respects_max_attempts_and_owner(self):
+        self.queue.lease_seconds = 0
+        self.queue.enqueue('image', {})
+        first = self.queue.claim('worker-1')
+        second = self.queue.claim('worker-2')
+        # 租約已被接手，原本的 consumer 不能完成或退回工作
+        self.assertFalse(self.queue.complete(first))
+        self.assertTrue(self.queue.fail(first, 'late', retry_delay=0))
+        self.assertEqual(self.queue.counts()['running'], 1)
+        # 重試次數用盡後租約再過期，不再被領取
+        self.assertEqual(second.attempts, 2)
+        self.assertIsNone(self.queue.claim('worker-3'))
+        self.assertEqual(self.queue.counts(), {'pending': 0, 'running': 0, 'failed': 1})
+
+    def test_fail_retry_and_give_up(self):
+        self.queue.enqueue('image', {})
+        job = self.queue.claim('worker-1')
+        self.assertTrue(self.queue.fail(job, 'boom', retry_delay=0))
+        job = self.queue.claim('worker-1')
+        self.assertFalse(self.queue.fail(job, 'boom', retry_delay=0))
+        self.assertIsNone(self.queue.claim('worker-1'))
+        self.assertEqual(self.queue.depth(), 0)
+
+    def test_consumer_pool_run_once(self):
+        handled = []
+        give_up = MagicMock()
+        pool = JobConsumerPool(self.queue, {'image': lambda job: handled.append(job.id)}, on_give_up=give_up)
+        job_id = self.queue.enqueue('image', {})
+        self.assertTrue(pool.run_once())
+        self.assertEqual(handled, [job_id])
+        self.assertFalse(pool.run_once())
+
+        # 未知的工作類型重試用盡後通知
+        self.queue.enqueue('unknown', {})
+        pool.run_once()
+        self.queue.db.connection().execute("UPDATE jobs SET available_at = 0")
+        pool.run_once()
+        give_up.assert_called_once()
+
+    def test_deferred_job_keeps_attempts(self):
+        def wait_for_memory(job):
+            raise JobDeferred('記憶體預算不足', delay=0)
+
+        give_up = MagicMock()
+        pool = JobConsumerPool(self.queue, {'image': wait_for_memory}, on_give_up=give_up)
+        self.queue.enqueue('image', {})
+        # 延後的次數不受 max_attempts 限制，也不通知使用者
+        for _ in range(3):
+            self.assertTrue(pool.run_once())
+        give_up.assert_not_called()
+        self.assertEqual(self.queue.claim('worker-1').attempts, 1)
+
+    def test_async_consumer_pool(self):
+        handled = []
+
+        async def handle(job):
+            await asyncio.sleep(0)
+            handled.append(job.id)
+
+        async def run():
+            pool = AsyncJobConsumerPool(self.queue, {'image': handle}, concurrency=4, poll_interval=0.05)
+            self.assertFalse(await pool.run_once())
+            pool.start()
+            job_ids = [self.queue.enqueue('image', {}) for _ in range(3)]
+            pool.wake()
+            for _ in range(100):
+                if len(handled) == 3:
+                    break
+                await asyncio.sleep(0.01)
+            await pool.stop(timeout=1)
+            return job_ids
+
+        job_ids = asyncio.run(run())
+        self.assertEqual(sorted(handled), job_ids)
+        self.assertEqual(self.queue.depth(), 0)
+
+    def test_async_consumer_pool_give_up(self):
+        give_up = AsyncMock()
+
+        async def fail(job):
+            raise RuntimeError('boom')
+
+        pool = AsyncJobConsumerPool(self.queue, {'image': fail}, on_give_up=give_up)
+        self.queue.enqueue('image', {})
+        asyncio.run(pool.run_once())
+        self.queue.db.connection().execute("UPDATE jobs SET available_at = 0")
+        asyncio.run(pool.run_once())
+        give_up.assert_awaited_once()
+        self.assertEqual(self.queue.depth(), 0)
+
+
+class TestLineDelivery(unittest.TestCase):
+
+    def test_is_reply_token_valid(self):
+        now = time.time()
+        self.assertTrue(is_reply_token_valid(now - 10, ttl=50, now=now))
+        self.assertFalse(is_reply_token_valid(now - 60, ttl=50, now=now))
+        self.assertFalse(is_reply_token_valid(None))
+
+    def test_deliver_messages(self):
+        api = MagicMock()
+        method = deliver_messages(api, ['hi'], reply_token='token', received_at=time.time(), target_id='U1')
+        self.assertEqual(method, 'reply')
+        api.reply_message.assert_called_once_with('token', ['hi'])
+
+        # reply token 過期改用 push
+        api = MagicMock()
+        method = deliver_messages(api, ['hi'], reply_token='token', received_at=time.time() - 120, target_id='U1')
+        self.assertEqual(method, 'push')
+        api.push_message.assert_called_once_with('U1', ['hi'])
+        api.reply_message.assert_not_called()
+
+        # reply 失敗也改用 push
+        api = MagicMock()
+        api.reply_message.side_effect = Exception('Invalid reply token')
+        method = deliver_messages(api, ['hi'], reply_token='token', received_at=time.time(), target_id='U1')
+        self.assertEqual(method, 'push')
+
+    def test_deliver_messages_async(self):
+        api = AsyncMock()
+        method = asyncio.run(deliver_messages_async(api, ['hi'], reply_token='token', received_at=time.time(),
+                                                    target_id='U1'))
+        self.assertEqual(method, 'reply')
+        api.reply_message.assert_awaited_once_with('token', ['hi'])
+
+        api = AsyncMock()
+        api.reply_message.side_effect = Exception('Invalid reply token')
+        method = asyncio.run(deliver_messages_async(api, ['hi'], reply_token='token', received_at=time.time(),
+                                                    target_id='U1'))
+        self.assertEqual(method, 'push')
+        api.push_message.assert_awaited_once_with('U1', ['hi'])
+
+
+if __name__ == '__main__':
+    unittest.main()
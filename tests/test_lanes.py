@@ -0,0 +1,63 @@
+from utils.lanes import Lane, AsyncLane
+
+import time
+import asyncio
+import threading
+import unittest
+
+
+class TestLane(unittest.TestCase):
+
+    def test_text_lane_not_blocked_by_image_backlog(self):
+        image_lane = Lane('image', concurrency=1, max_pending=1)
+        text_lane = Lane('text', concurrency=1, max_pending=10)
+        release = threading.Event()
+        handled = threading.Event()
+
+        self.assertTrue(image_lane.submit(release.wait))
+        self.assertTrue(image_lane.submit(release.wait))
+        # 執行中 + 等待中已達上限，之後的圖片被拒絕
+        self.assertFalse(image_lane.submit(release.wait))
+
+        started = time.perf_counter()
+        self.assertTrue(text_lane.submit(handled.set))
+        self.assertTrue(handled.wait(1))
+        self.assertLess(time.perf_counter() - started, 0.5)
+
+        release.set()
+        stats = image_lane.stats()
+        self.assertEqual(stats['shed'], 1)
+        self.assertEqual(stats['concurrency'], 1)
+
+    def test_errors_do_not_stop_lane(self):
+        lane = Lane('text', concurrency=1)
+        done = threading.Event()
+        lane.submit(lambda: 1 / 0)
+        lane.submit(done.set)
+        self.assertTrue(done.wait(1))
+
+
+class TestAsyncLane(unittest.TestCase):
+
+    def test_spawn_shed_and_run_blocking(self):
+        async def run():
+            lane = AsyncLane('image', concurrency=1, max_pending=1, threads=1)
+            release = asyncio.Event()
+            accepted = [lane.spawn(release.wait) for _ in range(3)]
+            thread_name = await lane.run_blocking(lambda: threading.current_thread().name)
+            await asyncio.sleep(0)
+            running = lane.stats()['running']
+            release.set()
+            await asyncio.gather(*lane._tasks)
+            return accepted, thread_name, running, lane.stats()
+
+        accepted, thread_name, running, stats = asyncio.run(run())
+        self.assertEqual(accepted, [True, True, False])
+        self.assertTrue(thread_name.startswith('lane-image'))
+        self.assertEqual(running, 1)
+        self.assertEqual(stats['completed'], 2)
+        self.assertEqual(stats['shed'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
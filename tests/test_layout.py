@@ -0,0 +1,78 @@
+from utils.layout import make_block, segment_blocks, blocks_to_text, join_words
+from utils import ocr_cloudvision
+
+import unittest
+from unittest.mock import patch
+from google.cloud import vision
+
+
+def vision_block(text, left, top, right, bottom):
+    words = []
+    for line in text.split('\n'):
+        symbols = [{'text': char} for char in line]
+        symbols[-1]['property'] = {'detected_break': {'type_': 'LINE_BREAK'}}
+        words.append({'symbols': symbols})
+    vertices = [{'x': left, 'y': top}, {'x': right, 'y': top}, {'x': right, 'y': bottom}, {'x': left, 'y': bottom}]
+    return {'bounding_box': {'vertices': vertices}, 'paragraphs': [{'words': words}]}
+
+
+class TestLayout(unittest.TestCase):
+
+    def test_segment_side_by_side_documents(self):
+        blocks = [
+            make_block('電子發票證明聯', 10, 10, 300, 40),
+            make_block('AB12345678', 20, 60, 280, 90),
+            make_block('電子發票證明聯', 420, 12, 700, 42),
+            make_block('CD87654321', 430, 62, 690, 92),
+            make_block('總計 120', 15, 120, 200, 150),
+        ]
+        groups = segment_blocks(blocks, image_width=720)
+        self.assertEqual(len(groups), 2)
+        self.assertEqual(blocks_to_text(groups[0]), '電子發票證明聯\nAB12345678\n總計 120')
+        self.assertEqual(blocks_to_text(groups[1]), '電子發票證明聯\nCD87654321')
+
+    def test_single_document(self):
+        blocks = [
+            make_block('全聯', 10, 10, 200, 40),
+            make_block('總計 99', 190, 60, 400, 90),
+            make_block(' ', 900, 0, 950, 5),
+        ]
+        self.assertEqual(len(segment_blocks(blocks, image_width=1000)), 1)
+        self.assertEqual(segment_blocks([]), [])
+
+    def test_price_column_stays_with_receipt(self):
+        # 品名欄與價格欄之間有空白，但價格欄很窄，仍是同一張收據
+        blocks = [
+            make_block('牛奶', 10, 10, 300, 40),
+            make_block('麵包', 10, 50, 300, 80),
+            make_block('55', 420, 10, 480, 40),
+            make_block('40', 420, 50, 480, 80),
+        ]
+        groups = segment_blocks(blocks, image_width=1000)
+        self.assertEqual(len(groups), 1)
+        self.assertEqual(blocks_to_text(groups[0]), '牛奶\n55\n麵包\n40')
+
+    def test_join_words(self):
+        self.assertEqual(join_words(['總', '計', '$9.50']), '總計 $9.50')
+        self.assertEqual(join_words(['Total', '9.50']), 'Total 9.50')
+
+    def test_detect_documents_from_vision_response(self):
+        response = vision.AnnotateImageResponse({
+            'text_annotations': [{'description': 'full text'}],
+            'full_text_annotation': {'pages': [{'width': 800, 'blocks': [
+                vision_block('電子發票\nAB12345678', 10, 10, 300, 100),
+                vision_block('電子發票\nCD87654321', 450, 10, 780, 100),
+            ]}]},
+        })
+        with patch('utils.ocr_cloudvision.annotate_text', return_value=response):
+            documents = ocr_cloudvision.detect_documents('photo.jpg')
+        self.assertEqual(documents, ['電子發票\nAB12345678', '電子發票\nCD87654321'])
+
+        # 只有一份文件時使用 Vision 的完整文字
+        response.full_text_annotation.pages[0].blocks.pop()
+        with patch('utils.ocr_cloudvision.annotate_text', return_value=response):
+            self.assertEqual(ocr_cloudvision.detect_documents('photo.jpg'), ['full text'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+from utils.ledger import ExpenseLedger, parse_amount, month_key
+
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+
+
+class TestExpenseLedger(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.ledger = ExpenseLedger(os.path.join(self.tmp_dir.name, 'ledger.db'))
+
+    def tearDown(self):
+        self.ledger.db.close()
+        self.tmp_dir.cleanup()
+
+    def test_parse_amount(self):
+        self.assertEqual(parse_amount(120), 120.0)
+        self.assertEqual(parse_amount('1,280'), 1280.0)
+        self.assertEqual(parse_amount('$9.50'), 9.5)
+        self.assertIsNone(parse_amount(None))
+        self.assertIsNone(parse_amount('無法識別總金額'))
+
+    def test_running_totals(self):
+        november = datetime(2024, 11, 15)
+        self.assertTrue(self.ledger.record_expense('U1', 100, '餐飲', when=november))
+        self.assertTrue(self.ledger.record_expense('U1', '250', '餐飲', when=november))
+        self.assertTrue(self.ledger.record_expense('U1', 80, None, when=november))
+        self.assertTrue(self.ledger.record_expense('U1', 999, '服飾', when=datetime(2024, 12, 1)))
+        self.assertTrue(self.ledger.record_expense('U2', 50, '餐飲', when=november))
+        self.assertFalse(self.ledger.record_expense('U1', None, '餐飲', when=november))
+
+        summary = self.ledger.monthly_total('U1', '2024-11')
+        self.assertEqual(summary['total'], 430)
+        self.assertEqual(summary['count'], 3)
+
+        categories = self.ledger.category_totals('U1', '2024-11')
+        self.assertEqual([item['category'] for item in categories], ['餐飲', '未分類'])
+        self.assertEqual(categories[0]['total'], 350)
+        self.assertEqual(categories[0]['count'], 2)
+
+    def test_source_key_is_recorded_once(self):
+        when = datetime(2024, 11, 15)
+        self.assertTrue(self.ledger.record_expense('U1', 100, '餐飲', when=when, source_key='line:1:0'))
+        # 工作重試時同一份單據不會再累加
+        self.assertTrue(self.ledger.record_expense('U1', 100, '餐飲', when=when, source_key='line:1:0'))
+        self.assertTrue(self.ledger.record_expense('U1', 50, '餐飲', when=when, source_key='line:1:1'))
+        self.assertTrue(self.ledger.record_expense('U1', 30, '餐飲', when=when))
+        self.assertTrue(self.ledger.record_expense('U1', 30, '餐飲', when=when))
+        self.assertEqual(self.ledger.monthly_total('U1', '2024-11'), {'month': '2024-11', 'total': 210, 'count': 4})
+
+    def test_month_key_uses_taipei_time(self):
+        # UTC 11/30 20:00 是台灣時間 12/1 04:00
+        self.assertEqual(month_key(datetime(2024, 11, 30, 20, tzinfo=timezone.utc)), '2024-12')
+        self.assertEqual(month_key(datetime(2024, 11, 30, 20)), '2024-11')
+
+    def test_empty_month(self):
+        summary = self.ledger.monthly_total('U1', '2024-01')
+        self.assertEqual(summary['count'], 0)
+        self.assertEqual(self.ledger.category_totals('U1', '2024-01'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+from utils.memory_budget import (
+    ByteBudget, MemoryBudgetExceeded, ImageTooLargeError, check_decoded_pixels, estimate_image_bytes,
+    track_stage, memory_stats,
+)
+
+import os
+import asyncio
+import tempfile
+import threading
+import unittest
+
+from PIL import Image
+
+
+class TestByteBudget(unittest.TestCase):
+
+    def test_fast_rejection_and_release(self):
+        budget = ByteBudget('test_fast', 100)
+        self.assertTrue(budget.try_acquire(60))
+        self.assertFalse(budget.try_acquire(60))
+        budget.release(60)
+        # 超過總額度的單筆工作以總額度計算，只能單獨執行
+        self.assertTrue(budget.try_acquire(500))
+        self.assertEqual(budget.stats()['in_use'], 100)
+
+    def test_waiters_are_admitted_after_release(self):
+        budget = ByteBudget('test_wait', 100)
+        budget.acquire(80)
+        timer = threading.Timer(0.05, budget.release, args=(80,))
+        timer.start()
+        with budget.reserve(50, timeout=2):
+            self.assertEqual(budget.stats()['in_use'], 50)
+        timer.join()
+        with budget.reserve(100):
+            with self.assertRaises(MemoryBudgetExceeded):
+                with budget.reserve(10, timeout=0.01):
+                    pass
+        stats = budget.stats()
+        self.assertEqual((stats['in_use'], stats['peak'], stats['waits'], stats['rejected']), (0, 100, 2, 1))
+        self.assertIn('test_wait', memory_stats()['budgets'])
+
+    def test_reserve_async(self):
+        budget = ByteBudget('test_async', 100)
+
+        async def run():
+            budget.acquire(100)
+            asyncio.get_running_loop().call_later(0.05, budget.release, 100)
+            async with budget.reserve_async(40, timeout=2):
+                return budget.stats()['in_use']
+
+        self.assertEqual(asyncio.run(run()), 40)
+        self.assertEqual(budget.stats()['in_use'], 0)
+
+
+class TestImageLimits(unittest.TestCase):
+
+    def test_estimate_and_pixel_cap(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'receipt.png')
+            Image.new('L', (400, 300), 255).save(path)
+            file_size = os.path.getsize(path)
+            self.assertEqual(estimate_image_bytes(path), file_size * 2 + 400 * 300 * 4)
+            self.assertEqual(estimate_image_bytes(path, max_pixels=1000), file_size * 2 + 1000 * 4)
+            with Image.open(path) as image:
+                check_decoded_pixels(image, max_pixels=120000)
+                with self.assertRaises(ImageTooLargeError):
+                    check_decoded_pixels(image, max_pixels=1000)
+
+    def test_track_stage(self):
+        with track_stage('test_stage'):
+            data = bytearray(1024)
+        del data
+        stats = memory_stats()['stages']['test_stage']
+        self.assertEqual(stats['count'], 1)
+        self.assertGreaterEqual(stats['max_peak_growth'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
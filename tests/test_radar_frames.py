@@ -0,0 +1,89 @@
+from utils.radar_frames import RadarFrameStore, collect_radar_frame
+from utils.weather_images import CachedWeatherImage
+
+import io
+import os
+import multiprocessing
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+from PIL import Image
+
+
+def make_frame(color, size=(1000, 1000)):
+    output = io.BytesIO()
+    Image.new('RGB', size, color).save(output, 'PNG')
+    return output.getvalue()
+
+
+def add_frames(frame_dir, worker):
+    store = RadarFrameStore(frame_dir, capacity=3, frame_max_edge=200)
+    for i in range(3):
+        store.add_frame(f"2024112505{30 + worker + i}00", make_frame('red'))
+
+
+class TestRadarFrameStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = RadarFrameStore(self.tmp_dir.name, capacity=3, frame_max_edge=200)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_ring_buffer_keeps_latest_frames(self):
+        for minute, color in zip(['00', '10', '20', '30'], ['red', 'green', 'blue', 'white']):
+            self.assertTrue(self.store.add_frame(f"2024112505{minute}00", make_frame(color)))
+        timestamps = [frame.timestamp for frame in self.store.frames()]
+        self.assertEqual(timestamps, ['20241125051000', '20241125052000', '20241125053000'])
+        # 同一張影格不重複收錄
+        self.assertFalse(self.store.add_frame('20241125053000', make_frame('white')))
+
+        with Image.open(os.path.join(self.tmp_dir.name, self.store.frames()[-1].filename)) as frame:
+            self.assertLessEqual(max(frame.size), 200)
+
+    def test_concurrent_processes_keep_bound(self):
+        # 多個 worker process 同時收錄影格，緩衝區仍不超過容量
+        processes = [multiprocessing.Process(target=add_frames, args=(self.tmp_dir.name, worker))
+                     for worker in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(30)
+        self.assertTrue(all(process.exitcode == 0 for process in processes))
+        timestamps = [frame.timestamp for frame in self.store.frames()]
+        self.assertEqual(timestamps, ['20241125053300', '20241125053400', '20241125053500'])
+
+    def test_loop_rendered_per_new_frame(self):
+        self.store.add_frame('20241125050000', make_frame('red'))
+        self.store.add_frame('20241125051000', make_frame('green'))
+        loop = self.store.latest_loop()
+        self.assertEqual(loop, 'loop-20241125051000.png')
+        with Image.open(os.path.join(self.tmp_dir.name, loop)) as image:
+            self.assertTrue(image.is_animated)
+            self.assertEqual(image.n_frames, 2)
+
+    def test_frame_minutes_ago(self):
+        for timestamp in ['20241125050000', '20241125051000', '20241125052000']:
+            self.store.add_frame(timestamp, make_frame('red'))
+        now = datetime(2024, 11, 25, 5, 25, tzinfo=timezone.utc)
+        self.assertEqual(self.store.frame_minutes_ago(0, now).timestamp, '20241125052000')
+        self.assertEqual(self.store.frame_minutes_ago(10, now).timestamp, '20241125051000')
+        self.assertIsNone(self.store.frame_minutes_ago(60, now))
+
+    def test_collect_radar_frame(self):
+        image_cache = MagicMock(cache_dir=self.tmp_dir.name)
+        with open(os.path.join(self.tmp_dir.name, 'radar-20241125050000.png'), 'wb') as f:
+            f.write(make_frame('red'))
+        image_cache.get.return_value = CachedWeatherImage(
+            'radar', '20241125050000', 'radar-20241125050000.png', 'radar-20241125050000-preview.jpg')
+        self.assertTrue(collect_radar_frame(self.store, image_cache, 'https://example.com/radar.png'))
+        # 上游圖片沒有更新時不重新產生動畫
+        self.assertFalse(collect_radar_frame(self.store, image_cache, 'https://example.com/radar.png'))
+        self.assertFalse(collect_radar_frame(self.store, image_cache, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+from utils.rate_limit import TokenBucketLimiter, rate_limit_rules
+
+import os
+import tempfile
+import threading
+import unittest
+
+RULES = {
+    'image': {
+        'user': {'capacity': 2, 'per_minute': 1},
+        'group': {'capacity': 3, 'per_minute': 6},
+    },
+}
+
+
+class TestTokenBucketLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'rate_limits.db')
+        self.limiter = TokenBucketLimiter(self.path, RULES)
+
+    def tearDown(self):
+        self.limiter.db.close()
+        self.tmp_dir.cleanup()
+
+    def test_user_bucket_refills(self):
+        self.assertTrue(self.limiter.allow('image', 'U1', now=0))
+        self.assertTrue(self.limiter.allow('image', 'U1', now=0))
+        self.assertFalse(self.limiter.allow('image', 'U1', now=0))
+        # 其他使用者不受影響，沒有設定規則的類型一律放行
+        self.assertTrue(self.limiter.allow('image', 'U2', now=0))
+        self.assertTrue(self.limiter.allow('text', 'U1', now=0))
+        # 每分鐘補充一次
+        self.assertTrue(self.limiter.allow('image', 'U1', now=60))
+        self.assertFalse(self.limiter.allow('image', 'U1', now=60))
+
+    def test_group_bucket_shared_by_members(self):
+        for user_id in ['U1', 'U2', 'U3']:
+            self.assertTrue(self.limiter.allow('image', user_id, 'G1', now=0))
+        self.assertFalse(self.limiter.allow('image', 'U4', 'G1', now=0))
+        # 群組額度不足時不扣使用者的額度
+        self.assertTrue(self.limiter.allow('image', 'U4', now=0))
+        self.assertTrue(self.limiter.allow('image', 'U4', now=0))
+
+    def test_shared_across_processes(self):
+        other = TokenBucketLimiter(self.path, RULES)
+        self.assertTrue(self.limiter.allow('image', 'U1', now=0))
+        self.assertTrue(other.allow('image', 'U1', now=0))
+        self.assertFalse(self.limiter.allow('image', 'U1', now=0))
+        other.db.close()
+
+    def test_prune_idle_buckets(self):
+        self.limiter.allow('image', 'U1', now=0)
+        self.limiter.allow('image', 'U2', now=100)
+        self.assertEqual(self.limiter.prune(now=125), 1)
+
+    def test_concurrent_lanes_count_every_call(self):
+        def worker(index):
+            for _ in range(50):
+                self.limiter.allow('image', f'U{index}', now=0)
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.limiter._calls, 400)
+
+    def test_rate_limit_rules_from_config(self):
+        config = dict(path='data/rate_limits.db', **RULES)
+        self.assertEqual(rate_limit_rules(config), RULES)
+
+
+if __name__ == '__main__':
+    unittest.main()
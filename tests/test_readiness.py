@@ -0,0 +1,45 @@
+from utils.readiness import build_readiness, render_metrics
+
+import unittest
+
+LANE_STATS = {
+    'text': {'lane': 'text', 'concurrency': 2, 'max_pending': 2, 'running': 1, 'waiting': 0,
+             'completed': 5, 'shed': 0, 'avg_wait_ms': 0.5},
+    'image': {'lane': 'image', 'concurrency': 1, 'max_pending': 1, 'running': 1, 'waiting': 1,
+              'completed': 3, 'shed': 2, 'avg_wait_ms': 120.0},
+}
+
+
+class TestReadiness(unittest.TestCase):
+
+    def test_ready(self):
+        report = build_readiness({'pending': 1, 'running': 1, 'failed': 0}, 10,
+                                 {'text': LANE_STATS['text']}, {'modules': True})
+        self.assertTrue(report['ready'])
+        self.assertEqual(report['queue']['backlog'], 2)
+
+    def test_not_ready_reasons(self):
+        report = build_readiness({'pending': 9, 'running': 1, 'failed': 0}, 10, LANE_STATS, {'modules': False})
+        self.assertFalse(report['ready'])
+        self.assertEqual(report['reasons'], ['warming_up'])
+        self.assertEqual(report['busy'], ['queue_backlog', 'lane_image_saturated'])
+        report = build_readiness(None, 10, {}, {'modules': True})
+        self.assertEqual(report['reasons'], ['job_queue_unavailable'])
+
+    def test_busy_pod_stays_ready(self):
+        # 積壓與通道已滿時仍接收流量，由通道回覆忙碌訊息
+        report = build_readiness({'pending': 9, 'running': 1, 'failed': 0}, 10, LANE_STATS, {'modules': True})
+        self.assertTrue(report['ready'])
+        self.assertEqual(report['busy'], ['queue_backlog', 'lane_image_saturated'])
+
+    def test_render_metrics(self):
+        report = build_readiness({'pending': 3, 'running': 1, 'failed': 2}, 10, LANE_STATS, {'modules': False})
+        text = render_metrics(report)
+        self.assertIn('# TYPE linebot_job_queue_backlog gauge\nlinebot_job_queue_backlog 4\n', text)
+        self.assertIn('linebot_lane_shed_total{lane="image"} 2\n', text)
+        self.assertIn('linebot_job_queue_jobs{status="failed"} 2\n', text)
+        self.assertIn('linebot_ready 0\n', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+from utils.receipt_prompt import compact_receipt_text
+from utils.ai_agent import ReceiptAIAgent, _answer_cache
+
+import json
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+RECEIPT_TEXT = """
+全家便利商店
+台北市信義區
+2024-11-15 12:30
+茶葉蛋 10
+御飯糰 35
+鮮奶 45
+總計
+$90
+謝謝光臨
+"""
+
+
+class TestCompactReceiptText(unittest.TestCase):
+
+    def test_keeps_merchant_and_total_lines(self):
+        compact = compact_receipt_text(RECEIPT_TEXT)
+        self.assertEqual(compact, "全家便利商店\n台北市信義區\n2024-11-15 12:30\n總計\n$90")
+
+    def test_falls_back_to_numeric_lines(self):
+        compact = compact_receipt_text("店名\n地址\n電話\n品項\n120\n謝謝")
+        self.assertEqual(compact, "店名\n地址\n電話\n120")
+
+    def test_truncates_middle_lines(self):
+        text = "店名\n地址\n日期\n" + "\n".join(f"小計 {i}" for i in range(100)) + "\n總計 999"
+        compact = compact_receipt_text(text, max_chars=40)
+        self.assertLessEqual(len(compact), 40)
+        self.assertTrue(compact.startswith("店名\n地址\n日期"))
+        self.assertTrue(compact.endswith("總計 999"))
+
+
+class TestReceiptAIAgent(unittest.TestCase):
+
+    def setUp(self):
+        _answer_cache.clear_local()
+
+    def test_invalid_answer_is_not_cached(self):
+        agent = ReceiptAIAgent(api_key='test', provider='openai')
+        agent.client = MagicMock()
+        agent.client.chat.completions.create.return_value = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content='{"amount": 9'))],
+            usage=SimpleNamespace(prompt_tokens=80, completion_tokens=64),
+        )
+        for _ in range(2):
+            self.assertIsNone(agent.analyze_receipt_text(RECEIPT_TEXT)['amount'])
+        # 截斷的回答不寫入快取，再次上傳時重新詢問模型
+        self.assertEqual(agent.client.chat.completions.create.call_count, 2)
+
+    def test_openai_request_is_compact_json(self):
+        agent = ReceiptAIAgent(api_key='test', provider='openai', max_output_tokens=32)
+        agent.client = MagicMock()
+        agent.client.chat.completions.create.return_value = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(
+                content=json.dumps({'amount': 90, 'category': '餐飲', 'confidence': 0.9})))],
+            usage=SimpleNamespace(prompt_tokens=80, completion_tokens=20),
+        )
+
+        with self.assertLogs(level='INFO') as logs:
+            result = agent.analyze_receipt_text(RECEIPT_TEXT)
+
+        self.assertEqual(result, {'amount': 90, 'category': '餐飲', 'confidence': 0.9, 'original_text': RECEIPT_TEXT})
+        kwargs = agent.client.chat.completions.create.call_args.kwargs
+        self.assertEqual(kwargs['max_tokens'], 32)
+        self.assertEqual(kwargs['response_format'], {'type': 'json_object'})
+        user_prompt = kwargs['messages'][1]['content']
+        self.assertNotIn('御飯糰', user_prompt)
+        self.assertIn('$90', user_prompt)
+        self.assertTrue(any('tokens in=80 out=20' in line for line in logs.output))
+
+        # 同一張收據再次分析時沿用快取的回答
+        agent.analyze_receipt_text(RECEIPT_TEXT)
+        self.assertEqual(agent.client.chat.completions.create.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
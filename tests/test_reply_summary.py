@@ -0,0 +1,34 @@
+from utils.reply_summary import DocumentResult, build_image_reply
+
+import unittest
+
+
+class TestBuildImageReply(unittest.TestCase):
+
+    def test_single_image_keeps_reply(self):
+        results = [[DocumentResult('receipt', '收據 90', amount=90, category='餐飲')]]
+        self.assertEqual(build_image_reply(results), '收據 90')
+        self.assertIsNone(build_image_reply([]))
+
+    def test_burst_summary(self):
+        results = [
+            [DocumentResult('receipt', '', amount=90, category='餐飲')],
+            [DocumentResult('receipt', '', amount=1200, category='交通'),
+             DocumentResult('einvoice', '', amount=60, category='餐飲', detail='AB12345678 未中獎')],
+            [DocumentResult('invoice', '', detail='尚未開獎')],
+            [DocumentResult('unknown', '')],
+        ]
+        self.assertEqual(build_image_reply(results), "\n".join([
+            "❤ 收到 4 張圖片，共 5 張單據 ❤",
+            "支出已追蹤：1,350 元（3 筆）",
+            "- 交通：1,200 元",
+            "- 餐飲：150 元",
+            "發票兌獎 2 張：",
+            "- AB12345678 未中獎",
+            "- 尚未開獎",
+            "無法辨識或分析失敗：1 張",
+        ]))
+
+
+if __name__ == '__main__':
+    unittest.main()
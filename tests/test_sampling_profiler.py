@@ -0,0 +1,87 @@
+from utils.sampling_profiler import SamplingProfiler, aggregate_functions
+
+import os
+import json
+import time
+import tempfile
+import threading
+import unittest
+from collections import Counter
+
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+# pytest 以 tests.test_sampling_profiler 匯入，unittest discover -s tests 則是 test_sampling_profiler
+BUSY_LOOP_PACKAGE = busy_loop.__module__.split('.')[0]
+BUSY_LOOP_LABEL = f"{busy_loop.__module__}:busy_loop"
+
+
+class TestSamplingProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.profiler = SamplingProfiler(self.tmp_dir.name, interval=0.002, include=(BUSY_LOOP_PACKAGE,))
+
+    def tearDown(self):
+        self.profiler.stop()
+        self.tmp_dir.cleanup()
+
+    def run_profile(self, target, seconds=0.2, fraction=None):
+        stop = threading.Event()
+        profile_id = self.profiler.start(seconds, fraction)
+        thread = threading.Thread(target=target, args=(stop,))
+        thread.start()
+        time.sleep(seconds + 0.1)
+        stop.set()
+        thread.join()
+        self.profiler.stop()
+        return profile_id
+
+    def test_duration_profile_outputs(self):
+        self.assertFalse(self.profiler.active)
+        profile_id = self.run_profile(busy_loop)
+        self.assertEqual(self.profiler.profiles(), [profile_id])
+
+        with open(os.path.join(self.tmp_dir.name, f"{profile_id}.collapsed"), encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        self.assertTrue(any(BUSY_LOOP_LABEL in line for line in lines))
+        with open(os.path.join(self.tmp_dir.name, f"{profile_id}.json"), encoding='utf-8') as f:
+            summary = json.load(f)
+        self.assertEqual(summary['mode'], 'duration')
+        self.assertGreater(summary['samples'], 0)
+        functions = {item['function']: item for item in summary['functions']}
+        self.assertGreater(functions[BUSY_LOOP_LABEL]['total'], 0)
+
+    def test_fraction_mode_only_samples_tracked_threads(self):
+        profile_id = self.run_profile(busy_loop, fraction=1.0)
+        with open(os.path.join(self.tmp_dir.name, f"{profile_id}.collapsed"), encoding='utf-8') as f:
+            self.assertEqual(f.read(), '')
+
+        self.assertFalse(self.profiler.should_sample())
+        profile_id = self.run_profile(self.profiler.track(busy_loop), fraction=1.0)
+        with open(os.path.join(self.tmp_dir.name, f"{profile_id}.collapsed"), encoding='utf-8') as f:
+            self.assertIn('busy_loop', f.read())
+
+    def test_only_one_profile_at_a_time(self):
+        self.profiler.start(5)
+        with self.assertRaises(RuntimeError):
+            self.profiler.start(5)
+
+
+class TestAggregateFunctions(unittest.TestCase):
+
+    def test_self_and_total(self):
+        stacks = Counter({('main', 'handle', 'ocr'): 3, ('main', 'handle'): 1, ('main', 'f', 'f'): 1})
+        functions = {item['function']: item for item in aggregate_functions(stacks)}
+        self.assertEqual(functions['main']['total'], 5)
+        self.assertEqual(functions['handle']['self'], 1)
+        self.assertEqual(functions['ocr']['self_pct'], 60.0)
+        # 遞迴只算一次
+        self.assertEqual(functions['f']['total'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
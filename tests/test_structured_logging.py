@@ -0,0 +1,104 @@
+from utils.structured_logging import AsyncLogHandler, JsonFormatter, SamplingFilter, hash_id, log_stats
+
+import os
+import ast
+import json
+import logging
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USER_ID = 'U' + '0123456789abcdef' * 2
+
+
+def make_record(message, level=logging.INFO, **extra):
+    record = logging.LogRecord('test', level, __file__, 1, message, None, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class TestAsyncLogHandler(unittest.TestCase):
+
+    def test_redacts_and_truncates(self):
+        handler = AsyncLogHandler(queue_size=10, max_message_chars=60)
+        record = make_record(f"使用者 {USER_ID} 傳送 " + '很長的內容' * 20, category='message',
+                             fields={'user_id': USER_ID, 'text': '全家 總計 $90', 'amount': 90})
+        handler.handle(record)
+
+        line = json.loads(JsonFormatter().format(handler.queue.get_nowait()))
+        self.assertNotIn(USER_ID, line['message'])
+        self.assertIn(hash_id(USER_ID), line['message'])
+        self.assertTrue(line['message'].endswith('chars)'))
+        self.assertEqual(line['category'], 'message')
+        self.assertEqual(line['fields'], {'user_id': hash_id(USER_ID), 'text': '<redacted 9 chars>', 'amount': 90})
+
+    def test_fields_do_not_overwrite_record_keys(self):
+        handler = AsyncLogHandler(queue_size=10)
+        handler.handle(make_record('單據處理完成', category='ocr',
+                                   fields={'message': '全家 總計 $90', 'level': 'DEBUG', 'ts': 0, 'category': 'x'}))
+
+        line = json.loads(JsonFormatter().format(handler.queue.get_nowait()))
+        self.assertEqual(line['message'], '單據處理完成')
+        self.assertEqual(line['level'], 'INFO')
+        self.assertEqual(line['category'], 'ocr')
+        self.assertNotEqual(line['ts'], 0)
+        self.assertEqual(line['fields']['level'], 'DEBUG')
+
+    def test_drops_when_queue_full(self):
+        handler = AsyncLogHandler(queue_size=1)
+        before = log_stats()['dropped']
+        handler.handle(make_record('first'))
+        handler.handle(make_record('second'))
+        self.assertEqual(handler.queue.qsize(), 1)
+        self.assertEqual(log_stats()['dropped'], before + 1)
+
+
+class TestSamplingFilter(unittest.TestCase):
+
+    def test_samples_by_category(self):
+        sampling = SamplingFilter({'ocr': 0.0})
+        self.assertFalse(sampling.filter(make_record('ocr', category='ocr')))
+        self.assertTrue(sampling.filter(make_record('other', category='webhook')))
+        # WARNING 以上不抽樣
+        self.assertTrue(sampling.filter(make_record('ocr', logging.WARNING, category='ocr')))
+
+
+# 可能含收據、發票或訊息內容的變數名稱；只遮蔽 log_event 的欄位，組進 log 訊息的文字不會被遮蔽
+TEXT_NAMES = {'text', 'ocr_text', 'user_text', 'content', 'prompt_text', 'original_text', 'message_text',
+              'receipt_text'}
+LOG_METHODS = {'debug', 'info', 'warning', 'error', 'exception', 'critical', 'log'}
+
+
+def _text_references(node):
+    # 只記錄長度（len(...)）的不算
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'len':
+        return []
+    if isinstance(node, ast.Name) and node.id in TEXT_NAMES:
+        return [node.id]
+    if isinstance(node, ast.Attribute) and node.attr in TEXT_NAMES:
+        return [node.attr]
+    return [name for child in ast.iter_child_nodes(node) for name in _text_references(child)]
+
+
+class TestNoTextInLogMessages(unittest.TestCase):
+
+    def test_log_calls_do_not_interpolate_text(self):
+        leaks = []
+        for directory in ('app', 'utils'):
+            for name in sorted(os.listdir(os.path.join(ROOT_DIR, directory))):
+                if not name.endswith('.py'):
+                    continue
+                path = os.path.join(ROOT_DIR, directory, name)
+                with open(path, encoding='utf-8') as f:
+                    tree = ast.parse(f.read(), path)
+                for node in ast.walk(tree):
+                    if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                            and node.func.attr in LOG_METHODS and isinstance(node.func.value, ast.Name)
+                            and node.func.value.id in ('logging', 'logger')):
+                        continue
+                    for arg in node.args:
+                        leaks.extend(f"{directory}/{name}:{node.lineno} {ref}" for ref in _text_references(arg))
+        self.assertEqual(leaks, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+from utils.vision_batcher import VisionBatcher
+
+import threading
+import unittest
+from unittest.mock import MagicMock
+from google.cloud import vision
+
+
+def fake_client(calls):
+    client = MagicMock()
+
+    def batch_annotate_images(requests, timeout=None):
+        calls.append(len(requests))
+        return vision.BatchAnnotateImagesResponse(responses=[
+            {'text_annotations': [{'description': request.image.content.decode()}]} for request in requests
+        ])
+
+    client.batch_annotate_images.side_effect = batch_annotate_images
+    return client
+
+
+class TestVisionBatcher(unittest.TestCase):
+
+    def test_results_routed_to_each_caller(self):
+        calls = []
+        batcher = VisionBatcher(lambda: fake_client(calls), window=0.2, max_batch_size=16)
+        results = {}
+
+        def worker(i):
+            results[i] = batcher.annotate(f"image-{i}".encode(), timeout=5).text_annotations[0].description
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, {i: f"image-{i}" for i in range(5)})
+        self.assertEqual(sum(calls), 5)
+        self.assertLess(len(calls), 5)
+        stats = batcher.stats()
+        self.assertEqual(stats['images'], 5)
+        self.assertEqual(stats['batches'], len(calls))
+
+    def test_max_batch_size(self):
+        calls = []
+        batcher = VisionBatcher(lambda: fake_client(calls), window=0.5, max_batch_size=2)
+        futures = [batcher.submit(b'x') for _ in range(4)]
+        for future in futures:
+            future.result(timeout=5)
+        self.assertTrue(all(size <= 2 for size in calls))
+
+    def test_missing_responses_fail_remaining_callers(self):
+        client = MagicMock()
+        client.batch_annotate_images.return_value = vision.BatchAnnotateImagesResponse(responses=[{}])
+        batcher = VisionBatcher(lambda: client, window=0.2, max_batch_size=2)
+        first, second = batcher.submit(b'a'), batcher.submit(b'b')
+        self.assertIsNotNone(first.result(timeout=5))
+        with self.assertRaises(RuntimeError):
+            second.result(timeout=5)
+        self.assertEqual(batcher.stats()['errors'], 1)
+
+    def test_error_propagates(self):
+        client = MagicMock()
+        client.batch_annotate_images.side_effect = Exception('quota exceeded')
+        batcher = VisionBatcher(lambda: client, window=0.01)
+        with self.assertRaises(Exception):
+            batcher.annotate(b'x', timeout=5)
+        self.assertEqual(batcher.stats()['errors'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+from utils.weather_images import WeatherImageCache
+
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from PIL import Image
+
+RADAR_URL = 'https://cwaopendata.s3.ap-northeast-1.amazonaws.com/Observation/O-A0058-001.png'
+
+
+def make_png(size=(1200, 900)):
+    output = io.BytesIO()
+    Image.new('RGB', size, 'navy').save(output, 'PNG')
+    return output.getvalue()
+
+
+def image_response(last_modified, etag='"v1"'):
+    return MagicMock(status_code=200, content=make_png(),
+                     headers={'Content-Type': 'image/png', 'ETag': etag, 'Last-Modified': last_modified})
+
+
+class TestWeatherImageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = WeatherImageCache(self.tmp_dir.name, keep=2, check_interval=0)
+        self.cache.session = MagicMock()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_download_once_and_make_preview(self):
+        self.cache.session.get.side_effect = [
+            image_response('Mon, 25 Nov 2024 05:30:00 GMT'),
+            MagicMock(status_code=304, headers={}),
+        ]
+        first = self.cache.get('radar', RADAR_URL)
+        self.assertEqual(first.original, 'radar-20241125053000.png')
+        self.assertEqual(first.preview, 'radar-20241125053000-preview.jpg')
+        with Image.open(os.path.join(self.tmp_dir.name, first.preview)) as preview:
+            self.assertLessEqual(max(preview.size), 240)
+
+        # 上游沒有更新 (304) 時沿用同一組檔案
+        self.assertEqual(self.cache.get('radar', RADAR_URL), first)
+        _, kwargs = self.cache.session.get.call_args
+        self.assertEqual(kwargs['headers']['If-None-Match'], '"v1"')
+
+    def test_check_interval_shares_upstream(self):
+        self.cache.check_interval = 60
+        self.cache.session.get.return_value = image_response('Mon, 25 Nov 2024 05:30:00 GMT')
+        for _ in range(3):
+            self.cache.get('radar', RADAR_URL)
+        self.assertEqual(self.cache.session.get.call_count, 1)
+
+    def test_prune_and_stale_fallback(self):
+        self.cache.session.get.side_effect = [
+            image_response('Mon, 25 Nov 2024 05:30:00 GMT', '"v1"'),
+            image_response('Mon, 25 Nov 2024 05:40:00 GMT', '"v2"'),
+            image_response('Mon, 25 Nov 2024 05:50:00 GMT', '"v3"'),
+            MagicMock(status_code=503, headers={}),
+        ]
+        for _ in range(3):
+            latest = self.cache.get('radar', RADAR_URL)
+        # 每個產品只保留最新的 2 組（原圖 + 預覽圖）
+        self.assertEqual(sorted(os.listdir(self.tmp_dir.name)), [
+            'radar-20241125054000-preview.jpg', 'radar-20241125054000.png',
+            'radar-20241125055000-preview.jpg', 'radar-20241125055000.png',
+        ])
+        # 上游失敗時回傳上一次的圖片
+        self.assertEqual(self.cache.get('radar', RADAR_URL), latest)
+
+    def test_prune_tolerates_concurrent_removal(self):
+        for timestamp in ('20241125053000', '20241125054000', '20241125055000'):
+            open(os.path.join(self.tmp_dir.name, f"radar-{timestamp}.png"), 'wb').close()
+        # 其他 worker 同時清理，檔案已經不存在
+        with patch('utils.weather_images.os.remove', side_effect=FileNotFoundError) as remove:
+            self.cache._prune('radar')
+        remove.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
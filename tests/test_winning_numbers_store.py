@@ -0,0 +1,77 @@
+from utils.winning_numbers_store import WinningNumbersStore, sync_winning_numbers
+from utils import invoice_processing
+
+import os
+import json
+import tempfile
+import unittest
+
+WINNING_NUMBERS = {
+    'special_prize': ['12345678'],
+    'grand_prize': ['23456789'],
+    'first_prize': ['34567890', '45678901', '56789012'],
+    'additional_sixth_prize': ['890', '901', '012'],
+}
+
+
+class TestWinningNumbersStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = WinningNumbersStore(os.path.join(self.tmp_dir.name, 'winning_numbers.db'))
+
+    def tearDown(self):
+        invoice_processing.set_winning_numbers_store(None)
+        self.store.db.close()
+        self.tmp_dir.cleanup()
+
+    def test_put_and_get(self):
+        period_info = {'year': 2024, 'period': 6}
+        self.assertIsNone(self.store.get(period_info))
+        self.assertTrue(self.store.put(period_info, WINNING_NUMBERS))
+        self.assertFalse(self.store.put(period_info, WINNING_NUMBERS))
+        self.assertEqual(self.store.get(period_info), WINNING_NUMBERS)
+
+        # 其他 process 開啟同一個檔案也讀得到
+        other = WinningNumbersStore(self.store.db.path)
+        self.assertEqual(other.get(period_info), WINNING_NUMBERS)
+
+    def test_import_json_and_csv(self):
+        json_path = os.path.join(self.tmp_dir.name, 'numbers.json')
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump([dict(year=2024, period=5, **WINNING_NUMBERS)], f)
+        csv_path = os.path.join(self.tmp_dir.name, 'numbers.csv')
+        with open(csv_path, 'w', encoding='utf-8') as f:
+            f.write("year,period,special_prize,grand_prize,first_prize,additional_sixth_prize\n")
+            f.write("2024,4,12345678,23456789,34567890 45678901 56789012,890 901 012\n")
+
+        self.assertEqual(self.store.import_file(json_path), 1)
+        self.assertEqual(self.store.import_file(csv_path), 1)
+        self.assertEqual(self.store.get({'year': 2024, 'period': 4}), WINNING_NUMBERS)
+        self.assertEqual(self.store.periods(), [{'year': 2024, 'period': 4}, {'year': 2024, 'period': 5}])
+
+    def test_sync_winning_numbers(self):
+        pages = {
+            'index': ({'year': 2024, 'period': 6}, WINNING_NUMBERS),
+            'last': ({'year': 2024, 'period': 5}, WINNING_NUMBERS),
+        }
+
+        def fetch_page(url):
+            if url == 'broken':
+                raise Exception('timeout')
+            return pages[url]
+
+        updated = sync_winning_numbers(self.store, fetch_page, ['index', 'last', 'broken'])
+        self.assertEqual(len(updated), 2)
+        self.assertEqual(sync_winning_numbers(self.store, fetch_page, ['index', 'last']), [])
+
+    def test_lookup_reads_local_store(self):
+        period_info = {'year': 2020, 'period': 1}
+        self.store.put(period_info, WINNING_NUMBERS)
+        invoice_processing.set_winning_numbers_store(self.store)
+        self.assertEqual(invoice_processing.get_winning_numbers_for_period(period_info), WINNING_NUMBERS)
+        self.assertIsNone(invoice_processing.get_winning_numbers_for_period({'year': 2020, 'period': 2}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,14 +1,43 @@
 import os
 import json
+import time
+import hashlib
 import logging
-from typing import Optional, Any, Dict
+from typing import Optional, Any, Dict, List, Awaitable
 
-try:
-    import google.generativeai as genai
-except ImportError:
-    genai = None
+from utils.receipt_prompt import compact_receipt_text
+from utils.cache import TieredCache
+from utils.circuit_breaker import get_circuit_breaker
 
-from openai import OpenAI
+# 回應只有 amount / category / confidence 三個欄位，限制輸出長度避免模型多說
+LLM_MAX_OUTPUT_TOKENS = int(os.environ.get('LLM_MAX_OUTPUT_TOKENS', '64'))
+# 壓縮後送給模型的 OCR 文字長度上限（字元）
+RECEIPT_PROMPT_MAX_CHARS = int(os.environ.get('RECEIPT_PROMPT_MAX_CHARS', '600'))
+# 同一張收據重複上傳時直接沿用模型的回答
+LLM_CACHE_SECONDS = float(os.environ.get('LLM_CACHE_SECONDS', 24 * 3600))
+
+_answer_cache = TieredCache('llm_answers', max_entries=256, default_ttl=LLM_CACHE_SECONDS)
+# 模型連續失敗時暫停呼叫，直接回傳預設結果
+_llm_circuit = get_circuit_breaker('llm')
+
+
+def _load_genai():
+    # google-generativeai 載入很慢，用到 gemini 時才匯入
+    try:
+        import google.generativeai as genai
+    except ImportError:
+        genai = None
+    return genai
+
+
+def _load_openai():
+    from openai import OpenAI
+    return OpenAI
+
+
+def _load_async_openai():
+    from openai import AsyncOpenAI
+    return AsyncOpenAI
 
 
 class ReceiptAIAgent:
@@ -24,6 +53,7 @@ class ReceiptAIAgent:
         model: str = "gpt-3.5-turbo",
         temperature: float = 0.2,
         provider: str = "openai",
+        max_output_tokens: int = LLM_MAX_OUTPUT_TOKENS,
     ):
         """
         Init AI agent Object
@@ -33,32 +63,32 @@ class ReceiptAIAgent:
         self.provider = provider.lower()
         self.model = model
         self.temperature = temperature
+        self.max_output_tokens = max_output_tokens
         self.api_key = api_key
+        self._async_client = None
 
         if self.provider == "gemini":
             if api_key is None:
                 api_key = os.environ.get("GEMINI_API_KEY", "YOUR_GEMINI_API_KEY")
+            genai = _load_genai()
             if genai is None:
                 raise ImportError("google-generativeai 未安裝，請先安裝 google-generativeai 套件。")
             genai.configure(api_key=api_key)
-            self.gemini_model = genai.GenerativeModel("gemini-2.0-flash")
+            self.model = "gemini-2.0-flash"
+            self.gemini_model = genai.GenerativeModel(self.model)
         elif self.provider == "openai":
             if api_key is None:
                 api_key = os.environ.get("OPENAI_API_KEY", "YOUR_API_KEY")
-            self.client = OpenAI(api_key=api_key)
+            self.client = _load_openai()(api_key=api_key)
         else:
             raise ValueError(f"不支援的 AI provider: {self.provider}")
 
         # System Hint:Tell AI How to respond
+        # 只要求最少的欄位，不請模型回傳原文，輸出 token 越少回應越快
         self.system_prompt = (
-            "你是一個專家，擅長分析收據或發票的文字內容。"
-            "請根據使用者提供的文字，判斷花了多少錢（總金額），以及屬於什麼消費種類（例如：餐飲、服飾、雜貨...）。"
-            "最後，請以 JSON 格式回傳，包含以下欄位：\n"
-            "amount: number,\n"
-            "category: string,\n"
-            "confidence: number,\n"
-            "original_text: string,\n"
-            "請確保是合法的 JSON。"
+            "你擅長分析收據或發票的文字。"
+            "根據使用者提供的店家與金額相關文字，判斷總金額與消費種類（例如：餐飲、服飾、雜貨...）。"
+            '只回傳 JSON：{"amount": number|null, "category": string, "confidence": 0~1}'
         )
 
     def analyze_receipt_text(self, ocr_text: str) -> Dict[str, Any]:
@@ -69,62 +99,187 @@ class ReceiptAIAgent:
             logging.warning("OCR文字為空，無法分析。")
             return self._default_response(ocr_text)
 
-        user_prompt = (
-            f"以下是從收據或發票 OCR 得到的文字：\n{ocr_text}\n"
-            "請分析並找出最可能的總金額（若有多個金額，取最可能的），"
-            "消費類別（如餐飲、生活用品...），以及給我一個0~1的信心度。"
-            "請回傳JSON字串(務必合法json，```之後不需有json這四個英文字): { amount, category, confidence, original_text }"
-        )
+        prompt_text = self._compact(ocr_text)
+        try:
+            content = _answer_cache.get_or_load(
+                self._cache_key(prompt_text),
+                lambda: self._checked_content(_llm_circuit.call(self._complete, ocr_text, prompt_text)))
+            return self._parse_content(content, ocr_text)
 
+        except Exception as e:
+            logging.error(f"呼叫 {self.provider} 過程發生錯誤：%s", e)
+            return self._default_response(ocr_text)
+
+    async def analyze_receipt_text_async(self, ocr_text: str) -> Dict[str, Any]:
+        """
+        analyze_receipt_text 的非同步版本，等待模型回應時不佔用 event loop
+        """
+        if not ocr_text.strip():
+            logging.warning("OCR文字為空，無法分析。")
+            return self._default_response(ocr_text)
+
+        prompt_text = self._compact(ocr_text)
         try:
-            if self.provider == "openai":
-                chat_completion = self.client.chat.completions.create(
-                    messages=[
-                        {"role": "system", "content": self.system_prompt},
-                        {"role": "user", "content": user_prompt},
-                    ],
-                    model=self.model,
-                    temperature=self.temperature,
-                )
-                if not chat_completion.choices:
-                    logging.error("OpenAI 回傳的 choices 為空。")
-                    return self._default_response(ocr_text)
-                content = chat_completion.choices[0].message.content.strip()
-            elif self.provider == "gemini":
-                response = self.gemini_model.generate_content([
-                    {"role": "user", "parts": [self.system_prompt + "\n" + user_prompt]}
-                ])
-                content = response.text.strip()
-                # 處理 Gemini 可能回傳的 ```json ... ``` 或 ``` ... ``` 區塊
-                if content.startswith("```json"):
-                    content = content.removeprefix("```json").strip()
-                if content.startswith("```"):
-                    content = content.removeprefix("```").strip()
-                if content.endswith("```"):
-                    content = content.removesuffix("```").strip()
-            else:
-                raise ValueError(f"不支援的 AI provider: {self.provider}")
-
-            # 嘗試解析JSON
-            try:
-                parsed_json = json.loads(content)
-            except json.JSONDecodeError:
-                logging.error("無法將模型回應解析為 JSON：%s", content)
-                return self._default_response(ocr_text)
-
-            # 組合結果
-            result = {
-                "amount": parsed_json.get("amount", None),
-                "category": parsed_json.get("category", None),
-                "confidence": parsed_json.get("confidence", 0),
-                "original_text": parsed_json.get("original_text", ocr_text),
-            }
-            return result
+            content = await _answer_cache.get_or_load_async(
+                self._cache_key(prompt_text),
+                lambda: self._checked_content_async(
+                    _llm_circuit.call_async(self._complete_async, ocr_text, prompt_text)),
+            )
+            return self._parse_content(content, ocr_text)
 
         except Exception as e:
             logging.error(f"呼叫 {self.provider} 過程發生錯誤：%s", e)
             return self._default_response(ocr_text)
 
+    def _complete(self, ocr_text: str, prompt_text: str) -> Optional[str]:
+        started = time.perf_counter()
+        if self.provider == "openai":
+            chat_completion = self.client.chat.completions.create(
+                messages=self._openai_messages(prompt_text),
+                **self._openai_options(),
+            )
+            self._log_usage(started, ocr_text, prompt_text, *self._openai_usage(chat_completion))
+            return self._openai_content(chat_completion)
+        if self.provider == "gemini":
+            response = self.gemini_model.generate_content(
+                self._gemini_contents(prompt_text), generation_config=self._gemini_config())
+            self._log_usage(started, ocr_text, prompt_text, *self._gemini_usage(response))
+            return self._gemini_content(response)
+        raise ValueError(f"不支援的 AI provider: {self.provider}")
+
+    async def _complete_async(self, ocr_text: str, prompt_text: str) -> Optional[str]:
+        started = time.perf_counter()
+        if self.provider == "openai":
+            chat_completion = await self._get_async_client().chat.completions.create(
+                messages=self._openai_messages(prompt_text),
+                **self._openai_options(),
+            )
+            self._log_usage(started, ocr_text, prompt_text, *self._openai_usage(chat_completion))
+            return self._openai_content(chat_completion)
+        if self.provider == "gemini":
+            response = await self.gemini_model.generate_content_async(
+                self._gemini_contents(prompt_text), generation_config=self._gemini_config())
+            self._log_usage(started, ocr_text, prompt_text, *self._gemini_usage(response))
+            return self._gemini_content(response)
+        raise ValueError(f"不支援的 AI provider: {self.provider}")
+
+    def _cache_key(self, prompt_text: str) -> str:
+        # 模型或提示詞改變時不沿用舊的回答
+        digest = hashlib.sha256(f"{self.system_prompt}\n{prompt_text}".encode('utf-8')).hexdigest()
+        return f"{self.provider}:{self.model}:{digest}"
+
+    def _get_async_client(self):
+        # AsyncOpenAI 需在 event loop 中使用，第一次非同步呼叫時才建立
+        if self._async_client is None:
+            self._async_client = _load_async_openai()(api_key=self.client.api_key)
+        return self._async_client
+
+    @staticmethod
+    def _compact(ocr_text: str) -> str:
+        return compact_receipt_text(ocr_text, RECEIPT_PROMPT_MAX_CHARS) or ocr_text.strip()
+
+    def _user_prompt(self, prompt_text: str) -> str:
+        return f"收據 OCR 文字（僅店家與金額相關行）：\n{prompt_text}"
+
+    def _openai_options(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "temperature": self.temperature,
+            "max_tokens": self.max_output_tokens,
+            "response_format": {"type": "json_object"},
+        }
+
+    def _gemini_config(self) -> Dict[str, Any]:
+        return {
+            "temperature": self.temperature,
+            "max_output_tokens": self.max_output_tokens,
+            "response_mime_type": "application/json",
+        }
+
+    @staticmethod
+    def _openai_usage(chat_completion):
+        usage = getattr(chat_completion, "usage", None)
+        return getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None)
+
+    @staticmethod
+    def _gemini_usage(response):
+        usage = getattr(response, "usage_metadata", None)
+        return getattr(usage, "prompt_token_count", None), getattr(usage, "candidates_token_count", None)
+
+    def _log_usage(self, started: float, ocr_text: str, prompt_text: str, tokens_in, tokens_out):
+        logging.info(
+            f"LLM {self.provider}/{self.model}：tokens in={tokens_in} out={tokens_out}，"
+            f"{(time.perf_counter() - started) * 1000:.0f} ms，OCR 文字 {len(ocr_text)} -> {len(prompt_text)} 字元"
+        )
+
+    def _openai_messages(self, prompt_text: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": self._user_prompt(prompt_text)},
+        ]
+
+    def _gemini_contents(self, prompt_text: str) -> List[Dict[str, Any]]:
+        return [{"role": "user", "parts": [self.system_prompt + "\n" + self._user_prompt(prompt_text)]}]
+
+    @staticmethod
+    def _openai_content(chat_completion) -> Optional[str]:
+        if not chat_completion.choices:
+            logging.error("OpenAI 回傳的 choices 為空。")
+            return None
+        return chat_completion.choices[0].message.content.strip()
+
+    @staticmethod
+    def _gemini_content(response) -> str:
+        content = response.text.strip()
+        # 處理 Gemini 可能回傳的 ```json ... ``` 或 ``` ... ``` 區塊
+        if content.startswith("```json"):
+            content = content.removeprefix("```json").strip()
+        if content.startswith("```"):
+            content = content.removeprefix("```").strip()
+        if content.endswith("```"):
+            content = content.removesuffix("```").strip()
+        return content
+
+    @staticmethod
+    def _checked_content(content: Optional[str]) -> str:
+        """
+        只有能解析成 JSON 物件的回應才寫入快取，空白、截斷或非 JSON 的回應直接拋出例外，下次重新詢問模型；
+        回應內容來自收據，例外訊息只記錄長度
+        """
+        if content is None:
+            raise ValueError("模型沒有回應內容")
+        try:
+            parsed_json = json.loads(content)
+        except json.JSONDecodeError:
+            raise ValueError(f"無法將模型回應解析為 JSON（{len(content)} 字）")
+        if not isinstance(parsed_json, dict):
+            raise ValueError(f"模型回應不是 JSON 物件（{len(content)} 字）")
+        return content
+
+    async def _checked_content_async(self, completion: Awaitable[Optional[str]]) -> str:
+        return self._checked_content(await completion)
+
+    def _parse_content(self, content: Optional[str], ocr_text: str) -> Dict[str, Any]:
+        if content is None:
+            return self._default_response(ocr_text)
+
+        # 嘗試解析JSON
+        try:
+            parsed_json = json.loads(content)
+        except json.JSONDecodeError:
+            logging.error("無法將模型回應解析為 JSON（%d 字）", len(content))
+            return self._default_response(ocr_text)
+
+        # 組合結果
+        result = {
+            "amount": parsed_json.get("amount", None),
+            "category": parsed_json.get("category", None),
+            "confidence": parsed_json.get("confidence", 0),
+            # 原文不再請模型回傳，直接沿用輸入
+            "original_text": ocr_text,
+        }
+        return result
+
     def _default_response(self, original_text: str) -> Dict[str, Any]:
         """
         Return Default json struct if call or analyze failure
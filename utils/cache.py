@@ -0,0 +1,412 @@
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Any, Dict, Callable, Awaitable, Tuple
+
+from utils.sqlite_utils import SQLiteDatabase
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    size INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_cache_entries_updated ON cache_entries (updated_at);
+"""
+
+# SQLite 每寫入這麼多次檢查一次總大小
+EVICT_EVERY = 100
+# 等待其他 worker 載入同一個 key 時的輪詢間隔（秒）
+LOCK_POLL_INTERVAL = 0.05
+
+
+def _load_redis():
+    # redis 為選用套件，使用 Redis 作為共用快取時才需要安裝
+    try:
+        import redis
+    except ImportError:
+        raise ImportError("redis 未安裝，請先安裝 redis 套件或改用 sqlite 快取。")
+    return redis
+
+
+class SQLiteCacheBackend:
+    """
+    單機共用的第二層快取：所有 gunicorn worker 讀寫同一個 SQLite (WAL) 檔案。
+    總大小超過 max_bytes 時先刪除過期的項目，再由最早寫入的開始淘汰。
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024):
+        self.db = SQLiteDatabase(path, CACHE_SCHEMA)
+        self.max_bytes = max_bytes
+        self._writes = 0
+
+    def get(self, key: str) -> Optional[str]:
+        row = self.db.connection().execute(
+            "SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row['expires_at'] <= time.time():
+            return None
+        return row['value']
+
+    def set(self, key: str, value: str, ttl: float):
+        now = time.time()
+        self.db.connection().execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, expires_at, updated_at, size) VALUES (?, ?, ?, ?, ?)",
+            (key, value, now + ttl, now, len(key) + len(value)),
+        )
+        self._writes += 1
+        if self._writes % EVICT_EVERY == 0:
+            self.evict()
+
+    def add(self, key: str, value: str, ttl: float) -> bool:
+        """
+        key 不存在（或已過期）時才寫入，回傳是否寫入成功；用來實作跨 process 的鎖
+        """
+        now = time.time()
+        with self.db.transaction() as conn:
+            row = conn.execute("SELECT expires_at FROM cache_entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and row['expires_at'] > now:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at, updated_at, size) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, now + ttl, now, len(key) + len(value)),
+            )
+        return True
+
+    def delete(self, key: str):
+        self.db.connection().execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def delete_if(self, key: str, value: str) -> bool:
+        """
+        值仍為 value 時才刪除；用來釋放自己持有的鎖，不會刪到別人重新取得的鎖
+        """
+        cursor = self.db.connection().execute("DELETE FROM cache_entries WHERE key = ? AND value = ?", (key, value))
+        return cursor.rowcount > 0
+
+    def evict(self) -> int:
+        """
+        刪除過期項目，並淘汰超過 max_bytes 的最舊項目，回傳刪除筆數
+        """
+        with self.db.transaction() as conn:
+            deleted = conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),)).rowcount
+            deleted += conn.execute(
+                "DELETE FROM cache_entries WHERE key IN ("
+                "SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY updated_at DESC, key) AS running "
+                "FROM cache_entries) WHERE running > ?)",
+                (self.max_bytes,),
+            ).rowcount
+        return deleted
+
+
+# 比對與刪除在 Redis 端一次完成
+_REDIS_DELETE_IF = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisCacheBackend:
+    """
+    跨機器共用的第二層快取，可連到任何支援 Redis 協定的伺服器。
+    大小上限由伺服器的 maxmemory 與淘汰策略（建議 allkeys-lru）負責。
+    """
+
+    def __init__(self, url: str):
+        self.client = _load_redis().Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key: str, value: str, ttl: float):
+        self.client.set(key, value, px=max(int(ttl * 1000), 1))
+
+    def add(self, key: str, value: str, ttl: float) -> bool:
+        return bool(self.client.set(key, value, px=max(int(ttl * 1000), 1), nx=True))
+
+    def delete(self, key: str):
+        self.client.delete(key)
+
+    def delete_if(self, key: str, value: str) -> bool:
+        return bool(self.client.eval(_REDIS_DELETE_IF, 1, key, value))
+
+
+class _LocalLocks:
+    """
+    沒有第二層快取時，同一個 process 內的載入鎖
+    """
+
+    def __init__(self):
+        self._locks: Dict[str, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, key: str, value: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            if self._locks.get(key, (0, None))[0] > now:
+                return False
+            self._locks[key] = (now + ttl, value)
+            return True
+
+    def get(self, key: str) -> Optional[str]:
+        return None
+
+    def delete(self, key: str):
+        with self._lock:
+            self._locks.pop(key, None)
+
+    def delete_if(self, key: str, value: str) -> bool:
+        with self._lock:
+            if self._locks.get(key, (0, None))[1] != value:
+                return False
+            del self._locks[key]
+            return True
+
+
+# 由 app 透過 configure_cache_backend 設定，所有 TieredCache 共用
+_default_backend = None
+_local_locks = _LocalLocks()
+_registry: Dict[str, 'TieredCache'] = {}
+
+
+def configure_cache_backend(backend):
+    """
+    設定所有快取共用的第二層快取，None 表示只使用 process 內的 LRU
+    """
+    global _default_backend
+    _default_backend = backend
+
+
+def create_cache_backend(kind: str, path: Optional[str] = None, max_bytes: int = 64 * 1024 * 1024,
+                         url: Optional[str] = None):
+    """
+    依設定建立第二層快取：'sqlite'、'redis' 或 'none'
+    """
+    if kind == 'sqlite':
+        return SQLiteCacheBackend(path, max_bytes)
+    if kind == 'redis':
+        return RedisCacheBackend(url)
+    if kind == 'none':
+        return None
+    raise ValueError(f"不支援的快取類型: {kind}")
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    各 namespace 的命中統計
+    """
+    return {namespace: cache.stats() for namespace, cache in sorted(_registry.items())}
+
+
+class TieredCache:
+    """
+    兩層快取：第一層為 process 內的 LRU，第二層為共用的 SQLite 或 Redis。
+    值必須可以轉成 JSON，None 不會被快取。
+    get_or_load 同一時間只讓一個 worker 執行 loader（以第二層的 add 作為鎖），
+    其他 worker 等待結果寫入，避免快取過期時同時打爆上游。
+    """
+
+    def __init__(self, namespace: str, max_entries: int = 256, default_ttl: float = 300,
+                 backend=None, lock_ttl: float = 30):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.lock_ttl = lock_ttl
+        self._backend = backend
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._counts = {'l1_hits': 0, 'l2_hits': 0, 'misses': 0, 'loads': 0, 'waits': 0, 'evictions': 0}
+        _registry[namespace] = self
+
+    @property
+    def backend(self):
+        return self._backend if self._backend is not None else _default_backend
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self._get_local(key)
+        if value is not None:
+            return value
+        value = self._get_shared(key)
+        return default if value is None else value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        if value is None:
+            return
+        ttl = self.default_ttl if ttl is None else ttl
+        self._set_local(key, value, ttl)
+        backend = self.backend
+        if backend is not None:
+            try:
+                backend.set(self._key(key), json.dumps(value, ensure_ascii=False), ttl)
+            except Exception as e:
+                logging.warning(f"寫入快取 {self.namespace} 失敗：{e}")
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.backend is not None:
+            self.backend.delete(self._key(key))
+
+    def clear_local(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_load(self, key: str, loader: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        value = self.get(key)
+        if value is not None:
+            return value
+        deadline = time.time() + self.lock_ttl
+        waited = False
+        token = self._acquire(key)
+        while token is None:
+            # 其他 worker 正在載入，等它寫入結果；等太久就自己載入
+            waited = True
+            self._count('waits')
+            time.sleep(LOCK_POLL_INTERVAL)
+            value = self._get_shared(key, count_miss=False)
+            if value is not None:
+                return value
+            if time.time() >= deadline:
+                break
+            token = self._acquire(key)
+        try:
+            # 取得鎖前可能剛好有人寫入並釋放，等待過就再查一次
+            value = self._recheck(key) if waited else None
+            if value is not None:
+                return value
+            value = self._load(loader)
+            self.set(key, value, ttl)
+            return value
+        finally:
+            self._release(key, token)
+
+    async def get_or_load_async(self, key: str, loader: Callable[[], Awaitable[Any]],
+                                ttl: Optional[float] = None) -> Any:
+        """
+        get_or_load 的非同步版本，第二層快取的存取在 thread 中執行
+        """
+        value = self._get_local(key)
+        if value is not None:
+            return value
+        value = await asyncio.to_thread(self._get_shared, key)
+        if value is not None:
+            return value
+        deadline = time.time() + self.lock_ttl
+        waited = False
+        token = await asyncio.to_thread(self._acquire, key)
+        while token is None:
+            waited = True
+            self._count('waits')
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            value = self._get_local(key)
+            if value is None:
+                value = await asyncio.to_thread(self._get_shared, key, False)
+            if value is not None:
+                return value
+            if time.time() >= deadline:
+                break
+            token = await asyncio.to_thread(self._acquire, key)
+        try:
+            value = await asyncio.to_thread(self._recheck, key) if waited else None
+            if value is not None:
+                return value
+            self._count('loads')
+            value = await loader()
+            await asyncio.to_thread(self.set, key, value, ttl)
+            return value
+        finally:
+            await asyncio.to_thread(self._release, key, token)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counts, entries=len(self._entries))
+        lookups = stats['l1_hits'] + stats['l2_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['l1_hits'] + stats['l2_hits']) / lookups, 3) if lookups else 0.0
+        return stats
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counts[name] += 1
+
+    def _get_local(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self._counts['l1_hits'] += 1
+            return value
+
+    def _set_local(self, key: str, value: Any, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counts['evictions'] += 1
+
+    def _get_shared(self, key: str, count_miss: bool = True) -> Any:
+        # 第二層命中時一併放入第一層，第一層的有效期不超過 default_ttl
+        backend = self.backend
+        value = None
+        if backend is not None:
+            try:
+                raw = backend.get(self._key(key))
+                value = json.loads(raw) if raw is not None else None
+            except Exception as e:
+                logging.warning(f"讀取快取 {self.namespace} 失敗：{e}")
+        if value is None:
+            if count_miss:
+                self._count('misses')
+            return None
+        self._count('l2_hits')
+        self._set_local(key, value, self.default_ttl)
+        return value
+
+    def _recheck(self, key: str) -> Any:
+        value = self._get_local(key)
+        return value if value is not None else self._get_shared(key, count_miss=False)
+
+    def _load(self, loader: Callable[[], Any]) -> Any:
+        self._count('loads')
+        return loader()
+
+    def _locks(self):
+        return self.backend if self.backend is not None else _local_locks
+
+    def _acquire(self, key: str) -> Optional[str]:
+        """
+        取得載入鎖並回傳這次持有的 token，鎖被別人持有時回傳 None
+        """
+        token = uuid.uuid4().hex
+        try:
+            return token if self._locks().add(self._key(key) + ':lock', token, self.lock_ttl) else None
+        except Exception as e:
+            # 鎖取不到不影響功能，直接載入
+            logging.warning(f"取得快取鎖 {self.namespace} 失敗：{e}")
+            return ''
+
+    def _release(self, key: str, token: Optional[str]):
+        # 只刪除自己持有的鎖；等待逾時（沒有取得鎖）或鎖已過期被別人取得時不動
+        if not token:
+            return
+        try:
+            self._locks().delete_if(self._key(key) + ':lock', token)
+        except Exception as e:
+            logging.warning(f"釋放快取鎖 {self.namespace} 失敗：{e}")
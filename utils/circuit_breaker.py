@@ -0,0 +1,133 @@
+import time
+import logging
+import threading
+from typing import Dict, Any, Callable, Awaitable
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """
+    外部服務的斷路器已開啟，暫時不呼叫
+    """
+
+
+class CircuitBreaker:
+    """
+    外部服務（Vision、LLM、CWA）的斷路器。
+    連續失敗 failure_threshold 次後開啟，reset_timeout 秒內直接拒絕呼叫，不再等待逾時；
+    之後放行一次試探呼叫，成功則關閉，失敗則重新計時；試探超過 reset_timeout 仍未回報視為失效，
+    再放行下一次試探。狀態只存在各 process 中。
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._trial_started_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """
+        是否可以呼叫；開啟超過 reset_timeout 後只放行一次試探
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            now = time.monotonic()
+            if now - self._opened_at < self.reset_timeout:
+                return False
+            if self._trial_in_flight and now - self._trial_started_at < self.reset_timeout:
+                return False
+            self._state = HALF_OPEN
+            self._trial_in_flight = True
+            self._trial_started_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logging.info(f"斷路器 {self.name} 恢復")
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state == CLOSED:
+                    logging.warning(f"斷路器 {self.name} 開啟：連續失敗 {self._failures} 次")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def call(self, func: Callable, *args):
+        """
+        經過斷路器呼叫 func，例外視為失敗；開啟時拋出 CircuitOpenError
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} 暫時無法使用")
+        try:
+            result = func(*args)
+        except BaseException:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    async def call_async(self, func: Callable[..., Awaitable[Any]], *args):
+        """
+        同 call；被取消（例如整體期限已到）也視為失敗，釋放半開狀態的試探
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} 暫時無法使用")
+        try:
+            result = await func(*args)
+        except BaseException:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        state = self.state
+        with self._lock:
+            return {'state': state, 'failures': self._failures}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str, failure_threshold: int = 5, reset_timeout: float = 30) -> CircuitBreaker:
+    """
+    取得同名的斷路器，第一次呼叫時建立
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name, failure_threshold, reset_timeout)
+        return breaker
+
+
+def circuit_states() -> Dict[str, Dict[str, Any]]:
+    """
+    所有斷路器目前的狀態
+    """
+    with _breakers_lock:
+        breakers = sorted(_breakers.items())
+    return {name: breaker.snapshot() for name, breaker in breakers}
@@ -1,11 +1,21 @@
 import os
+import asyncio
 import logging
-import aiohttp
 import json
-from typing import Optional, List
+from typing import Optional, List, Dict, Any, Awaitable
+
+from utils.cache import TieredCache
+from utils.circuit_breaker import get_circuit_breaker
 
 CWA_API_BASE = "https://opendata.cwa.gov.tw/fileapi/v1/opendataapi/"
 CWA_API_KEY = os.environ.get("CWA_API_KEY", "YOUR_CWA_API_KEY")
+# ProductURL 幾乎不會變動，這段時間內重複查詢直接使用上次的結果，減少對中央氣象署 API 的請求
+CWA_URL_CACHE_SECONDS = float(os.environ.get("CWA_URL_CACHE_SECONDS", 300))
+# 單次查詢（含 302 轉址後下載 JSON）的總時限，需短於 @天氣 的整體期限，上游卡住時以失敗結束而不是被取消
+CWA_TIMEOUT = float(os.environ.get("CWA_TIMEOUT", 5))
+
+_product_url_cache = TieredCache('cwa_product_urls', max_entries=32, default_ttl=CWA_URL_CACHE_SECONDS)
+_cwa_circuit = get_circuit_breaker('cwa')
 
 
 async def get_cwa_product_url(dataset_id: str, product_url_path: List[str]) -> Optional[str]:
@@ -18,13 +28,38 @@ async def get_cwa_product_url(dataset_id: str, product_url_path: List[str]) -> O
     Returns:
         Optional[str]: 產品圖片網址，失敗則回傳 None
     """
+    # 所有 worker 共用快取，過期時只有一個 worker 向中央氣象署查詢
+    return await _product_url_cache.get_or_load_async(
+        dataset_id, lambda: _fetch_with_circuit(dataset_id, product_url_path))
+
+
+async def _fetch_with_circuit(dataset_id: str, product_url_path: List[str]) -> Optional[str]:
+    # 失敗時 _fetch_cwa_product_url 回傳 None，視為一次失敗；被取消時也要回報，否則半開的試探不會釋放
+    if not _cwa_circuit.allow():
+        logging.warning("CWA 斷路器開啟，暫停查詢")
+        return None
+    try:
+        product_url = await _fetch_cwa_product_url(dataset_id, product_url_path)
+    except BaseException:
+        _cwa_circuit.record_failure()
+        raise
+    if product_url:
+        _cwa_circuit.record_success()
+    else:
+        _cwa_circuit.record_failure()
+    return product_url
+
+
+async def _fetch_cwa_product_url(dataset_id: str, product_url_path: List[str]) -> Optional[str]:
+    import aiohttp
+
     api_url = f"{CWA_API_BASE}{dataset_id}"
     params = {
         "Authorization": CWA_API_KEY,
         "format": "JSON"
     }
     try:
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=CWA_TIMEOUT)) as session:
             async with session.get(api_url, params=params, allow_redirects=False) as resp:
                 if resp.status == 302:
                     location = resp.headers.get("Location")
@@ -52,6 +87,9 @@ async def get_cwa_product_url(dataset_id: str, product_url_path: List[str]) -> O
                 else:
                     logging.error(f"CWA API 回應非 302: {resp.status}")
                     return None
+    except asyncio.TimeoutError:
+        logging.error(f"CWA 查詢超過 {CWA_TIMEOUT} 秒")
+        return None
     except Exception as e:
         logging.error(f"取得 CWA 產品圖時發生錯誤: {e}")
         return None
@@ -86,13 +124,41 @@ async def get_qpf_image_url() -> Optional[str]:
     return await get_cwa_product_url("F-C0035-015", ["cwaopendata", "Dataset", "Resource", "ProductURL"])
 
 
+async def gather_with_deadline(coroutines: Dict[str, Awaitable[Any]], timeout: float) -> Dict[str, Any]:
+    """
+    同時執行多個查詢並共用同一個期限，總耗時取決於最慢的一個而不是加總。
+    逾時未完成（會被取消）或發生例外的查詢結果為 None，其餘照常回傳。
+    """
+    tasks = {key: asyncio.ensure_future(coroutine) for key, coroutine in coroutines.items()}
+    if not tasks:
+        return {}
+    done, pending = await asyncio.wait(tasks.values(), timeout=timeout)
+    for task in pending:
+        task.cancel()
+    # 等取消完成，讓快取的載入鎖等資源釋放
+    await asyncio.gather(*pending, return_exceptions=True)
+    results = {}
+    for key, task in tasks.items():
+        results[key] = None
+        if task in pending:
+            logging.warning(f"{key} 超過 {timeout} 秒未完成")
+        elif task.exception() is not None:
+            logging.error(f"{key} 發生錯誤: {task.exception()}")
+        else:
+            results[key] = task.result()
+    return results
+
+
+async def _print_product_urls():
+    results = await gather_with_deadline({
+        "雷達圖": get_radar_image_url(),
+        "雨量圖": get_rainfall_image_url(),
+        "溫度圖": get_temperature_image_url(),
+        "定量降水預報圖": get_qpf_image_url(),
+    }, timeout=10)
+    for name, url in results.items():
+        print(f"{name}：", url)
+
+
 if __name__ == "__main__":
-    import asyncio
-    radar_url = asyncio.run(get_radar_image_url())
-    print("雷達圖：", radar_url)
-    rainfall_url = asyncio.run(get_rainfall_image_url())
-    print("雨量圖：", rainfall_url)
-    temperature_url = asyncio.run(get_temperature_image_url())
-    print("溫度圖：", temperature_url)
-    qpf_url = asyncio.run(get_qpf_image_url())
-    print("定量降水預報圖：", qpf_url)
+    asyncio.run(_print_product_urls())
@@ -0,0 +1,141 @@
+import re
+import logging
+from datetime import date
+from typing import Optional, List
+
+from PIL import Image
+
+from utils.invoice_extractor import InvoiceRecord
+from utils.memory_budget import MAX_DECODED_PIXELS
+
+# 電子發票證明聯左側 QR Code 前 77 碼：
+# 發票字軌(10) 開立日期(民國 yyyMMdd, 7) 隨機碼(4) 銷售額(16 進位, 8) 總計額(16 進位, 8)
+# 買方統編(8) 賣方統編(8) 加密驗證資訊(24)
+_LEFT_QR_PATTERN = re.compile(
+    r'^(?P<number>[A-Z]{2}\d{8})'
+    r'(?P<year>\d{3})(?P<month>\d{2})(?P<day>\d{2})'
+    r'(?P<random_code>\d{4})'
+    r'(?P<sales>[0-9A-Fa-f]{8})'
+    r'(?P<total>[0-9A-Fa-f]{8})'
+    r'(?P<buyer_id>\d{8})'
+    r'(?P<seller_id>\d{8})'
+)
+
+# 偵測前先將長邊縮到這個大小，QR Code 在手機照片中通常夠大
+_MAX_DETECT_EDGE = 1600
+
+
+def parse_einvoice_qr(payload: str) -> Optional[InvoiceRecord]:
+    """
+    解析電子發票左側 QR Code 內容，非電子發票 QR Code 時回傳 None
+    """
+    match = _LEFT_QR_PATTERN.match(payload.strip())
+    if not match:
+        return None
+    year = int(match.group('year')) + 1911
+    month = int(match.group('month'))
+    try:
+        issued = date(year, month, int(match.group('day')))
+    except ValueError:
+        return None
+    start_month = month if month % 2 == 1 else month - 1
+    confidence = {key: 1.0 for key in ['number', 'period', 'date', 'total', 'seller_id', 'random_code']}
+    return InvoiceRecord(
+        number=match.group('number'),
+        year=year,
+        period=(month + 1) // 2,
+        month=f"{start_month}-{start_month + 1}月",
+        date=issued,
+        total=int(match.group('total'), 16),
+        seller_id=match.group('seller_id'),
+        random_code=match.group('random_code'),
+        has_keyword=True,
+        confidence=confidence,
+    )
+
+
+def load_cv2():
+    """
+    opencv 載入較慢且為選用套件，第一次解碼時才匯入，未安裝時回傳 None
+    """
+    try:
+        import cv2
+    except ImportError:
+        cv2 = None
+    return cv2
+
+
+def decode_qr_payloads(image_path: str) -> List[str]:
+    """
+    在本地 CPU 上解碼圖片中所有 QR Code，沒有安裝 opencv 時回傳空列表
+    """
+    cv2 = load_cv2()
+    if cv2 is None:
+        return []
+    flags = _imread_flags(cv2, image_path)
+    if flags is None:
+        logging.warning('圖片像素超過上限，略過 QR Code 解碼：%s', image_path)
+        return []
+    image = cv2.imread(image_path, flags)
+    if image is None:
+        logging.warning('無法讀取圖片：%s', image_path)
+        return []
+    height, width = image.shape[:2]
+    scale = _MAX_DETECT_EDGE / max(height, width)
+    if scale < 1:
+        image = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+    detector = cv2.QRCodeDetector()
+    try:
+        ok, payloads, _, _ = detector.detectAndDecodeMulti(image)
+    except cv2.error as e:
+        logging.warning('QR Code 解碼失敗：%s', e)
+        return []
+    if not ok:
+        return []
+    return [payload for payload in payloads if payload]
+
+
+def _imread_flags(cv2, image_path: str) -> Optional[int]:
+    """
+    依檔頭決定解碼方式：JPEG 在解碼時直接以 1/2、1/4、1/8 縮小，只要長邊仍不小於偵測尺寸；
+    解碼後仍超過像素上限時回傳 None，不在本地解碼
+    """
+    try:
+        with Image.open(image_path) as image:
+            (width, height), image_format = image.size, image.format
+    except Exception:
+        # 交給 cv2.imread 處理無法讀取的檔案
+        return cv2.IMREAD_GRAYSCALE
+    factor, flags = 1, cv2.IMREAD_GRAYSCALE
+    if image_format == 'JPEG':
+        for reduced_factor, reduced_flags in ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+                                              (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                                              (2, cv2.IMREAD_REDUCED_GRAYSCALE_2)):
+            if max(width, height) // reduced_factor >= _MAX_DETECT_EDGE:
+                factor, flags = reduced_factor, reduced_flags
+                break
+    if (width // factor) * (height // factor) > MAX_DECODED_PIXELS:
+        return None
+    return flags
+
+
+def decode_einvoices(image_path: str) -> List[InvoiceRecord]:
+    """
+    取得圖片中所有電子發票（並排拍攝多張時每張各一筆），依發票號碼去除重複
+    """
+    records = {}
+    for payload in decode_qr_payloads(image_path):
+        record = parse_einvoice_qr(payload)
+        if record is not None and record.number not in records:
+            logging.info(f"由 QR Code 取得電子發票：{record.number}")
+            records[record.number] = record
+    return list(records.values())
+
+
+def decode_einvoice(image_path: str) -> Optional[InvoiceRecord]:
+    """
+    嘗試從圖片中的電子發票 QR Code 取得發票資訊，解不出來時回傳 None（交給 OCR 處理）
+    """
+    records = decode_einvoices(image_path)
+    return records[0] if records else None
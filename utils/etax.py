@@ -0,0 +1,226 @@
+import re
+import asyncio
+import logging
+import threading
+from typing import Optional, Dict, List, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from lxml import etree
+
+# 只挑出需要的節點：期別標題與獎號 span，不走訪整棵樹。
+# 兩個頁面都有指向 index.html 與 lastNumber.html 的期別分頁，分頁連結不代表本頁的期別；
+# 本頁的期別以目前所在的分頁（etw-on）為準，找不到時改用頁面標題
+_ACTIVE_TAB_XPATH = etree.XPath('//*[contains(concat(" ", normalize-space(@class), " "), " etw-on ")]')
+_HEADING_XPATH = etree.XPath('//h1 | //h2 | //h3')
+_RED_PRIZE_XPATH = etree.XPath('//span[normalize-space(@class)="font-weight-bold etw-color-red"]')
+_BOLD_PRIZE_XPATH = etree.XPath('//span[contains(concat(" ", normalize-space(@class), " "), " font-weight-bold ")]')
+_PERIOD_PATTERN = re.compile(r'(\d+)年(\d+)-(\d+)月')
+_HTML_PARSER = etree.HTMLParser(encoding='utf-8', remove_comments=True)
+
+
+def _text(element) -> str:
+    # 與 BeautifulSoup get_text(strip=True) 相同：每段文字去除空白後串接
+    return ''.join(text.strip() for text in element.itertext())
+
+
+def _find_period(root) -> Optional[re.Match]:
+    for xpath in (_ACTIVE_TAB_XPATH, _HEADING_XPATH):
+        for element in xpath(root):
+            period_match = _PERIOD_PATTERN.search(_text(element))
+            if period_match:
+                return period_match
+    return None
+
+
+def parse_winning_numbers_html(html) -> Tuple[Dict[str, int], Dict[str, List[str]]]:
+    """
+    解析中獎號碼頁面，返回 (期別訊息, 中獎號碼)
+    html 可以是 bytes（以 utf-8 解碼）或 str
+    """
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+    root = etree.fromstring(html, _HTML_PARSER)
+    if root is None:
+        raise Exception('無法解析中獎號碼頁面')
+
+    # 提取期别
+    period_match = _find_period(root)
+    if not period_match:
+        raise Exception('無法解析期別')
+    period_info = {
+        'year': int(period_match.group(1)) + 1911,
+        'period': (int(period_match.group(2)) + 1) // 2,
+    }
+
+    winning_numbers = {
+        'special_prize': [],  # 特別獎 (1000萬元)
+        'grand_prize': [],  # 特獎 (200萬元)
+        'first_prize': [],  # 頭獎 (20萬元)
+        'additional_sixth_prize': []  # 增開六獎 (200元)
+    }
+
+    # 特別獎、特獎
+    red_prize = _RED_PRIZE_XPATH(root)
+    if red_prize:
+        winning_numbers['special_prize'].append(_text(red_prize[0]))
+        winning_numbers['grand_prize'].append(_text(red_prize[1]))
+
+    # 頭獎（前 5 碼與末 3 碼分開顯示）、增開六獎
+    bold_prize = [_text(span) for span in _BOLD_PRIZE_XPATH(root)]
+    if bold_prize:
+        for i in range(2, 8, 2):
+            winning_numbers['first_prize'].append(bold_prize[i] + bold_prize[i + 1])
+            winning_numbers['additional_sixth_prize'].append(bold_prize[i + 1])
+
+    return period_info, winning_numbers
+
+
+def _conditional_headers(cached: Optional[Dict]) -> Dict[str, str]:
+    # 帶上次回應的 ETag / Last-Modified，頁面沒變時伺服器回 304
+    headers = {}
+    if cached:
+        if cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+    return headers
+
+
+class EtaxFetcher:
+    """
+    下載財政部中獎號碼頁面。
+    使用共用的 requests.Session（連線池、重試、逾時），
+    並以 ETag / Last-Modified 做條件式請求，頁面沒有變動 (304) 時直接回傳上次的解析結果。
+    """
+
+    def __init__(self, timeout: Tuple[float, float] = (3.05, 10), pool_maxsize: int = 4, retries: int = 2):
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=[502, 503, 504], allowed_methods=['GET'])
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._cache: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def fetch(self, url: str) -> Tuple[Dict[str, int], Dict[str, List[str]]]:
+        """
+        取得並解析頁面，返回 (期別訊息, 中獎號碼)
+        """
+        with self._lock:
+            cached = self._cache.get(url)
+        headers = _conditional_headers(cached)
+
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and cached:
+            logging.info(f"中獎號碼頁面未更新：{url}")
+            return cached['result']
+        if response.status_code != 200:
+            raise Exception('無法獲取最新中獎號碼頁面')
+
+        result = parse_winning_numbers_html(response.content)
+        with self._lock:
+            self._cache[url] = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'result': result,
+            }
+        return result
+
+
+class AsyncEtaxFetcher:
+    """
+    EtaxFetcher 的非同步版本 (aiohttp)，同樣有連線池、逾時、重試與條件式請求。
+    aiohttp 的 ClientSession 綁定 event loop，第一次 fetch 時才建立。
+    """
+
+    RETRY_STATUSES = (502, 503, 504)
+
+    def __init__(self, timeout: Tuple[float, float] = (3.05, 10), pool_maxsize: int = 4, retries: int = 2,
+                 backoff_factor: float = 0.5):
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self._session = None
+        self._cache: Dict[str, Dict] = {}
+
+    async def fetch(self, url: str) -> Tuple[Dict[str, int], Dict[str, List[str]]]:
+        """
+        取得並解析頁面，返回 (期別訊息, 中獎號碼)
+        """
+        cached = self._cache.get(url)
+        status, headers, body = await self._get(url, _conditional_headers(cached))
+        if status == 304 and cached:
+            logging.info(f"中獎號碼頁面未更新：{url}")
+            return cached['result']
+        if status != 200:
+            raise Exception('無法獲取最新中獎號碼頁面')
+
+        result = parse_winning_numbers_html(body)
+        self._cache[url] = {
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'result': result,
+        }
+        return result
+
+    async def _get(self, url: str, headers: Dict[str, str]):
+        import aiohttp
+
+        session = self._get_session()
+        for attempt in range(self.retries + 1):
+            try:
+                async with session.get(url, headers=headers) as response:
+                    if response.status not in self.RETRY_STATUSES or attempt == self.retries:
+                        return response.status, response.headers, await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    raise
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+
+    def _get_session(self):
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            connect_timeout, read_timeout = self.timeout
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(connect=connect_timeout, sock_read=read_timeout),
+                connector=aiohttp.TCPConnector(limit=self.pool_maxsize),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+_etax_fetcher: Optional[EtaxFetcher] = None
+_etax_fetcher_lock = threading.Lock()
+
+
+def get_etax_fetcher() -> EtaxFetcher:
+    """
+    取得共用的 EtaxFetcher
+    """
+    global _etax_fetcher
+    with _etax_fetcher_lock:
+        if _etax_fetcher is None:
+            _etax_fetcher = EtaxFetcher()
+        return _etax_fetcher
+
+
+_async_etax_fetcher: Optional[AsyncEtaxFetcher] = None
+
+
+def get_async_etax_fetcher() -> AsyncEtaxFetcher:
+    """
+    取得共用的 AsyncEtaxFetcher，只在 event loop 中使用
+    """
+    global _async_etax_fetcher
+    if _async_etax_fetcher is None:
+        _async_etax_fetcher = AsyncEtaxFetcher()
+    return _async_etax_fetcher
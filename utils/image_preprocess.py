@@ -0,0 +1,36 @@
+import io
+import os
+import logging
+
+from PIL import Image, ImageOps
+
+from utils.memory_budget import check_decoded_pixels
+
+# 文字偵測不需要手機原圖解析度，長邊縮到這個大小即可
+OCR_MAX_EDGE = int(os.environ.get("OCR_MAX_EDGE", 2048))
+OCR_JPEG_QUALITY = int(os.environ.get("OCR_JPEG_QUALITY", 85))
+
+
+def prepare_image_for_ocr(content: bytes, max_edge: int = OCR_MAX_EDGE, quality: int = OCR_JPEG_QUALITY) -> bytes:
+    """
+    上傳 Vision 前的前處理：依 EXIF 轉正、限制長邊、轉灰階、重新以 JPEG 壓縮（不保留 EXIF）
+    圖片本身已經夠小且重新壓縮反而變大時，回傳原始內容
+    """
+    image = Image.open(io.BytesIO(content))
+    original_size = image.size
+    # JPEG 可以在解碼時直接以 1/2、1/4、1/8 縮小，省下完整解碼的時間與記憶體
+    image.draft('L', (max_edge, max_edge))
+    # 無法在解碼時縮小的超大圖片不在本地解碼，由呼叫端直接上傳原檔
+    check_decoded_pixels(image)
+    image = ImageOps.exif_transpose(image)
+    image = image.convert('L')
+    image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=quality, optimize=True)
+    prepared = output.getvalue()
+
+    if max(original_size) <= max_edge and len(prepared) >= len(content):
+        return content
+    logging.info(f"OCR 前處理：{original_size} {len(content)} bytes -> {image.size} {len(prepared)} bytes")
+    return prepared
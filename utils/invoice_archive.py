@@ -0,0 +1,162 @@
+import time
+import logging
+from typing import Optional, List, Dict, Any, Callable, Tuple
+
+from utils.sqlite_utils import SQLiteDatabase
+
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    target_id TEXT,
+    invoice_number TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    period INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    prize TEXT,
+    created_at REAL NOT NULL,
+    checked_at REAL,
+    UNIQUE (user_id, invoice_number, year, period)
+);
+CREATE INDEX IF NOT EXISTS idx_invoices_period_status ON invoices (year, period, status);
+"""
+
+PRIZE_SPECIAL = '特別獎 1,000萬元'
+PRIZE_GRAND = '特獎 200萬元'
+PRIZE_ADDITIONAL_SIXTH = '增開六獎 200元'
+FIRST_PRIZE_NAMES = {
+    8: '頭獎 20萬元',
+    7: '二獎 4萬元',
+    6: '三獎 1萬元',
+    5: '四獎 4千元',
+    4: '五獎 1千元',
+    3: '六獎 200元',
+}
+
+
+def build_prize_lookup(winning_numbers: Dict[str, List[str]]) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    將中獎號碼展開成查表用的 dict：
+    exact: 8 碼號碼 -> 特別獎/特獎
+    suffix: 頭獎號碼的末 3~8 碼 -> 獎項（較長的末碼優先），以及增開六獎的 3 碼
+    每張發票最多只需查 7 次 dict，適合一次比對大量發票
+    """
+    exact = {}
+    for num in winning_numbers.get('grand_prize', []):
+        exact[num] = PRIZE_GRAND
+    for num in winning_numbers.get('special_prize', []):
+        exact[num] = PRIZE_SPECIAL
+
+    suffix = {}
+    for length in range(8, 2, -1):
+        for num in winning_numbers.get('first_prize', []):
+            suffix.setdefault(num[-length:], FIRST_PRIZE_NAMES[length])
+    for num in winning_numbers.get('additional_sixth_prize', []):
+        suffix.setdefault(num, PRIZE_ADDITIONAL_SIXTH)
+    return exact, suffix
+
+
+def lookup_prize(invoice_number: str, lookup: Tuple[Dict[str, str], Dict[str, str]]) -> Optional[str]:
+    """
+    以 build_prize_lookup 的結果檢查單張發票
+    """
+    exact, suffix = lookup
+    invoice_num = invoice_number[-8:]
+    prize = exact.get(invoice_num)
+    if prize:
+        return prize
+    for length in range(8, 2, -1):
+        prize = suffix.get(invoice_num[-length:])
+        if prize:
+            return prize
+    return None
+
+
+class InvoiceArchive:
+    """
+    發票存檔。開獎前收到的發票會以 pending 狀態存檔，
+    開獎後以 recheck_period 一次比對該期所有 pending 發票。
+    """
+
+    def __init__(self, path: str):
+        self.db = SQLiteDatabase(path, ARCHIVE_SCHEMA)
+
+    def add_pending(self, user_id: str, invoice_number: str, period_info: Dict[str, Any],
+                    target_id: Optional[str] = None) -> bool:
+        """
+        存檔一張待開獎的發票，重複存檔時回傳 False
+        """
+        with self.db.transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO invoices (user_id, target_id, invoice_number, year, period, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, target_id, invoice_number, period_info['year'], period_info['period'], time.time()),
+            )
+            return cursor.rowcount > 0
+
+    def pending_periods(self) -> List[Dict[str, int]]:
+        """
+        列出仍有待兌獎發票的期別
+        """
+        rows = self.db.connection().execute(
+            "SELECT DISTINCT year, period FROM invoices WHERE status = 'pending' ORDER BY year, period"
+        ).fetchall()
+        return [{'year': row['year'], 'period': row['period']} for row in rows]
+
+    def recheck_period(self, period_info: Dict[str, Any],
+                       winning_numbers: Dict[str, List[str]]) -> List[Dict[str, Any]]:
+        """
+        在同一個交易內比對該期所有 pending 發票：中獎者逐筆更新，其餘一次標記為未中獎
+        回傳中獎發票列表
+        """
+        lookup = build_prize_lookup(winning_numbers)
+        now = time.time()
+        year, period = period_info['year'], period_info['period']
+        winners = []
+        with self.db.transaction() as conn:
+            cursor = conn.execute(
+                "SELECT id, user_id, target_id, invoice_number FROM invoices "
+                "WHERE year = ? AND period = ? AND status = 'pending'",
+                (year, period),
+            )
+            for row_id, user_id, target_id, invoice_number in cursor:
+                prize = lookup_prize(invoice_number, lookup)
+                if prize:
+                    winners.append({
+                        'id': row_id,
+                        'user_id': user_id,
+                        'target_id': target_id,
+                        'invoice_number': invoice_number,
+                        'prize': prize,
+                    })
+            conn.executemany(
+                "UPDATE invoices SET status = 'won', prize = ?, checked_at = ? WHERE id = ?",
+                [(winner['prize'], now, winner['id']) for winner in winners],
+            )
+            conn.execute(
+                "UPDATE invoices SET status = 'lost', checked_at = ? "
+                "WHERE year = ? AND period = ? AND status = 'pending'",
+                (now, year, period),
+            )
+        logging.info(f"{year} 年第 {period} 期發票批次兌獎完成，中獎 {len(winners)} 張")
+        return winners
+
+
+def recheck_pending_invoices(
+    archive: InvoiceArchive,
+    fetch_winning_numbers: Callable[[Dict[str, Any]], Optional[Dict[str, List[str]]]],
+    notify: Callable[[List[Dict[str, Any]], Dict[str, Any]], None],
+    is_drawn: Callable[[Dict[str, Any]], bool],
+):
+    """
+    對所有已開獎且有 pending 發票的期別做批次兌獎，並將中獎者交給 notify 通知
+    """
+    for period_info in archive.pending_periods():
+        if not is_drawn(period_info):
+            continue
+        winning_numbers = fetch_winning_numbers(period_info)
+        if not winning_numbers:
+            continue
+        winners = archive.recheck_period(period_info, winning_numbers)
+        if winners:
+            notify(winners, period_info)
@@ -0,0 +1,178 @@
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple, Callable, Iterable
+
+# 預先建立的期別範圍（西元年），範圍外的期別仍可查詢，只是每次重新計算
+CALENDAR_FIRST_YEAR = 2000
+CALENDAR_LAST_YEAR = 2060
+PERIODS_PER_YEAR = 6
+
+# 財政部稅務入口網中獎號碼頁面：最近一次開獎的期別與再前一期
+ETAX_LATEST_URL = 'https://invoice.etax.nat.gov.tw/index.html'
+ETAX_PREVIOUS_URL = 'https://invoice.etax.nat.gov.tw/lastNumber.html'
+
+
+@dataclass(frozen=True)
+class InvoicePeriod:
+    """
+    一期統一發票（兩個月）的開獎日與兌獎截止日
+    ordinal: 期別的流水號（year * 6 + period - 1），相鄰期別相差 1
+    """
+    year: int
+    period: int
+    draw_date: datetime
+    redeem_deadline: datetime
+
+    @property
+    def key(self) -> Tuple[int, int]:
+        return self.year, self.period
+
+    @property
+    def ordinal(self) -> int:
+        return self.year * PERIODS_PER_YEAR + self.period - 1
+
+    @property
+    def period_info(self) -> Dict[str, int]:
+        return {'year': self.year, 'period': self.period}
+
+
+def _shift_month(year: int, month: int, months: int) -> Tuple[int, int]:
+    index = year * 12 + month - 1 + months
+    return index // 12, index % 12 + 1
+
+
+def compute_period(year: int, period: int) -> InvoicePeriod:
+    """
+    開獎日為期別結束後下一個月的 25 日，兌獎截止日為開獎後第 4 個月的 5 日
+    """
+    if not 1 <= period <= PERIODS_PER_YEAR:
+        raise ValueError(f"期別必須為 1~6：{period}")
+    draw_year, draw_month = _shift_month(year, period * 2, 1)
+    deadline_year, deadline_month = _shift_month(draw_year, draw_month, 4)
+    return InvoicePeriod(year, period, datetime(draw_year, draw_month, 25),
+                         datetime(deadline_year, deadline_month, 5))
+
+
+def period_key(period_info: Dict[str, Any]) -> Tuple[int, int]:
+    return int(period_info['year']), int(period_info['period'])
+
+
+class InvoiceCalendar:
+    """
+    啟動時建立的期別表，建立後不再變動，可在 thread 之間共用。
+    期別以流水號直接定位，查詢開獎日與兌獎截止日不需重新計算；
+    「現在」由 clock 提供，測試與批次重新兌獎時可以指定時間。
+    """
+
+    def __init__(self, first_year: int = CALENDAR_FIRST_YEAR, last_year: int = CALENDAR_LAST_YEAR,
+                 clock: Callable[[], datetime] = datetime.now):
+        self.clock = clock
+        self._periods: Tuple[InvoicePeriod, ...] = tuple(
+            compute_period(year, period)
+            for year in range(first_year, last_year + 1)
+            for period in range(1, PERIODS_PER_YEAR + 1)
+        )
+        self._first_ordinal = self._periods[0].ordinal
+        # 開獎日依期別遞增，用來以二分搜尋找出某個時間點最近一次開獎的期別
+        self._draw_dates: Tuple[datetime, ...] = tuple(entry.draw_date for entry in self._periods)
+
+    def __len__(self) -> int:
+        return len(self._periods)
+
+    def now(self, now: Optional[datetime] = None) -> datetime:
+        return now if now is not None else self.clock()
+
+    def get(self, year: int, period: int) -> InvoicePeriod:
+        """
+        取得期別資料，範圍外的期別即時計算
+        """
+        if not 1 <= period <= PERIODS_PER_YEAR:
+            raise ValueError(f"期別必須為 1~6：{period}")
+        index = year * PERIODS_PER_YEAR + period - 1 - self._first_ordinal
+        if 0 <= index < len(self._periods):
+            return self._periods[index]
+        return compute_period(year, period)
+
+    def lookup(self, period_info: Dict[str, Any]) -> InvoicePeriod:
+        return self.get(*period_key(period_info))
+
+    def from_ordinal(self, ordinal: int) -> InvoicePeriod:
+        return self.get(ordinal // PERIODS_PER_YEAR, ordinal % PERIODS_PER_YEAR + 1)
+
+    def period_at(self, now: Optional[datetime] = None) -> InvoicePeriod:
+        """
+        該時間點所在的期別（尚未開獎）
+        """
+        now = self.now(now)
+        return self.get(now.year, (now.month + 1) // 2)
+
+    def latest_drawn(self, now: Optional[datetime] = None) -> InvoicePeriod:
+        """
+        該時間點最近一次開獎的期別
+        """
+        now = self.now(now)
+        index = bisect_right(self._draw_dates, now) - 1
+        if 0 <= index < len(self._periods) - 1:
+            return self._periods[index]
+        # 超出期別表範圍：所在期別的前一期或前兩期
+        ordinal = self.period_at(now).ordinal - 1
+        entry = self.from_ordinal(ordinal)
+        return entry if entry.draw_date <= now else self.from_ordinal(ordinal - 1)
+
+    def is_drawn(self, period_info: Dict[str, Any], now: Optional[datetime] = None) -> bool:
+        return self.now(now) >= self.lookup(period_info).draw_date
+
+    def is_redeemable(self, period_info: Dict[str, Any], now: Optional[datetime] = None) -> bool:
+        entry = self.lookup(period_info)
+        return entry.draw_date <= self.now(now) <= entry.redeem_deadline
+
+    def redeemable_periods(self, now: Optional[datetime] = None) -> List[InvoicePeriod]:
+        """
+        該時間點可以兌獎的期別（兌獎期間約四個月，最多兩期），由新到舊排列
+        """
+        now = self.now(now)
+        latest = self.latest_drawn(now)
+        candidates = [latest, self.from_ordinal(latest.ordinal - 1), self.from_ordinal(latest.ordinal - 2)]
+        return [entry for entry in candidates if entry.draw_date <= now <= entry.redeem_deadline]
+
+    def redeemable_mask(self, period_infos: Iterable[Dict[str, Any]], now: Optional[datetime] = None) -> List[bool]:
+        """
+        一次判斷多張發票是否可以兌獎：只取一次時間並算出可兌獎的期別，之後每張發票只需查一次集合；
+        期別缺漏或格式錯誤的發票視為不可兌獎
+        """
+        redeemable = {entry.key for entry in self.redeemable_periods(now)}
+        mask = []
+        for period_info in period_infos:
+            try:
+                mask.append(period_key(period_info) in redeemable)
+            except (KeyError, TypeError, ValueError):
+                mask.append(False)
+        return mask
+
+    def etax_source(self, period_info: Dict[str, Any], now: Optional[datetime] = None) -> Optional[str]:
+        """
+        財政部網站上刊登該期中獎號碼的頁面；網站只保留最近兩次開獎，更早或尚未開獎的期別回傳 None
+        """
+        latest = self.latest_drawn(now)
+        offset = latest.ordinal - self.lookup(period_info).ordinal
+        if offset == 0:
+            return ETAX_LATEST_URL
+        if offset == 1:
+            return ETAX_PREVIOUS_URL
+        return None
+
+
+_calendar = InvoiceCalendar()
+
+
+def get_invoice_calendar() -> InvoiceCalendar:
+    return _calendar
+
+
+def set_invoice_calendar(calendar: InvoiceCalendar):
+    """
+    替換共用的期別表（例如測試時指定 clock）
+    """
+    global _calendar
+    _calendar = calendar
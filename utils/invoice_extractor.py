@@ -0,0 +1,152 @@
+import re
+from datetime import date
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Optional, Dict, List, Iterable, Iterator
+
+# 一次掃描 OCR 文字即可取出所有發票欄位，各欄位以具名群組區分
+_INVOICE_TOKEN_PATTERN = re.compile(
+    r'(?P<keyword>電子發票|統一發票)'
+    r'|(?P<number>[A-Z]{2}-?\s?\d{8})'
+    r'|(?P<period_year>\d{2,3})年(?P<period_start>\d{1,2})-(?P<period_end>\d{1,2})月'
+    r'|(?P<date_year>\d{3,4})[-/.](?P<date_month>\d{1,2})[-/.](?P<date_day>\d{1,2})'
+    r'|(?:總計|合計|總金額|TOTAL|Total)\s*[:：]?\s*[$＄]?\s*(?P<total>\d[\d,]*)'
+    r'|(?:賣方|統一編號|統編)\s*[:：]?\s*(?P<seller_id>\d{8})'
+    r'|隨機碼\s*[:：]?\s*(?P<random_code>\d{4})'
+)
+
+
+@dataclass(frozen=True)
+class InvoiceRecord:
+    """
+    從 OCR 文字中取出的發票欄位
+    每個欄位取第一個合理的候選值，confidence 為 0~1 的信心度，candidates 保留所有候選值
+    """
+    number: Optional[str] = None
+    year: Optional[int] = None
+    period: Optional[int] = None
+    month: Optional[str] = None
+    date: Optional[date] = None
+    total: Optional[int] = None
+    seller_id: Optional[str] = None
+    random_code: Optional[str] = None
+    has_keyword: bool = False
+    confidence: Dict[str, float] = field(default_factory=dict)
+    candidates: Dict[str, List[str]] = field(default_factory=dict)
+
+    @property
+    def period_info(self) -> Optional[Dict]:
+        """
+        與 parse_invoice_period 相同格式的期別訊息
+        """
+        if self.year is None:
+            return None
+        return {'year': self.year, 'period': self.period, 'month': self.month}
+
+    @property
+    def is_uniform_invoice(self) -> bool:
+        return self.has_keyword and self.number is not None
+
+
+def _candidate_confidence(values: List, plausible: int) -> float:
+    # 候選值都一致時信心度最高，有多個不同值或不合理的值時降低
+    if not values:
+        return 0.0
+    distinct = len(set(values))
+    return round(plausible / len(values) / distinct, 2)
+
+
+def _to_gregorian(year: int) -> int:
+    # 2~3 位數視為民國年
+    return year + 1911 if year < 1000 else year
+
+
+def extract_invoice_record(text: str) -> InvoiceRecord:
+    """
+    單次掃描 OCR 文字，回傳 InvoiceRecord
+    """
+    numbers, periods, dates, totals, seller_ids, random_codes = [], [], [], [], [], []
+    has_keyword = False
+    for match in _INVOICE_TOKEN_PATTERN.finditer(text):
+        kind = match.lastgroup
+        if kind == 'keyword':
+            has_keyword = True
+        elif kind == 'number':
+            numbers.append(match.group('number').replace(' ', ''))
+        elif kind == 'period_end':
+            periods.append((int(match.group('period_year')), int(match.group('period_start')),
+                            int(match.group('period_end'))))
+        elif kind == 'date_day':
+            dates.append((int(match.group('date_year')), int(match.group('date_month')),
+                          int(match.group('date_day'))))
+        elif kind == 'total':
+            totals.append(int(match.group('total').replace(',', '')))
+        elif kind == 'seller_id':
+            seller_ids.append(match.group('seller_id'))
+        elif kind == 'random_code':
+            random_codes.append(match.group('random_code'))
+
+    fields = {}
+    confidence = {}
+
+    if numbers:
+        fields['number'] = numbers[0]
+    confidence['number'] = _candidate_confidence(numbers, len(numbers))
+
+    # 期別：雙月且起月為奇數才合理，例如 11-12月
+    valid_periods = [p for p in periods if 1 <= p[1] <= 12 and p[2] == p[1] + 1 and p[1] % 2 == 1]
+    if periods:
+        year_minguo, start_month, end_month = (valid_periods or periods)[0]
+        fields['year'] = year_minguo + 1911
+        fields['period'] = (start_month + 1) // 2 if start_month % 2 == 1 else start_month // 2
+        fields['month'] = f"{start_month}-{end_month}月"
+    confidence['period'] = _candidate_confidence(periods, len(valid_periods))
+
+    valid_dates = []
+    for year, month, day in dates:
+        try:
+            valid_dates.append(date(_to_gregorian(year), month, day))
+        except ValueError:
+            continue
+    if valid_dates:
+        fields['date'] = valid_dates[0]
+    confidence['date'] = _candidate_confidence(dates, len(valid_dates))
+
+    # 總計通常出現在最後，取最後一個
+    if totals:
+        fields['total'] = totals[-1]
+    confidence['total'] = _candidate_confidence(totals, len(totals))
+
+    if seller_ids:
+        fields['seller_id'] = seller_ids[0]
+    confidence['seller_id'] = _candidate_confidence(seller_ids, len(seller_ids))
+
+    if random_codes:
+        fields['random_code'] = random_codes[0]
+    confidence['random_code'] = _candidate_confidence(random_codes, len(random_codes))
+
+    candidates = {
+        'number': numbers,
+        'period': [f"{y}年{s}-{e}月" for y, s, e in periods],
+        'date': [f"{y}/{m}/{d}" for y, m, d in dates],
+        'total': [str(total) for total in totals],
+        'seller_id': seller_ids,
+        'random_code': random_codes,
+    }
+    return InvoiceRecord(has_keyword=has_keyword, confidence=confidence, candidates=candidates, **fields)
+
+
+@lru_cache(maxsize=256)
+def extract_invoice_record_cached(text: str) -> InvoiceRecord:
+    """
+    同一段 OCR 文字在判斷、提取號碼、提取期別時只掃描一次
+    """
+    return extract_invoice_record(text)
+
+
+def extract_invoice_records(texts: Iterable[str]) -> Iterator[InvoiceRecord]:
+    """
+    批次處理大量 OCR 文字（例如存檔的歷史資料），不經過快取
+    """
+    for text in texts:
+        yield extract_invoice_record(text)
@@ -1,45 +1,70 @@
-import re
 import logging
 from datetime import datetime
-import requests
-from bs4 import BeautifulSoup
+from typing import Optional
+from utils.etax import get_etax_fetcher, get_async_etax_fetcher, parse_winning_numbers_html
+from utils.invoice_extractor import extract_invoice_record_cached
+from utils.invoice_calendar import get_invoice_calendar, ETAX_LATEST_URL, ETAX_PREVIOUS_URL
 
 # 配置 logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# 財政部稅務入口網中獎號碼頁面：本期與上期
+ETAX_WINNING_NUMBER_URLS = [ETAX_LATEST_URL, ETAX_PREVIOUS_URL]
+
+# 發票存檔（由 app 透過 set_invoice_archive 設定），尚未開獎的發票會存檔等待開獎後批次兌獎
+_invoice_archive = None
+
+# 本地歷史中獎號碼（由 app 透過 set_winning_numbers_store 設定），由背景同步工作負責更新
+_winning_numbers_store = None
+
+
+def set_invoice_archive(archive):
+    """
+    設定待開獎發票的存檔
+    """
+    global _invoice_archive
+    _invoice_archive = archive
+
 
 def is_uniform_invoice(ocr_text):
     """
     判斷文本是否為統一發票
+    含有"電子發票"or"統一發票"，且含有發票格式的英數字
+    """
+    return extract_invoice_record_cached(ocr_text).is_uniform_invoice
+
+
+def set_winning_numbers_store(store):
     """
-    condition_1 = False
-    condition_2 = False
-    # 判斷是否含有"電子發票"or"統一發票"
-    if '電子發票' in ocr_text or '統一發票' in ocr_text:
-        condition_1 = True
-    # 判斷是否含有發票格式的英數字
-    invoice_number_pattern = r'[A-Z]{2}[-]?\s?\d{8}'
-    if re.search(invoice_number_pattern, ocr_text):
-        condition_2 = True
-    return condition_1 and condition_2
+    設定本地歷史中獎號碼，設定後查詢中獎號碼只讀本地資料
+    """
+    global _winning_numbers_store
+    _winning_numbers_store = store
 
 
-def process_uniform_invoice(text):
+def process_uniform_invoice(text, user_id=None, target_id=None):
     """
     處理統一發票的邏輯，含提取號碼、期別，可否兌獎
+    有 user_id 且已設定發票存檔時，尚未開獎的發票會存檔，開獎後自動兌獎
     """
-    logging.info(text)
+    # 發票內容不寫入 log，只記錄長度
+    logging.debug(f"處理統一發票，OCR 文字 {len(text)} 字")
     # 提取發票號碼
-    invoice_number_pattern = r'([A-Z]{2}[-]?\s?\d{8})'
-    match = re.search(invoice_number_pattern, text)
-    if not match:
+    invoice_number = extract_invoice_record_cached(text).number
+    if not invoice_number:
         return "未能提取發票號碼"
-    invoice_number = match.group(1).replace(' ', '')
 
     # 提取發票期別
     period_info = parse_invoice_period(text)
     if not period_info:
         return "未能提取發票期別"
+    return process_invoice(invoice_number, period_info, user_id, target_id)
+
+
+def process_invoice(invoice_number, period_info, user_id=None, target_id=None):
+    """
+    以已知的發票號碼與期別兌獎（OCR 或電子發票 QR Code 皆可使用）
+    """
     year = period_info['year']
     period = period_info['period']
     month = period_info['month']
@@ -47,12 +72,16 @@ def process_uniform_invoice(text):
 
     # 判斷是否在兌獎期間
     if not is_redeemable(period_info):
+        if not is_drawn(period_info) and archive_pending_invoice(user_id, target_id, invoice_number, period_info):
+            return f"發票期別為 {period_str}，號碼為 {invoice_number}，尚未開獎，開獎後會自動幫你兌獎"
         return f"發票期別為 {period_str}，還無法兌獎或是已過兌獎期限"
 
     # 取得對應期別的中獎號碼
     try:
         winning_numbers = get_winning_numbers_for_period(period_info)
         if not winning_numbers:
+            if archive_pending_invoice(user_id, target_id, invoice_number, period_info):
+                return f"發票期別為 {period_str}，該期中獎號碼尚未公布，公布後會自動幫你兌獎"
             return f"發票期別為 {period_str}，該期中獎號碼尚未公布"
     except Exception as e:
         logging.error('獲取中獎號碼時發生錯誤：%s', e)
@@ -67,195 +96,128 @@ def process_uniform_invoice(text):
         return f"發票期別為 {period_str}，號碼為 {invoice_number}，未中獎"
 
 
+def archive_pending_invoice(user_id, target_id, invoice_number, period_info):
+    """
+    將待開獎發票存檔，沒有存檔或使用者資訊時回傳 False
+    """
+    if _invoice_archive is None or not user_id:
+        return False
+    try:
+        _invoice_archive.add_pending(user_id, invoice_number, period_info, target_id=target_id)
+        return True
+    except Exception as e:
+        logging.error('發票存檔時發生錯誤：%s', e)
+        return False
+
+
 def parse_invoice_period(text):
     """
     從字串中提取發票期別，返回含年份、期別、月份的資訊
+    發票格式日期，例如"113年11-12月"
     """
-    # 發票格式日期，例如"113年11-12月"
-    date_pattern = r'(\d{2,3})年(\d{1,2})-(\d{1,2})月'
-    match = re.search(date_pattern, text)
-    if match:
-        year_minguo = int(match.group(1))  # 民國年
-        start_month = int(match.group(2))
-        end_month = int(match.group(3))
+    return extract_invoice_record_cached(text).period_info
 
-        # 民國年轉換為公元
-        year = year_minguo + 1911
 
-        # 計算期別（1-6期）
-        if start_month % 2 == 1:
-            period = (start_month + 1) // 2
-        else:
-            period = start_month // 2
-
-        return {'year': year, 'period': period, 'month': f"{start_month}-{end_month}月"}
-    else:
-        return None
+def is_redeemable(period_info, now: Optional[datetime] = None):
+    """
+    判斷發票是否在兌獎期間內；未指定 now 時以期別表的 clock 為準
+    """
+    return get_invoice_calendar().is_redeemable(period_info, now)
 
 
-def is_redeemable(period_info):
+def redeemable_mask(period_infos, now: Optional[datetime] = None):
     """
-    判斷發票是否在兌獎期間內
+    一次判斷多張發票是否在兌獎期間內，回傳與輸入順序相同的 bool 列表
     """
-    current_date = datetime.now()
+    return get_invoice_calendar().redeemable_mask(period_infos, now)
 
-    # 根據期別計算開獎日期和兌獎截止日
-    draw_date, redeem_deadline = get_draw_and_redeem_dates(period_info)
 
-    # 判斷當前日期是否在兌獎期間內
-    if draw_date <= current_date <= redeem_deadline:
-        return True
-    else:
-        return False
+def is_drawn(period_info, now: Optional[datetime] = None):
+    """
+    判斷該期是否已開獎
+    """
+    return get_invoice_calendar().is_drawn(period_info, now)
 
 
 def get_draw_and_redeem_dates(period_info):
     """
-    根據期別計算開獎日期和兌獎截止日
+    根據期別取得開獎日期和兌獎截止日
     """
-    year = period_info['year']
-    period = period_info['period']
-
-    # 期別對應的結束月份
-    end_month = period * 2
-    # 開獎日期為期別結束後下一個月的25號
-    draw_month = end_month + 1
-    draw_year = year
-    if draw_month > 12:
-        draw_month -= 12
-        draw_year += 1
-    draw_date = datetime(draw_year, draw_month, 25)
-
-    # 兌獎截止日是開獎後第4個月的5日
-    redeem_deadline_month = draw_month + 4
-    redeem_deadline_year = draw_year
-    if redeem_deadline_month > 12:
-        redeem_deadline_month -= 12
-        redeem_deadline_year += 1
-    redeem_deadline = datetime(redeem_deadline_year, redeem_deadline_month, 5)
-
-    return draw_date, redeem_deadline
+    entry = get_invoice_calendar().lookup(period_info)
+    return entry.draw_date, entry.redeem_deadline
 
 
 def get_winning_numbers_for_period(period_info):
     """
     根據期別，獲取對應的中獎號碼
     如果中獎號碼尚未公布，返回 None
+    有設定本地中獎號碼時直接讀取本地資料（涵蓋所有收錄的期別），
+    否則只能從財政部網站抓取最近兩次開獎的中獎號碼
     """
-    # 獲取當前期別和上一期的訊息
-    current_period_info = get_current_invoice_period()
-    last_period_info = get_last_invoice_period()
-
-    # 期別轉換為可比較字串
-    def period_to_str(info):
-        return f"{info['year']}-{info['period']}"
+    if _winning_numbers_store is not None:
+        return _winning_numbers_store.get(period_info)
 
-    invoice_period_str = period_to_str(period_info)
-    current_period_str = period_to_str(current_period_info)
-    last_period_str = period_to_str(last_period_info)
-
-    if invoice_period_str == current_period_str:
-        # 當前期別
-        url = 'https://invoice.etax.nat.gov.tw/index.html'
-    elif invoice_period_str == last_period_str:
-        # 上期期別
-        url = 'https://invoice.etax.nat.gov.tw/lastNumber.html'
-    else:
-        # 更早期別或更晚期別，Return None
+    calendar = get_invoice_calendar()
+    source = calendar.etax_source(period_info)
+    if source is None:
+        # 更早期別或尚未開獎，Return None
         return None
 
-    winning_numbers = get_winning_numbers(url)
-    return winning_numbers
+    # 以頁面上的期別確認是否為同一期；剛開獎時網站可能尚未更新，另一個頁面也檢查一次
+    key = calendar.lookup(period_info).key
+    for url in [source] + [url for url in ETAX_WINNING_NUMBER_URLS if url != source]:
+        page_period_info, winning_numbers = fetch_winning_numbers_page(url)
+        if calendar.lookup(page_period_info).key == key:
+            return winning_numbers
+    return None
 
 
-def get_current_invoice_period():
+def get_current_invoice_period(now: Optional[datetime] = None):
     """
     獲取當前期別訊息
     """
-    current_date = datetime.now()
-    month = current_date.month
-    year = current_date.year
+    return get_invoice_calendar().period_at(now).period_info
 
-    # 計算期別（1-6期）
-    period = (month + 1) // 2
 
-    return {'year': year, 'period': period}
-
-
-def get_last_invoice_period():
+def get_last_invoice_period(now: Optional[datetime] = None):
     """
     獲取上一期期別訊息
     """
-    current_date = datetime.now()
-    month = current_date.month
-    year = current_date.year
-
-    # 計算期別（1-6期）
-    period = (month + 1) // 2
-
-    # 如果是第一期，上一期是上一年的第六期
-    if period == 1:
-        last_period = 6
-        last_year = year - 1
-    else:
-        last_period = period - 1
-        last_year = year
-
-    return {'year': last_year, 'period': last_period}
+    calendar = get_invoice_calendar()
+    return calendar.from_ordinal(calendar.period_at(now).ordinal - 1).period_info
 
 
 def get_winning_numbers(url):
     """
     從財政部稅務入口網獲取最新中獎號碼及規則
     """
-    response = requests.get(url)
-    response.encoding = 'utf-8'  # utf-8
-
-    if response.status_code != 200:
-        raise Exception('無法獲取最新中獎號碼頁面')
-
-    soup = BeautifulSoup(response.text, 'lxml')
-
-    # 提取期别
-    title = soup.find('a', href="lastNumber.html").get_text(strip=True)
-    period_match = re.search(r'(\d+)年(\d+)-(\d+)月', title)
-    if not period_match:
-        raise Exception('無法解析期別')
-
-    # 提取中獎號碼
-    winning_numbers = {
-        'special_prize': [],  # 特別獎 (1000萬元)
-        'grand_prize': [],  # 特獎 (200萬元)
-        'first_prize': [],  # 頭獎 (20萬元)
-        'additional_sixth_prize': []  # 增開六獎 (200元)
-    }
+    _, winning_numbers = fetch_winning_numbers_page(url)
+    return winning_numbers
 
-    # 特別獎
-    special_prize = soup.find_all('span', {'class': 'font-weight-bold etw-color-red'})
-    if special_prize:
-        winning_numbers['special_prize'].append(special_prize[0].get_text(strip=True))
 
-    # 特獎
-    if special_prize:
-        winning_numbers['grand_prize'].append(special_prize[1].get_text(strip=True))
+def fetch_winning_numbers_page(url):
+    """
+    下載並解析中獎號碼頁面，返回 (期別訊息, 中獎號碼)
+    """
+    period_info, winning_numbers = get_etax_fetcher().fetch(url)
+    logging.info(f"從財政部稅務入口網獲取 {period_info['year']} 年第 {period_info['period']} 期中獎號碼:{winning_numbers}")
+    return period_info, winning_numbers
 
-    # 頭獎
-    first_prize = soup.find_all('span', {'class': 'font-weight-bold'})
-    if first_prize:
-        for i in range(2, 8, 2):
-            first_prize_numbers = first_prize[i].get_text(strip=True) + first_prize[i + 1].get_text(strip=True)
-            winning_numbers['first_prize'].append(first_prize_numbers)
 
-    # 增開六獎
-    additional_sixth_prize = first_prize
-    if additional_sixth_prize:
-        for i in range(2, 8, 2):
-            additional_sixth_prize_numbers = first_prize[i + 1].get_text(strip=True)
-            winning_numbers['additional_sixth_prize'].append(additional_sixth_prize_numbers)
+async def fetch_winning_numbers_page_async(url):
+    """
+    fetch_winning_numbers_page 的非同步版本
+    """
+    period_info, winning_numbers = await get_async_etax_fetcher().fetch(url)
+    logging.info(f"從財政部稅務入口網獲取 {period_info['year']} 年第 {period_info['period']} 期中獎號碼:{winning_numbers}")
+    return period_info, winning_numbers
 
-    logging.info(f"從財政部稅務入口網獲取最新中獎號碼:{winning_numbers}")
 
-    return winning_numbers
+def parse_winning_numbers_page(html):
+    """
+    解析中獎號碼頁面，返回 (期別訊息, 中獎號碼)
+    """
+    return parse_winning_numbers_html(html)
 
 
 def check_prize(invoice_number, winning_numbers):
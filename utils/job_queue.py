@@ -0,0 +1,390 @@
+import os
+import json
+import asyncio
+import time
+import uuid
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Optional, Any, Dict, List, Callable, Awaitable
+
+from utils.sqlite_utils import SQLiteDatabase
+
+JOB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires_at REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_available ON jobs (status, available_at);
+"""
+
+
+class JobDeferred(Exception):
+    """
+    工作暫時無法執行（例如等待資源逾時），delay 秒後重新排入佇列，不計入重試次數
+    """
+
+    def __init__(self, message: str = '', delay: float = 5):
+        super().__init__(message)
+        self.delay = delay
+
+
+@dataclass
+class Job:
+    id: int
+    kind: str
+    payload: Dict[str, Any]
+    attempts: int
+    lease_owner: Optional[str] = None
+
+
+class JobQueue:
+    """
+    以 SQLite (WAL 模式) 實作的本地持久化工作佇列。
+    工作被領取時會帶一個租約 (lease)，worker 中途重啟導致租約過期時，
+    其他 consumer 會重新領取該工作，因此不會遺失使用者的圖片。
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 300, max_attempts: int = 3):
+        self.db = SQLiteDatabase(path, JOB_SCHEMA)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], delay: float = 0) -> int:
+        """
+        新增一筆工作，回傳工作 ID
+        """
+        now = time.time()
+        with self.db.transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (kind, payload, available_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (kind, json.dumps(payload, ensure_ascii=False), now + delay, now, now),
+            )
+            return cursor.lastrowid
+
+    def claim(self, worker_id: str) -> Optional[Job]:
+        """
+        領取一筆可執行的工作；租約過期的 running 工作也會被重新領取。
+        租約過期且重試次數已用盡的工作（例如處理時讓 process 崩潰的圖片）直接標記為失敗，不再重試
+        """
+        now = time.time()
+        with self.db.transaction() as conn:
+            abandoned = conn.execute(
+                "UPDATE jobs SET status = 'failed', lease_owner = NULL, lease_expires_at = NULL, "
+                "last_error = '租約過期且重試次數已用盡', updated_at = ? "
+                "WHERE status = 'running' AND lease_expires_at <= ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            ).rowcount
+            if abandoned:
+                logging.warning(f"{abandoned} 筆工作租約過期且重試次數已用盡，標記為失敗")
+            row = conn.execute(
+                "SELECT id, kind, payload, attempts FROM jobs "
+                "WHERE (status = 'pending' AND available_at <= ?) "
+                "OR (status = 'running' AND lease_expires_at <= ?) "
+                "ORDER BY available_at, id LIMIT 1",
+                (now, now),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_owner = ?, "
+                "lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                (worker_id, now + self.lease_seconds, now, row["id"]),
+            )
+        return Job(id=row["id"], kind=row["kind"], payload=json.loads(row["payload"]), attempts=row["attempts"] + 1,
+                   lease_owner=worker_id)
+
+    def claim_group(self, kind: str, group_key: str, worker_id: str, limit: int) -> List[Job]:
+        """
+        領取 payload 中 group_key 相同、仍在等待的其他工作（不論是否已到可執行時間），
+        用來合併處理同一位使用者連續傳送的圖片；佇列積壓有上限，直接比對 payload 即可
+        """
+        if limit <= 0:
+            return []
+        now = time.time()
+        with self.db.transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, kind, payload, attempts FROM jobs "
+                "WHERE status = 'pending' AND kind = ? AND json_extract(payload, '$.group_key') = ? "
+                "ORDER BY id LIMIT ?",
+                (kind, group_key, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_owner = ?, "
+                "lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                [(worker_id, now + self.lease_seconds, now, row["id"]) for row in rows],
+            )
+        return [Job(id=row["id"], kind=row["kind"], payload=json.loads(row["payload"]), attempts=row["attempts"] + 1,
+                    lease_owner=worker_id) for row in rows]
+
+    def complete(self, job: Job) -> bool:
+        """
+        工作完成後直接刪除，佇列只保留尚未完成或失敗的工作。
+        只有仍持有租約的 consumer 能完成工作；租約已過期並被其他 consumer 領取時回傳 False
+        """
+        with self.db.transaction() as conn:
+            cursor = conn.execute("DELETE FROM jobs WHERE id = ? AND lease_owner IS ?", (job.id, job.lease_owner))
+        if cursor.rowcount == 0:
+            logging.warning(f"工作 {job.id} 的租約已不屬於 {job.lease_owner}，略過完成")
+            return False
+        return True
+
+    def fail(self, job: Job, error: str, retry_delay: float = 5) -> bool:
+        """
+        標記工作失敗，尚有重試次數時重新排入佇列並回傳 True。
+        租約已被其他 consumer 接手時不變更工作，同樣回傳 True（由新的持有者負責）
+        """
+        now = time.time()
+        retry = job.attempts < self.max_attempts
+        with self.db.transaction() as conn:
+            if retry:
+                cursor = conn.execute(
+                    "UPDATE jobs SET status = 'pending', available_at = ?, lease_owner = NULL, "
+                    "lease_expires_at = NULL, last_error = ?, updated_at = ? WHERE id = ? AND lease_owner IS ?",
+                    (now + retry_delay * job.attempts, error, now, job.id, job.lease_owner),
+                )
+            else:
+                cursor = conn.execute(
+                    "UPDATE jobs SET status = 'failed', lease_owner = NULL, lease_expires_at = NULL, "
+                    "last_error = ?, updated_at = ? WHERE id = ? AND lease_owner IS ?",
+                    (error, now, job.id, job.lease_owner),
+                )
+        if cursor.rowcount == 0:
+            logging.warning(f"工作 {job.id} 的租約已不屬於 {job.lease_owner}，略過失敗處理")
+            return True
+        return retry
+
+    def defer(self, job: Job, reason: str, delay: float = 5) -> bool:
+        """
+        將工作退回佇列並還原這次領取時增加的重試次數；租約已被其他 consumer 接手時回傳 False
+        """
+        now = time.time()
+        with self.db.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'pending', attempts = MAX(attempts - 1, 0), available_at = ?, "
+                "lease_owner = NULL, lease_expires_at = NULL, last_error = ?, updated_at = ? "
+                "WHERE id = ? AND lease_owner IS ?",
+                (now + delay, reason, now, job.id, job.lease_owner),
+            )
+        return cursor.rowcount > 0
+
+    def depth(self) -> int:
+        """
+        尚未完成的工作數量（含執行中）
+        """
+        row = self.db.connection().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'running')"
+        ).fetchone()
+        return row[0]
+
+    def counts(self) -> Dict[str, int]:
+        """
+        各狀態的工作數量：pending（等待中）、running（執行中）、failed（已放棄）
+        """
+        rows = self.db.connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {'pending': 0, 'running': 0, 'failed': 0}
+        counts.update({row[0]: row[1] for row in rows if row[0] in counts})
+        return counts
+
+
+class JobConsumerPool:
+    """
+    從 JobQueue 取出工作並執行的 consumer thread pool。
+    每個 process 都可以啟動自己的 pool，整體吞吐量取決於 consumer 的總數。
+    handlers: kind -> handler(job)
+    on_give_up: 重試次數用盡時呼叫 on_give_up(job, error)，用來通知使用者
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handlers: Dict[str, Callable[[Job], None]],
+        consumers: int = 2,
+        poll_interval: float = 1.0,
+        on_give_up: Optional[Callable[[Job, Exception], None]] = None,
+    ):
+        self.queue = queue
+        self.handlers = handlers
+        self.consumers = consumers
+        self.poll_interval = poll_interval
+        self.on_give_up = on_give_up
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.consumers):
+            worker_id = f"{os.getpid()}-{i}-{uuid.uuid4().hex[:6]}"
+            thread = threading.Thread(target=self._run, args=(worker_id,), name=f"job-consumer-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logging.info(f"啟動 {self.consumers} 個工作 consumer (pid={os.getpid()})")
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def run_once(self, worker_id: str = "inline") -> bool:
+        """
+        領取並執行一筆工作，沒有工作時回傳 False
+        """
+        job = self.queue.claim(worker_id)
+        if job is None:
+            return False
+        handler = self.handlers.get(job.kind)
+        try:
+            if handler is None:
+                raise ValueError(f"未知的工作類型: {job.kind}")
+            handler(job)
+        except JobDeferred as e:
+            logging.info(f"工作 {job.id} ({job.kind}) 延後 {e.delay} 秒執行：{e}")
+            self.queue.defer(job, str(e), e.delay)
+        except Exception as e:
+            logging.error(f"執行工作 {job.id} ({job.kind}) 失敗，第 {job.attempts} 次：{e}")
+            if not self.queue.fail(job, str(e)) and self.on_give_up:
+                try:
+                    self.on_give_up(job, e)
+                except Exception as notify_error:
+                    logging.error(f"通知工作 {job.id} 失敗時發生錯誤：{notify_error}")
+        else:
+            self.queue.complete(job)
+        return True
+
+    def _run(self, worker_id: str):
+        while not self._stop.is_set():
+            try:
+                if not self.run_once(worker_id):
+                    self._stop.wait(self.poll_interval)
+            except Exception as e:
+                logging.error(f"工作 consumer {worker_id} 發生錯誤：{e}")
+                self._stop.wait(self.poll_interval)
+
+
+class AsyncJobConsumerPool:
+    """
+    在 asyncio event loop 中執行工作的 consumer，handler 為 coroutine function。
+    單一 dispatcher 只要還有空位就領取工作，每筆工作各自是一個 task，
+    同一個 process 最多同時處理 concurrency 筆工作（大多時間都在等待 Vision / LLM / LINE 的回應）。
+    SQLite 的領取與完成都很短，放到 thread 執行以免卡住 event loop。
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handlers: Dict[str, Callable[[Job], Awaitable[None]]],
+        concurrency: int = 100,
+        poll_interval: float = 1.0,
+        on_give_up: Optional[Callable[[Job, Exception], Awaitable[None]]] = None,
+    ):
+        self.queue = queue
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.on_give_up = on_give_up
+        self.worker_id = f"{os.getpid()}-async-{uuid.uuid4().hex[:6]}"
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._tasks = set()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    def start(self):
+        """
+        在 event loop 中啟動 dispatcher
+        """
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        logging.info(f"啟動非同步工作 consumer，最多同時 {self.concurrency} 筆 (pid={os.getpid()})")
+
+    def wake(self):
+        """
+        有新工作時叫醒 dispatcher，不必等到下一次輪詢
+        """
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self, timeout: Optional[float] = None):
+        """
+        停止領取新工作並等待執行中的工作；逾時未完成的工作租約到期後會被重新領取
+        """
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=timeout)
+
+    async def run_once(self, worker_id: str = "inline") -> bool:
+        """
+        領取並執行一筆工作，沒有工作時回傳 False
+        """
+        job = await asyncio.to_thread(self.queue.claim, worker_id)
+        if job is None:
+            return False
+        await self._execute(job)
+        return True
+
+    async def _execute(self, job: Job):
+        handler = self.handlers.get(job.kind)
+        try:
+            if handler is None:
+                raise ValueError(f"未知的工作類型: {job.kind}")
+            await handler(job)
+        except JobDeferred as e:
+            logging.info(f"工作 {job.id} ({job.kind}) 延後 {e.delay} 秒執行：{e}")
+            await asyncio.to_thread(self.queue.defer, job, str(e), e.delay)
+        except Exception as e:
+            logging.error(f"執行工作 {job.id} ({job.kind}) 失敗，第 {job.attempts} 次：{e}")
+            retry = await asyncio.to_thread(self.queue.fail, job, str(e))
+            if not retry and self.on_give_up:
+                try:
+                    await self.on_give_up(job, e)
+                except Exception as notify_error:
+                    logging.error(f"通知工作 {job.id} 失敗時發生錯誤：{notify_error}")
+        else:
+            await asyncio.to_thread(self.queue.complete, job)
+
+    async def _dispatch(self):
+        while True:
+            await self._slots.acquire()
+            try:
+                job = await asyncio.to_thread(self.queue.claim, self.worker_id)
+            except Exception as e:
+                logging.error(f"非同步工作 consumer 領取工作失敗：{e}")
+                job = None
+            if job is None:
+                self._slots.release()
+                await self._wait()
+                continue
+            task = asyncio.create_task(self._run_job(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_job(self, job: Job):
+        try:
+            await self._execute(job)
+        except Exception as e:
+            logging.error(f"非同步工作 consumer 發生錯誤：{e}")
+        finally:
+            self._slots.release()
+
+    async def _wait(self):
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
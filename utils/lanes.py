@@ -0,0 +1,135 @@
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, Awaitable
+
+
+class _LaneStats:
+    """
+    處理通道的計數：執行中、等待中、完成數、被拒絕數與平均等待時間
+    """
+
+    def __init__(self, name: str, concurrency: int, max_pending: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.shed = 0
+        self.wait_ms_total = 0.0
+        self._lock = threading.Lock()
+
+    def admit(self) -> bool:
+        # 執行中加上等待中的數量超過上限時拒絕，不讓工作無限堆積
+        with self._lock:
+            if self.running + self.waiting >= self.concurrency + self.max_pending:
+                self.shed += 1
+                return False
+            self.waiting += 1
+            return True
+
+    def started(self, submitted_at: float):
+        with self._lock:
+            self.waiting -= 1
+            self.running += 1
+            self.wait_ms_total += (time.perf_counter() - submitted_at) * 1000
+
+    def finished(self):
+        with self._lock:
+            self.running -= 1
+            self.completed += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            started = self.completed + self.running
+            return {
+                'lane': self.name,
+                'concurrency': self.concurrency,
+                'max_pending': self.max_pending,
+                'running': self.running,
+                'waiting': self.waiting,
+                'completed': self.completed,
+                'shed': self.shed,
+                'avg_wait_ms': round(self.wait_ms_total / started, 1) if started else 0.0,
+            }
+
+
+class Lane:
+    """
+    有獨立 thread pool 的處理通道。
+    便宜的文字指令與耗時的圖片工作各走一條，圖片積壓時文字指令仍能立即處理；
+    等待中的工作超過 max_pending 時 submit 直接回傳 False，由呼叫端回覆忙碌訊息。
+    """
+
+    def __init__(self, name: str, concurrency: int, max_pending: int = 100):
+        self.name = name
+        self._stats = _LaneStats(name, concurrency, max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"lane-{name}")
+
+    def submit(self, func: Callable, *args) -> bool:
+        """
+        排入工作，被拒絕時回傳 False
+        """
+        if not self._stats.admit():
+            return False
+        self._executor.submit(self._run, time.perf_counter(), func, args)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return self._stats.snapshot()
+
+    def _run(self, submitted_at: float, func: Callable, args):
+        self._stats.started(submitted_at)
+        try:
+            func(*args)
+        except Exception as e:
+            logging.error(f"通道 {self.name} 執行工作時發生錯誤：{e}")
+        finally:
+            self._stats.finished()
+
+
+class AsyncLane:
+    """
+    Lane 的 asyncio 版本：以 semaphore 限制同時執行的 coroutine 數量，
+    並有自己的 thread pool 執行阻塞的函式，不和其他通道共用 asyncio 預設的 executor。
+    """
+
+    def __init__(self, name: str, concurrency: int, max_pending: int = 100, threads: int = 4):
+        self.name = name
+        self._stats = _LaneStats(name, concurrency, max_pending)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix=f"lane-{name}")
+        self._tasks = set()
+
+    def spawn(self, func: Callable[..., Awaitable[None]], *args) -> bool:
+        """
+        在 event loop 中排入 func(*args)，被拒絕時回傳 False
+        """
+        if not self._stats.admit():
+            return False
+        task = asyncio.create_task(self._run(time.perf_counter(), func, args))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def run_blocking(self, func: Callable, *args):
+        """
+        在此通道的 thread pool 中執行阻塞的函式
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def stats(self) -> Dict[str, Any]:
+        return self._stats.snapshot()
+
+    async def _run(self, submitted_at: float, func: Callable[..., Awaitable[None]], args):
+        async with self._semaphore:
+            self._stats.started(submitted_at)
+            try:
+                await func(*args)
+            except Exception as e:
+                logging.error(f"通道 {self.name} 執行工作時發生錯誤：{e}")
+            finally:
+                self._stats.finished()
@@ -0,0 +1,88 @@
+from typing import List, Dict, Any, Optional
+
+# 兩欄之間的空白至少要佔圖片寬度的比例才視為不同文件
+DEFAULT_MIN_GAP_RATIO = 0.08
+# 一欄至少要有這個寬度比例才視為獨立文件，否則（例如收據上的價格欄）併入左邊的欄
+DEFAULT_MIN_DOCUMENT_WIDTH_RATIO = 0.2
+
+
+def make_block(text: str, left: float, top: float, right: float, bottom: float) -> Dict[str, Any]:
+    """
+    建立版面區塊：文字與外框 (left, top, right, bottom)
+    """
+    return {'text': text, 'box': (left, top, right, bottom)}
+
+
+def segment_blocks(blocks: List[Dict[str, Any]], image_width: Optional[float] = None,
+                   min_gap_ratio: float = DEFAULT_MIN_GAP_RATIO,
+                   min_width_ratio: float = DEFAULT_MIN_DOCUMENT_WIDTH_RATIO) -> List[List[Dict[str, Any]]]:
+    """
+    將並排拍攝的多張發票/收據切成多份文件。
+    依區塊的水平範圍合併成欄，欄與欄之間有足夠空白時視為不同文件，回傳由左到右的區塊群組。
+    同一張收據的品名欄與價格欄也可能被分成兩欄，太窄的欄不視為獨立文件，併回相鄰的欄。
+    """
+    blocks = [block for block in blocks if block['text'].strip()]
+    if not blocks:
+        return []
+    if image_width is None:
+        image_width = max(block['box'][2] for block in blocks) - min(block['box'][0] for block in blocks)
+    min_gap = max(image_width, 1) * min_gap_ratio
+
+    groups = []
+    group_right = None
+    for block in sorted(blocks, key=lambda b: b['box'][0]):
+        left, _, right, _ = block['box']
+        if group_right is None or left - group_right > min_gap:
+            groups.append([block])
+            group_right = right
+        else:
+            groups[-1].append(block)
+            group_right = max(group_right, right)
+    return _merge_narrow_groups(groups, image_width * min_width_ratio)
+
+
+def _merge_narrow_groups(groups: List[List[Dict[str, Any]]], min_width: float) -> List[List[Dict[str, Any]]]:
+    def is_document(group):
+        return max(block['box'][2] for block in group) - min(block['box'][0] for block in group) >= min_width
+
+    merged = []
+    pending = []
+    for group in groups:
+        if is_document(group):
+            merged.append(pending + group)
+            pending = []
+        elif merged:
+            merged[-1].extend(group)
+        else:
+            # 最左邊的窄欄併入右邊第一份文件
+            pending.extend(group)
+    if pending:
+        if merged:
+            merged[-1].extend(pending)
+        else:
+            merged.append(pending)
+    return merged
+
+
+def join_words(words: List[str]) -> str:
+    """
+    串接同一行的 OCR 單字：中文字之間不加空白，其他（英數字、金額）以空白分隔
+    """
+    text = ''
+    for word in words:
+        if text and not (_is_cjk(text[-1]) and _is_cjk(word[0])):
+            text += ' '
+        text += word
+    return text
+
+
+def _is_cjk(char: str) -> bool:
+    return ord(char) > 0x2E7F
+
+
+def blocks_to_text(blocks: List[Dict[str, Any]]) -> str:
+    """
+    依閱讀順序（由上而下、由左而右）串接區塊文字
+    """
+    ordered = sorted(blocks, key=lambda b: (b['box'][1], b['box'][0]))
+    return '\n'.join(block['text'].strip() for block in ordered)
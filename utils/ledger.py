@@ -0,0 +1,137 @@
+import time
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Optional, List, Dict, Any
+
+from utils.sqlite_utils import SQLiteDatabase
+
+# 彙總表中代表「所有類別」的列
+ALL_CATEGORIES = '*'
+DEFAULT_CATEGORY = '未分類'
+# 帳本月份以台灣時間計算（台灣沒有日光節約時間，固定 UTC+8），不受容器時區影響
+TAIPEI_TZ = timezone(timedelta(hours=8), 'Asia/Taipei')
+
+LEDGER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS expenses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    month TEXT NOT NULL,
+    category TEXT NOT NULL,
+    amount REAL NOT NULL,
+    source TEXT,
+    source_key TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_expenses_user_month ON expenses (user_id, month);
+CREATE TABLE IF NOT EXISTS expense_totals (
+    user_id TEXT NOT NULL,
+    month TEXT NOT NULL,
+    category TEXT NOT NULL,
+    total REAL NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, month, category)
+) WITHOUT ROWID;
+"""
+
+
+def month_key(when: Optional[datetime] = None) -> str:
+    """
+    將日期轉為帳本使用的月份鍵，例如 2024-11
+    未指定時間時使用目前的台灣時間；帶時區的時間先換算成台灣時間，不帶時區的視為台灣時間
+    """
+    if when is None:
+        when = datetime.now(TAIPEI_TZ)
+    elif isinstance(when, datetime) and when.tzinfo is not None:
+        when = when.astimezone(TAIPEI_TZ)
+    return when.strftime('%Y-%m')
+
+
+def parse_amount(value) -> Optional[float]:
+    """
+    將 AI 回傳的金額轉為數字，無法解析時回傳 None
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(',', '').replace('$', '').strip())
+    except ValueError:
+        return None
+
+
+class ExpenseLedger:
+    """
+    使用者支出帳本。
+    expenses 為只會新增的明細表；expense_totals 在每次寫入時同步累加，
+    查詢本月支出或分類統計時只讀彙總表，不需要掃描歷史明細。
+    source_key 標示支出的來源（例如 LINE 訊息與單據序號、電子發票號碼），
+    同一位使用者同一個 source_key 只記一次，工作重試或重複上傳同一張電子發票不會重複記帳。
+    """
+
+    def __init__(self, path: str):
+        self.db = SQLiteDatabase(path, LEDGER_SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        # 舊版帳本沒有 source_key 欄位
+        conn = self.db.connection()
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(expenses)")}
+        if 'source_key' not in columns:
+            conn.execute("ALTER TABLE expenses ADD COLUMN source_key TEXT")
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_expenses_source_key ON expenses (user_id, source_key)")
+
+    def record_expense(self, user_id: str, amount, category: Optional[str] = None,
+                       when: Optional[datetime] = None, source: Optional[str] = None,
+                       source_key: Optional[str] = None) -> bool:
+        """
+        記錄一筆支出並更新彙總，金額無效時回傳 False；
+        source_key 已記錄過時不再累加，視為已記錄並回傳 True
+        """
+        value = parse_amount(amount)
+        if not user_id or value is None:
+            logging.warning(f"無法記錄支出：user_id={user_id}, amount={amount}")
+            return False
+        month = month_key(when)
+        category = (category or '').strip() or DEFAULT_CATEGORY
+        with self.db.transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO expenses (user_id, month, category, amount, source, source_key, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, month, category, value, source, source_key, time.time()),
+            )
+            if cursor.rowcount == 0:
+                logging.info(f"支出 {source_key} 已記錄過，略過")
+                return True
+            conn.executemany(
+                "INSERT INTO expense_totals (user_id, month, category, total, count) VALUES (?, ?, ?, ?, 1) "
+                "ON CONFLICT (user_id, month, category) DO UPDATE SET "
+                "total = total + excluded.total, count = count + 1",
+                [(user_id, month, category, value), (user_id, month, ALL_CATEGORIES, value)],
+            )
+        return True
+
+    def monthly_total(self, user_id: str, month: Optional[str] = None) -> Dict[str, Any]:
+        """
+        取得某月份的總支出與筆數
+        """
+        month = month or month_key()
+        row = self.db.connection().execute(
+            "SELECT total, count FROM expense_totals WHERE user_id = ? AND month = ? AND category = ?",
+            (user_id, month, ALL_CATEGORIES),
+        ).fetchone()
+        if row is None:
+            return {'month': month, 'total': 0.0, 'count': 0}
+        return {'month': month, 'total': row['total'], 'count': row['count']}
+
+    def category_totals(self, user_id: str, month: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        取得某月份各類別的支出，依金額由大到小排序
+        """
+        month = month or month_key()
+        rows = self.db.connection().execute(
+            "SELECT category, total, count FROM expense_totals "
+            "WHERE user_id = ? AND month = ? AND category != ? ORDER BY total DESC",
+            (user_id, month, ALL_CATEGORIES),
+        ).fetchall()
+        return [{'category': row['category'], 'total': row['total'], 'count': row['count']} for row in rows]
@@ -0,0 +1,68 @@
+import time
+import logging
+from typing import Optional, List, Any
+
+# LINE reply token 只能在收到事件後短時間內使用，保守一點提早改用 push
+DEFAULT_REPLY_TOKEN_TTL = 50
+
+
+def get_source_id(event) -> Optional[str]:
+    """
+    取得 push_message 的對象：群組 > 聊天室 > 使用者
+    """
+    source = event.source
+    return getattr(source, 'group_id', None) or getattr(source, 'room_id', None) or getattr(source, 'user_id', None)
+
+
+def is_reply_token_valid(received_at: Optional[float], ttl: float = DEFAULT_REPLY_TOKEN_TTL,
+                         now: Optional[float] = None) -> bool:
+    """
+    判斷 reply token 是否仍在有效時間內
+    received_at: 事件時間（秒）
+    """
+    if received_at is None:
+        return False
+    if now is None:
+        now = time.time()
+    return now - received_at < ttl
+
+
+def deliver_messages(line_bot_api, messages: List[Any], reply_token: Optional[str] = None,
+                     received_at: Optional[float] = None, target_id: Optional[str] = None,
+                     ttl: float = DEFAULT_REPLY_TOKEN_TTL) -> str:
+    """
+    reply token 還有效時用 reply_message，否則（或 reply 失敗時）改用 push_message
+    回傳實際使用的方式：'reply' 或 'push'
+    """
+    if reply_token and is_reply_token_valid(received_at, ttl):
+        try:
+            line_bot_api.reply_message(reply_token, messages)
+            return 'reply'
+        except Exception as e:
+            if not target_id:
+                raise
+            logging.warning(f"reply_message 失敗，改用 push_message：{e}")
+    if not target_id:
+        raise ValueError("reply token 已過期且沒有 push 對象")
+    line_bot_api.push_message(target_id, messages)
+    return 'push'
+
+
+async def deliver_messages_async(line_bot_api, messages: List[Any], reply_token: Optional[str] = None,
+                                 received_at: Optional[float] = None, target_id: Optional[str] = None,
+                                 ttl: float = DEFAULT_REPLY_TOKEN_TTL) -> str:
+    """
+    deliver_messages 的非同步版本，line_bot_api 為 AsyncLineBotApi
+    """
+    if reply_token and is_reply_token_valid(received_at, ttl):
+        try:
+            await line_bot_api.reply_message(reply_token, messages)
+            return 'reply'
+        except Exception as e:
+            if not target_id:
+                raise
+            logging.warning(f"reply_message 失敗，改用 push_message：{e}")
+    if not target_id:
+        raise ValueError("reply token 已過期且沒有 push 對象")
+    await line_bot_api.push_message(target_id, messages)
+    return 'push'
@@ -0,0 +1,235 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from typing import Optional, Dict, Any
+
+from PIL import Image
+
+# 解碼後的像素上限，超過時不在本地解碼（JPEG 會先以 draft 縮小再檢查）
+MAX_DECODED_PIXELS = int(os.environ.get("MAX_DECODED_PIXELS", 40_000_000))
+# 非同步模式下等待預算的輪詢間隔
+ASYNC_POLL_INTERVAL = 0.05
+
+
+class ImageTooLargeError(Exception):
+    """
+    圖片解碼後的像素超過上限
+    """
+
+
+class MemoryBudgetExceeded(Exception):
+    """
+    等待記憶體預算逾時
+    """
+
+
+def check_decoded_pixels(image: Image.Image, max_pixels: int = MAX_DECODED_PIXELS):
+    """
+    Image.open 只讀取檔頭，在真正解碼前檢查像素數
+    """
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ImageTooLargeError(f"圖片 {width}x{height} 超過 {max_pixels} 像素")
+
+
+def estimate_image_bytes(path: str, max_pixels: int = MAX_DECODED_PIXELS) -> int:
+    """
+    處理一張圖片大約需要的記憶體：原始檔案與重新壓縮後的內容，加上解碼後的像素（RGB 與灰階各一份）
+    """
+    file_size = os.path.getsize(path)
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+    except Exception:
+        return file_size * 2
+    return file_size * 2 + min(width * height, max_pixels) * 4
+
+
+class ByteBudget:
+    """
+    process 內同時處理中的位元組預算。
+    每筆工作先依估計的記憶體用量取得額度，處理完再歸還，總用量不超過 capacity，記憶體用量因此可預期。
+    單筆超過 capacity 的工作以 capacity 計算，只能在沒有其他工作時執行。
+    """
+
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.capacity = capacity
+        self._in_use = 0
+        self._peak = 0
+        self._admitted = 0
+        self._waits = 0
+        self._rejected = 0
+        self._condition = threading.Condition()
+        with _budgets_lock:
+            _budgets[name] = self
+
+    def try_acquire(self, size: int) -> bool:
+        """
+        立即取得額度，不足時回傳 False
+        """
+        size = min(size, self.capacity)
+        with self._condition:
+            return self._take(size)
+
+    def acquire(self, size: int, timeout: Optional[float] = None) -> bool:
+        """
+        取得額度，不足時最多等待 timeout 秒
+        """
+        size = min(size, self.capacity)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            if self._take(size):
+                return True
+            self._waits += 1
+            while True:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._rejected += 1
+                    return False
+                self._condition.wait(remaining)
+                if self._take(size):
+                    return True
+
+    def release(self, size: int):
+        size = min(size, self.capacity)
+        with self._condition:
+            self._in_use -= size
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self, size: int, timeout: Optional[float] = None):
+        """
+        在 with 區塊內持有額度，逾時拋出 MemoryBudgetExceeded
+        """
+        if not self.acquire(size, timeout):
+            raise MemoryBudgetExceeded(f"{self.name} 記憶體預算不足：需要 {size} bytes")
+        try:
+            yield
+        finally:
+            self.release(size)
+
+    @asynccontextmanager
+    async def reserve_async(self, size: int, timeout: Optional[float] = None):
+        """
+        reserve 的非同步版本，以輪詢等待額度，不佔用 thread
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not self.try_acquire(size):
+            with self._condition:
+                self._waits += 1
+            while not self.try_acquire(size):
+                if deadline is not None and time.monotonic() >= deadline:
+                    with self._condition:
+                        self._rejected += 1
+                    raise MemoryBudgetExceeded(f"{self.name} 記憶體預算不足：需要 {size} bytes")
+                await asyncio.sleep(ASYNC_POLL_INTERVAL)
+        try:
+            yield
+        finally:
+            self.release(size)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                'capacity': self.capacity,
+                'in_use': self._in_use,
+                'peak': self._peak,
+                'admitted': self._admitted,
+                'waits': self._waits,
+                'rejected': self._rejected,
+            }
+
+    def _take(self, size: int) -> bool:
+        if self._in_use + size > self.capacity:
+            return False
+        self._in_use += size
+        self._admitted += 1
+        self._peak = max(self._peak, self._in_use)
+        return True
+
+
+_budgets: Dict[str, ByteBudget] = {}
+_budgets_lock = threading.Lock()
+
+
+def current_rss() -> Optional[int]:
+    """
+    目前的 RSS（bytes），只支援 Linux
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss() -> Optional[int]:
+    """
+    process 啟動以來的最高 RSS（bytes）
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 的單位是 KB，macOS 是 bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class _StageMemory:
+    """
+    各處理階段結束時的 RSS 與該階段造成的最高 RSS 成長。
+    RSS 為整個 process 的數值，同時有多筆工作時只能當作趨勢參考
+    """
+
+    def __init__(self):
+        self._stages: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track(self, stage: str):
+        peak_before = peak_rss()
+        try:
+            yield
+        finally:
+            rss, peak_after = current_rss(), peak_rss()
+            growth = peak_after - peak_before if peak_before is not None and peak_after is not None else 0
+            with self._lock:
+                stats = self._stages.setdefault(stage, {'count': 0, 'max_rss': 0, 'max_peak_growth': 0})
+                stats['count'] += 1
+                stats['max_rss'] = max(stats['max_rss'], rss or 0)
+                stats['max_peak_growth'] = max(stats['max_peak_growth'], growth)
+            if growth > 0:
+                logging.info(f"階段 {stage} 使 process 最高 RSS 增加 {growth} bytes")
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {stage: dict(stats) for stage, stats in sorted(self._stages.items())}
+
+
+_stage_memory = _StageMemory()
+
+
+def track_stage(stage: str):
+    """
+    記錄一個處理階段的記憶體用量：with track_stage('ocr'): ...
+    """
+    return _stage_memory.track(stage)
+
+
+def memory_stats() -> Dict[str, Any]:
+    """
+    各記憶體預算的用量、各階段的 RSS 與 process 的最高 RSS
+    """
+    with _budgets_lock:
+        budgets = sorted(_budgets.items())
+    return {
+        'budgets': {name: budget.stats() for name, budget in budgets},
+        'stages': _stage_memory.stats(),
+        'peak_rss': peak_rss(),
+    }
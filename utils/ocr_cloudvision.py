@@ -1,27 +1,35 @@
-from google.api_core.exceptions import GoogleAPICallError, RetryError
-from google.cloud import vision
-from google.oauth2 import service_account
 import logging
 import json
 import os
 import io
+import asyncio
 from utils.ai_agent import get_receipt_ai_agent_from_env
+from utils.layout import make_block, segment_blocks, blocks_to_text
+from utils.image_preprocess import prepare_image_for_ocr
+from utils.vision_batcher import get_vision_batcher, VISION_TIMEOUT
+from utils.circuit_breaker import get_circuit_breaker
 
 # Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
+def _load_credentials():
+    from google.oauth2 import service_account
+    # Detect Environment
+    if 'GOOGLE_APPLICATION_CREDENTIALS_JSON' not in os.environ:
+        raise EnvironmentError('Environment variable GOOGLE_APPLICATION_CREDENTIALS_JSON Not yet setting')
+    # Load service info
+    env_google_json = os.environ['GOOGLE_APPLICATION_CREDENTIALS_JSON']
+    env_google_json = env_google_json.replace('\n', '\\n')
+    service_account_info = json.loads(env_google_json)
+    return service_account.Credentials.from_service_account_info(service_account_info)
+
+
 def get_vision_client():
+    # google-cloud-vision / grpc 載入很慢，第一次呼叫 Vision 時才匯入
+    from google.cloud import vision
     try:
-        # Detect Environment
-        if 'GOOGLE_APPLICATION_CREDENTIALS_JSON' not in os.environ:
-            raise EnvironmentError('Environment variable GOOGLE_APPLICATION_CREDENTIALS_JSON Not yet setting')
-        # Load service info
-        env_google_json = os.environ['GOOGLE_APPLICATION_CREDENTIALS_JSON']
-        env_google_json = env_google_json.replace('\n', '\\n')
-        service_account_info = json.loads(env_google_json)
-        credentials = service_account.Credentials.from_service_account_info(service_account_info)
-        client = vision.ImageAnnotatorClient(credentials=credentials)
+        client = vision.ImageAnnotatorClient(credentials=_load_credentials())
         return client
     except json.JSONDecodeError as e:
         logging.error('Service account JSON Analyze error：%s', e)
@@ -31,42 +39,207 @@ def get_vision_client():
         raise
 
 
-def detect_text(path):
-    client = get_vision_client()
+# grpc.aio 的 client 綁定建立時的 event loop，每個 event loop 各自建立一個
+_vision_async_clients = {}
+
+
+def get_vision_async_client():
+    """
+    取得目前 event loop 共用的 ImageAnnotatorAsyncClient
+    """
+    from google.cloud import vision
+    loop = asyncio.get_running_loop()
+    client = _vision_async_clients.get(loop)
+    if client is None:
+        try:
+            client = vision.ImageAnnotatorAsyncClient(credentials=_load_credentials())
+        except Exception as e:
+            logging.error('Init Vision API async client error：%s', e)
+            raise
+        _vision_async_clients[loop] = client
+    return client
+
+
+# Vision 連續失敗時暫停呼叫，不讓每張圖片都等到逾時
+_vision_circuit = get_circuit_breaker('vision')
+
 
+def _read_image_for_ocr(path):
+    # 讀檔與前處理，失敗時回傳 None
     try:
         with io.open(path, 'rb') as image_file:
             content = image_file.read()
     except FileNotFoundError:
         logging.error('File Not Found:%s', path)
-        return ''
+        return None
     except Exception as e:
         logging.error('Error while reading:%s', e)
-        return ''
+        return None
 
     try:
-        image = vision.Image(content=content)
-        response = client.text_detection(image=image)
+        content = prepare_image_for_ocr(content)
+    except Exception as e:
+        logging.warning('Preprocess image error, upload original:%s', e)
+    return content
+
+
+def annotate_text(path):
+    """
+    呼叫 Vision text_detection，回傳 response；失敗時回傳 None
+    有設定 VISION_BATCH_WINDOW_MS 時，與其他同時到達的圖片合併成一次 batch_annotate_images
+    """
+    from google.api_core.exceptions import GoogleAPICallError, RetryError
+    from google.cloud import vision
+
+    batcher = get_vision_batcher(get_vision_client)
+    client = get_vision_client() if batcher is None else None
+
+    content = _read_image_for_ocr(path)
+    if content is None or not _allow_vision():
+        return None
+
+    try:
+        if batcher is not None:
+            response = batcher.annotate(content, timeout=batcher.result_timeout)
+        else:
+            image = vision.Image(content=content)
+            response = client.text_detection(image=image, timeout=VISION_TIMEOUT)
+        _vision_circuit.record_success()
         if response.error.message:
             logging.error('Vision API return error：%s', response.error.message)
-            return ''
-        texts = response.text_annotations
-        if texts:
-            return texts[0].description
+            return None
+        return response
+    except GoogleAPICallError as e:
+        logging.error('Call Vision API error:%s', e)
+        _vision_circuit.record_failure()
+        return None
+    except RetryError as e:
+        logging.error('Call Vision API Retry error:%s', e)
+        _vision_circuit.record_failure()
+        return None
+    except Exception as e:
+        logging.error('Handle Vision API Response error:%s', e)
+        _vision_circuit.record_failure()
+        return None
+
+
+async def annotate_text_async(path):
+    """
+    annotate_text 的非同步版本：讀檔與前處理在 thread 中執行，Vision 呼叫以 grpc.aio 等待
+    有設定 VISION_BATCH_WINDOW_MS 時同樣交給 VisionBatcher 合併
+    """
+    from google.api_core.exceptions import GoogleAPICallError, RetryError
+    from google.cloud import vision
+
+    content = await asyncio.to_thread(_read_image_for_ocr, path)
+    if content is None or not _allow_vision():
+        return None
+
+    try:
+        batcher = get_vision_batcher(get_vision_client)
+        if batcher is not None:
+            response = await asyncio.wait_for(asyncio.wrap_future(batcher.submit(content)), batcher.result_timeout)
         else:
-            logging.warning('Can not detect any text.')
-            return ''
+            request = vision.AnnotateImageRequest(
+                image=vision.Image(content=content),
+                features=[vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)],
+            )
+            batch = await get_vision_async_client().batch_annotate_images(requests=[request], timeout=VISION_TIMEOUT)
+            response = batch.responses[0]
+        _vision_circuit.record_success()
+        if response.error.message:
+            logging.error('Vision API return error：%s', response.error.message)
+            return None
+        return response
     except GoogleAPICallError as e:
         logging.error('Call Vision API error:%s', e)
-        return ''
+        _vision_circuit.record_failure()
+        return None
     except RetryError as e:
         logging.error('Call Vision API Retry error:%s', e)
-        return ''
+        _vision_circuit.record_failure()
+        return None
     except Exception as e:
         logging.error('Handle Vision API Response error:%s', e)
+        _vision_circuit.record_failure()
+        return None
+
+
+def _allow_vision():
+    if _vision_circuit.allow():
+        return True
+    logging.warning('Vision API 斷路器開啟，暫停 OCR')
+    return False
+
+
+def detect_text(path):
+    response = annotate_text(path)
+    if response is None:
+        return ''
+    texts = response.text_annotations
+    if texts:
+        return texts[0].description
+    else:
+        logging.warning('Can not detect any text.')
         return ''
 
 
+def _block_text(block):
+    # 依 Vision 偵測到的斷行/空白還原區塊文字
+    parts = []
+    for paragraph in block.paragraphs:
+        for word in paragraph.words:
+            for symbol in word.symbols:
+                parts.append(symbol.text)
+                break_name = symbol.property.detected_break.type_.name
+                if break_name in ('SPACE', 'SURE_SPACE'):
+                    parts.append(' ')
+                elif break_name in ('EOL_SURE_SPACE', 'LINE_BREAK'):
+                    parts.append('\n')
+    return ''.join(parts).strip()
+
+
+def get_layout_blocks(response):
+    """
+    將 full_text_annotation 的每個 block 轉為版面區塊，回傳 (區塊列表, 圖片寬度)
+    """
+    blocks = []
+    image_width = None
+    for page in response.full_text_annotation.pages:
+        image_width = page.width or image_width
+        for block in page.blocks:
+            vertices = block.bounding_box.vertices
+            if not vertices:
+                continue
+            xs = [vertex.x for vertex in vertices]
+            ys = [vertex.y for vertex in vertices]
+            blocks.append(make_block(_block_text(block), min(xs), min(ys), max(xs), max(ys)))
+    return blocks, image_width
+
+
+def detect_documents(path):
+    """
+    一次 OCR 呼叫取得圖片中的多份文件（例如並排拍攝的多張發票），回傳每份文件的文字
+    只有一份文件時回傳 Vision 原本的完整文字
+    """
+    return _split_documents(annotate_text(path))
+
+
+async def detect_documents_async(path):
+    return _split_documents(await annotate_text_async(path))
+
+
+def _split_documents(response):
+    if response is None or not response.text_annotations:
+        return []
+    full_text = response.text_annotations[0].description
+    blocks, image_width = get_layout_blocks(response)
+    groups = segment_blocks(blocks, image_width)
+    if len(groups) <= 1:
+        return [full_text]
+    return [blocks_to_text(group) for group in groups]
+
+
 def parse_total_amount(text):
     try:
         agent = get_receipt_ai_agent_from_env()
@@ -77,11 +250,36 @@ def parse_total_amount(text):
         return "無法識別總金額"
 
 
+# 非同步模式下同時處理大量圖片，共用同一個 agent（與其 HTTP 連線池），不必每次重建
+_async_agent = None
+
+
+async def parse_total_amount_async(text):
+    global _async_agent
+    try:
+        if _async_agent is None:
+            _async_agent = get_receipt_ai_agent_from_env()
+        return await _async_agent.analyze_receipt_text_async(text)
+    except Exception as e:
+        logging.error('解析金額時發生錯誤：%s', e)
+        return "無法識別總金額"
+
+
 def extract_text_from_image(image_path):
     text = detect_text(image_path)
     return text
 
 
+def extract_documents_from_image(image_path):
+    documents = detect_documents(image_path)
+    return documents
+
+
+async def extract_documents_from_image_async(image_path):
+    documents = await detect_documents_async(image_path)
+    return documents
+
+
 # Local use
 if __name__ == "__main__":
     image_path = '.../xxx.JPG'
@@ -1,6 +1,9 @@
 import pytesseract
 from PIL import Image, ImageOps, ImageEnhance
 import re
+import logging
+from utils.layout import make_block, segment_blocks, blocks_to_text, join_words
+from utils.memory_budget import check_decoded_pixels
 
 
 def crop_image_to_roi(image):
@@ -39,6 +42,7 @@ def preprocess_image(image):
 def extract_text_from_image(image_path, lang='chi_tra'):
     # open image
     image = Image.open(image_path)
+    check_decoded_pixels(image)
     # preprocess image
     processed_image = preprocess_image(image)
     # OCR
@@ -46,10 +50,43 @@ def extract_text_from_image(image_path, lang='chi_tra'):
     text = pytesseract.image_to_string(processed_image, config=custom_config, lang=lang)
     text = text.replace('\n', '').strip()
     text = text.replace(' ', '').strip()
-    print("OCR result:" + text)
+    logging.debug(f"OCR 完成，{len(text)} 字")
     return text
 
 
+def extract_documents_from_image(image_path, lang='chi_tra'):
+    # open image, 不裁切以保留並排的每一張文件
+    image = Image.open(image_path)
+    check_decoded_pixels(image)
+    image = ImageOps.exif_transpose(image).convert('L')
+    # OCR with word boxes
+    custom_config = r'--oem 3 --psm 3'
+    data = pytesseract.image_to_data(image, config=custom_config, lang=lang, output_type=pytesseract.Output.DICT)
+    # group words by tesseract block, keeping paragraph/line breaks inside a block
+    words_by_block = {}
+    for i, word in enumerate(data['text']):
+        if not word.strip():
+            continue
+        left, top = data['left'][i], data['top'][i]
+        box = (left, top, left + data['width'][i], top + data['height'][i])
+        line_key = (data['par_num'][i], data['line_num'][i])
+        words_by_block.setdefault(data['block_num'][i], []).append((word.strip(), box, line_key))
+    blocks = []
+    for words in words_by_block.values():
+        lines = {}
+        for word, _, line_key in words:
+            lines.setdefault(line_key, []).append(word)
+        text = '\n'.join(join_words(line_words) for line_words in lines.values())
+        blocks.append(make_block(
+            text,
+            min(box[0] for _, box, _ in words),
+            min(box[1] for _, box, _ in words),
+            max(box[2] for _, box, _ in words),
+            max(box[3] for _, box, _ in words),
+        ))
+    return [blocks_to_text(group) for group in segment_blocks(blocks, image.width)]
+
+
 def parse_total_amount(text):
     # replace common OCR error token
     text = text.replace('S', '$')
@@ -73,8 +110,6 @@ def parse_total_amount(text):
     # construct whole regex
     pattern = keywords_pattern + r'\s*[:：]?\s*' + currency_symbols + r'\s*(' + amount_pattern + r')'
 
-    print(f"REGEX pattern:{pattern}")
-
     # find all possibilities
     matches = re.findall(pattern, text)
 
@@ -90,8 +125,6 @@ def parse_total_amount(text):
 
     pattern_without_keyword = '(' + currency_symbols + r'\s*' + amount_pattern + r')'
 
-    print(f"REGEX pattern:{pattern_without_keyword}")
-
     matches = re.findall(pattern_without_keyword, text)
     if matches:
         for amount_str in matches:
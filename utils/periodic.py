@@ -0,0 +1,55 @@
+import asyncio
+import logging
+import threading
+from typing import Callable, Optional, Awaitable
+
+
+class PeriodicTask:
+    """
+    在背景 daemon thread 中定期執行 func，例外只記錄不中斷
+    """
+
+    def __init__(self, name: str, interval: float, func: Callable[[], None], initial_delay: float = 0):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.initial_delay = initial_delay
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        if self._stop.wait(self.initial_delay):
+            return
+        while True:
+            try:
+                self.func()
+            except Exception as e:
+                logging.error(f"背景工作 {self.name} 發生錯誤：{e}")
+            if self._stop.wait(self.interval):
+                return
+
+
+async def run_periodically(name: str, interval: float, func: Callable[[], Awaitable[None]], initial_delay: float = 0):
+    """
+    PeriodicTask 的 asyncio 版本：在 event loop 中定期 await func()，例外只記錄不中斷，直到 task 被取消
+    """
+    await asyncio.sleep(initial_delay)
+    while True:
+        try:
+            await func()
+        except Exception as e:
+            logging.error(f"背景工作 {name} 發生錯誤：{e}")
+        await asyncio.sleep(interval)
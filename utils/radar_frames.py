@@ -0,0 +1,173 @@
+import io
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone, timedelta
+from typing import Optional, List
+
+from PIL import Image
+
+try:
+    import fcntl
+except ImportError:  # Windows 本機開發時只有 process 內的鎖
+    fcntl = None
+
+TIMESTAMP_FORMAT = '%Y%m%d%H%M%S'
+# 已回覆給使用者的動畫網址在這段期間內仍然有效
+LOOP_KEEP = 3
+
+
+@dataclass(frozen=True)
+class RadarFrame:
+    timestamp: str
+    filename: str
+
+    @property
+    def time(self) -> datetime:
+        return datetime.strptime(self.timestamp, TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+
+
+class RadarFrameStore:
+    """
+    保存最近 capacity 張雷達回波圖的環狀緩衝區。
+    影格縮小並轉為 256 色 PNG 後存放在磁碟上（每張約數十 KB），超過容量時淘汰最舊的影格；
+    多個 web process 共用同一個目錄，請求時只讀檔，不需要呼叫上游；
+    收錄、淘汰與產生動畫時以目錄中的鎖檔 (flock) 在 process 之間互斥。
+    每收錄一張新影格就重新產生一次動畫 (APNG)，檔名以最新影格的時間命名。
+    """
+
+    def __init__(self, frame_dir: str, capacity: int = 24, frame_max_edge: int = 720, frame_duration_ms: int = 400):
+        self.frame_dir = frame_dir
+        self.capacity = capacity
+        self.frame_max_edge = frame_max_edge
+        self.frame_duration_ms = frame_duration_ms
+        os.makedirs(frame_dir, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def add_frame(self, timestamp: str, content: bytes) -> bool:
+        """
+        收錄一張影格（timestamp 為 UTC 的 yyyymmddHHMMSS），已收錄過時回傳 False
+        """
+        filename = f"frame-{timestamp}.png"
+        with self._locked():
+            if os.path.exists(os.path.join(self.frame_dir, filename)):
+                return False
+            self._write(filename, self._compact(content))
+            frames = self.frames()
+            for frame in frames[:-self.capacity]:
+                self._remove(frame.filename)
+            self._render_loop(frames[-self.capacity:])
+        logging.info(f"收錄雷達回波影格 {timestamp}")
+        return True
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.frame_dir, '.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _remove(self, filename: str):
+        try:
+            os.remove(os.path.join(self.frame_dir, filename))
+        except FileNotFoundError:
+            # 沒有 flock 的平台上其他 process 可能已經刪除
+            pass
+
+    def frames(self) -> List[RadarFrame]:
+        """
+        目前保存的影格，由舊到新
+        """
+        frames = [
+            RadarFrame(timestamp=name[len('frame-'):-len('.png')], filename=name)
+            for name in os.listdir(self.frame_dir)
+            if name.startswith('frame-') and name.endswith('.png')
+        ]
+        return sorted(frames, key=lambda frame: frame.timestamp)
+
+    def latest_frame(self) -> Optional[RadarFrame]:
+        frames = self.frames()
+        return frames[-1] if frames else None
+
+    def frame_minutes_ago(self, minutes: int, now: Optional[datetime] = None) -> Optional[RadarFrame]:
+        """
+        取得 minutes 分鐘前（含）最新的一張影格，緩衝區內沒有那麼早的影格時回傳 None
+        """
+        if now is None:
+            now = datetime.now(timezone.utc)
+        target = now - timedelta(minutes=minutes)
+        candidates = [frame for frame in self.frames() if frame.time <= target]
+        return candidates[-1] if candidates else None
+
+    def latest_loop(self) -> Optional[str]:
+        """
+        最新的動畫檔名
+        """
+        loops = self._loops()
+        return loops[-1] if loops else None
+
+    def _loops(self) -> List[str]:
+        return sorted(name for name in os.listdir(self.frame_dir) if name.startswith('loop-') and name.endswith('.png'))
+
+    def _compact(self, content: bytes) -> bytes:
+        image = Image.open(io.BytesIO(content))
+        image.draft('RGB', (self.frame_max_edge, self.frame_max_edge))
+        image = image.convert('RGB')
+        image.thumbnail((self.frame_max_edge, self.frame_max_edge), Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        image.quantize(colors=256).save(output, 'PNG', optimize=True)
+        return output.getvalue()
+
+    def _render_loop(self, frames: List[RadarFrame]):
+        # 只在收錄新影格時產生一次，請求時直接提供檔案
+        if not frames:
+            return
+        images = []
+        for frame in frames:
+            with Image.open(os.path.join(self.frame_dir, frame.filename)) as image:
+                images.append(image.convert('RGB'))
+        # 所有影格共用同一個調色盤（由各影格的縮圖拼接後取色），動畫每個像素只需 1 byte
+        palette = _shared_palette(images)
+        images = [image.quantize(palette=palette, dither=Image.Dither.NONE) for image in images]
+        output = io.BytesIO()
+        images[0].save(output, 'PNG', save_all=True, append_images=images[1:],
+                       duration=self.frame_duration_ms, loop=0, bits=8)
+        self._write(f"loop-{frames[-1].timestamp}.png", output.getvalue())
+        for name in self._loops()[:-LOOP_KEEP]:
+            self._remove(name)
+
+    def _write(self, filename: str, content: bytes):
+        # 先寫暫存檔再改名，其他 process 不會讀到寫一半的檔案
+        path = os.path.join(self.frame_dir, filename)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+def _shared_palette(images: List[Image.Image], tile: int = 128) -> Image.Image:
+    montage = Image.new('RGB', (tile * len(images), tile))
+    for i, image in enumerate(images):
+        montage.paste(image.resize((tile, tile), Image.Resampling.NEAREST), (i * tile, 0))
+    return montage.quantize(colors=256)
+
+
+def collect_radar_frame(store: RadarFrameStore, image_cache, radar_url: Optional[str]) -> bool:
+    """
+    透過天氣圖片快取取得最新的雷達回波圖（與 @雷達 共用同一次下載），有新影格時收錄並回傳 True
+    """
+    if not radar_url:
+        return False
+    cached = image_cache.get('radar', radar_url)
+    if cached is None:
+        return False
+    with open(os.path.join(image_cache.cache_dir, cached.original), 'rb') as f:
+        return store.add_frame(cached.timestamp, f.read())
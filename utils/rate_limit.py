@@ -0,0 +1,110 @@
+import time
+import threading
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, Tuple
+
+from utils.sqlite_utils import SQLiteDatabase
+
+RATE_LIMIT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS token_buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+# 每處理這麼多次請求清理一次閒置的 bucket
+PRUNE_EVERY = 1000
+
+
+@dataclass(frozen=True)
+class BucketRule:
+    """
+    capacity: 可連續使用的次數（bucket 容量）
+    per_minute: 每分鐘補充的次數
+    """
+    capacity: float
+    per_minute: float
+
+    @property
+    def refill_seconds(self) -> float:
+        # 從空到滿需要的秒數，閒置超過這段時間的 bucket 等同全新
+        return self.capacity / self.per_minute * 60
+
+
+class TokenBucketLimiter:
+    """
+    以 token bucket 限制每位使用者與每個群組的請求頻率。
+    bucket 狀態存在 SQLite (WAL) 中，所有 gunicorn worker 共用同一份額度；
+    rules 依訊息類型設定，例如 {'image': {'user': {...}, 'group': {...}}}。
+    """
+
+    def __init__(self, path: str, rules: Dict[str, Dict[str, Dict[str, float]]]):
+        self.db = SQLiteDatabase(path, RATE_LIMIT_SCHEMA)
+        self.rules = {
+            kind: {scope: BucketRule(**rule) for scope, rule in scopes.items()}
+            for kind, scopes in rules.items()
+        }
+        # bucket 狀態由 SQLite 交易保護；請求計數在各 lane 的 thread 之間共用，另以 lock 保護
+        self._calls = 0
+        self._calls_lock = threading.Lock()
+
+    def allow(self, kind: str, user_id: Optional[str], group_id: Optional[str] = None,
+              now: Optional[float] = None) -> bool:
+        """
+        使用者與所在群組的 bucket 都還有額度時各扣一次並回傳 True；
+        任一個不足時都不扣，回傳 False。沒有設定規則的類型一律放行。
+        """
+        scopes = self.rules.get(kind)
+        if not scopes:
+            return True
+        if now is None:
+            now = time.time()
+        buckets: List[Tuple[str, BucketRule]] = []
+        if user_id and 'user' in scopes:
+            buckets.append((f"{kind}:user:{user_id}", scopes['user']))
+        if group_id and group_id != user_id and 'group' in scopes:
+            buckets.append((f"{kind}:group:{group_id}", scopes['group']))
+        if not buckets:
+            return True
+
+        with self.db.transaction() as conn:
+            levels = [(key, self._level(conn, key, rule, now)) for key, rule in buckets]
+            allowed = all(tokens >= 1 for _, tokens in levels)
+            for key, tokens in levels:
+                conn.execute(
+                    "INSERT OR REPLACE INTO token_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    (key, tokens - 1 if allowed else tokens, now),
+                )
+
+        with self._calls_lock:
+            self._calls += 1
+            should_prune = self._calls % PRUNE_EVERY == 0
+        if should_prune:
+            self.prune(now)
+        return allowed
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """
+        刪除閒置到已補滿的 bucket，回傳刪除筆數
+        """
+        if now is None:
+            now = time.time()
+        idle = max((rule.refill_seconds for scopes in self.rules.values() for rule in scopes.values()), default=0)
+        cursor = self.db.connection().execute("DELETE FROM token_buckets WHERE updated_at < ?", (now - idle,))
+        return cursor.rowcount
+
+    @staticmethod
+    def _level(conn, key: str, rule: BucketRule, now: float) -> float:
+        row = conn.execute("SELECT tokens, updated_at FROM token_buckets WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return rule.capacity
+        elapsed = max(now - row['updated_at'], 0)
+        return min(rule.capacity, row['tokens'] + elapsed * rule.per_minute / 60)
+
+
+def rate_limit_rules(config: Dict[str, Any]) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    從 config.yaml 的 rate_limits 區段取出各訊息類型的規則（略過 path 等其他設定）
+    """
+    return {kind: scopes for kind, scopes in config.items() if isinstance(scopes, dict)}
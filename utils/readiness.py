@@ -0,0 +1,103 @@
+from typing import Optional, Dict, Any, List, Tuple
+
+from utils.cache import cache_stats
+from utils.circuit_breaker import circuit_states, OPEN
+from utils.structured_logging import log_stats
+from utils.memory_budget import memory_stats
+
+
+def lane_saturated(stats: Dict[str, Any]) -> bool:
+    """
+    通道已滿（與 Lane 拒絕新工作的條件相同）
+    """
+    return stats['running'] + stats['waiting'] >= stats['concurrency'] + stats['max_pending']
+
+
+def build_readiness(queue_counts: Optional[Dict[str, int]], max_backlog: int,
+                    lane_stats: Dict[str, Dict[str, Any]], warm_up: Dict[str, bool]) -> Dict[str, Any]:
+    """
+    彙整 readiness：工作佇列積壓、各通道執行中 / 等待中的數量、外部服務斷路器與快取預熱狀態。
+    只有尚未預熱或工作佇列無法讀取（queue_counts 為 None）會讓 ready 為 False。
+    佇列積壓與通道已滿只列在 busy 中：忙碌時由通道回覆「忙碌中」並分流，不能把唯一的 pod 從 Service 移除；
+    通道數值也只屬於回應這次請求的 worker。外部服務故障時所有 pod 都一樣，只回報斷路器狀態。
+    """
+    reasons = []
+    if not warm_up.get('modules', True):
+        reasons.append('warming_up')
+    if queue_counts is None:
+        reasons.append('job_queue_unavailable')
+        queue_counts = {}
+    busy = []
+    backlog = queue_counts.get('pending', 0) + queue_counts.get('running', 0)
+    if backlog >= max_backlog:
+        busy.append('queue_backlog')
+    for name, stats in sorted(lane_stats.items()):
+        if lane_saturated(stats):
+            busy.append(f"lane_{name}_saturated")
+    return {
+        'ready': not reasons,
+        'reasons': reasons,
+        'busy': busy,
+        'queue': dict(queue_counts, backlog=backlog, max_backlog=max_backlog),
+        'lanes': lane_stats,
+        'circuits': circuit_states(),
+        'caches': cache_stats(),
+        'warm_up': warm_up,
+        'logging': log_stats(),
+        'memory': memory_stats(),
+    }
+
+
+def render_metrics(report: Dict[str, Any]) -> str:
+    """
+    以 Prometheus text format 輸出 readiness 的數值
+    """
+    metrics: List[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]] = [
+        ('linebot_ready', 'gauge', '1 if this pod accepts traffic', [({}, int(report['ready']))]),
+        ('linebot_job_queue_backlog', 'gauge', 'Unfinished image jobs (pending + running)',
+         [({}, report['queue']['backlog'])]),
+        ('linebot_job_queue_jobs', 'gauge', 'Image jobs by status',
+         [({'status': status}, report['queue'].get(status, 0)) for status in ('pending', 'running', 'failed')]),
+        ('linebot_lane_running', 'gauge', 'Events being handled per lane',
+         [({'lane': name}, stats['running']) for name, stats in sorted(report['lanes'].items())]),
+        ('linebot_lane_waiting', 'gauge', 'Events waiting per lane',
+         [({'lane': name}, stats['waiting']) for name, stats in sorted(report['lanes'].items())]),
+        ('linebot_lane_shed_total', 'counter', 'Events rejected with a busy reply per lane',
+         [({'lane': name}, stats['shed']) for name, stats in sorted(report['lanes'].items())]),
+        ('linebot_lane_avg_wait_ms', 'gauge', 'Average queueing time per lane',
+         [({'lane': name}, stats['avg_wait_ms']) for name, stats in sorted(report['lanes'].items())]),
+        ('linebot_circuit_open', 'gauge', '1 if the dependency circuit breaker is open',
+         [({'dependency': name}, int(state['state'] == OPEN)) for name, state in report['circuits'].items()]),
+        ('linebot_cache_hits_total', 'counter', 'Cache hits per namespace and tier',
+         [({'namespace': name, 'tier': tier}, stats[f"{tier}_hits"])
+          for name, stats in report['caches'].items() for tier in ('l1', 'l2')]),
+        ('linebot_cache_misses_total', 'counter', 'Cache misses per namespace',
+         [({'namespace': name}, stats['misses']) for name, stats in report['caches'].items()]),
+        ('linebot_log_records_total', 'counter', 'Log records by outcome (enqueued, dropped when full, sampled out)',
+         [({'outcome': outcome}, count) for outcome, count in report['logging'].items()]),
+        ('linebot_memory_budget_bytes', 'gauge', 'Image memory budget capacity and bytes in use',
+         [({'budget': name, 'usage': usage}, stats[usage])
+          for name, stats in report['memory']['budgets'].items() for usage in ('capacity', 'in_use', 'peak')]),
+        ('linebot_memory_budget_waits_total', 'counter', 'Jobs that queued for the memory budget',
+         [({'budget': name}, stats['waits']) for name, stats in report['memory']['budgets'].items()]),
+        ('linebot_memory_budget_rejected_total', 'counter', 'Jobs that timed out waiting for the memory budget',
+         [({'budget': name}, stats['rejected']) for name, stats in report['memory']['budgets'].items()]),
+        ('linebot_stage_rss_bytes', 'gauge', 'Highest process RSS seen at the end of each image stage',
+         [({'stage': stage}, stats['max_rss']) for stage, stats in report['memory']['stages'].items()]),
+        ('linebot_stage_peak_rss_growth_bytes', 'gauge', 'Largest growth of process peak RSS during each image stage',
+         [({'stage': stage}, stats['max_peak_growth']) for stage, stats in report['memory']['stages'].items()]),
+    ]
+    if report['memory']['peak_rss'] is not None:
+        metrics.append(('linebot_process_peak_rss_bytes', 'gauge', 'Peak RSS of this process',
+                        [({}, report['memory']['peak_rss'])]))
+    if 'in_flight' in report['queue']:
+        metrics.append(('linebot_jobs_in_flight', 'gauge', 'Image jobs being processed by this process',
+                        [({}, report['queue']['in_flight'])]))
+    lines = []
+    for name, kind, description, samples in metrics:
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,58 @@
+import re
+from typing import List
+
+# 送給 LLM 的 OCR 文字長度上限（字元）
+DEFAULT_MAX_CHARS = 600
+# 店家名稱通常在收據最上方幾行
+HEADER_LINES = 3
+
+_TOTAL_PATTERN = re.compile(
+    r'總計|合計|總金額|總額|小計|應付|實付|實收|應收|付款|現金|信用卡|找零|金額'
+    r'|TOTAL|AMOUNT|SUBTOTAL|BALANCE|CASH|CHANGE|PAID|DUE',
+    re.IGNORECASE,
+)
+_MERCHANT_PATTERN = re.compile(
+    r'公司|商行|商店|門市|分店|餐廳|餐飲|咖啡|超商|商場|賣方|統一編號|統編'
+    r'|STORE|SHOP|MART|MARKET|RESTAURANT|CAFE|COFFEE|INC|LTD|CO\.',
+    re.IGNORECASE,
+)
+_AMOUNT_PATTERN = re.compile(r'\d[\d,]*(?:\.\d+)?')
+
+
+def compact_receipt_text(ocr_text: str, max_chars: int = DEFAULT_MAX_CHARS) -> str:
+    """
+    只保留與總金額、店家有關的行，去掉品項明細與頁尾，減少送給 LLM 的 token。
+    OCR 常把「總計」與金額拆成兩行，關鍵字下一行若是數字也一併保留；
+    完全找不到關鍵字時改保留含數字的行（由後往前，總計通常在最後）。
+    """
+    lines = [line.strip() for line in ocr_text.splitlines() if line.strip()]
+    if not lines:
+        return ''
+
+    keep = set(range(min(HEADER_LINES, len(lines))))
+    found_total = False
+    for i, line in enumerate(lines):
+        if _TOTAL_PATTERN.search(line):
+            found_total = True
+            keep.add(i)
+            if i + 1 < len(lines) and _AMOUNT_PATTERN.fullmatch(lines[i + 1].lstrip('$＄NT').strip()):
+                keep.add(i + 1)
+        elif _MERCHANT_PATTERN.search(line):
+            keep.add(i)
+
+    if not found_total:
+        keep.update(i for i, line in enumerate(lines) if _AMOUNT_PATTERN.search(line))
+
+    selected = [lines[i] for i in sorted(keep)]
+    return _truncate(selected, max_chars)
+
+
+def _truncate(lines: List[str], max_chars: int) -> str:
+    # 超過長度時保留最上方的店家與最後的總計，從中間刪除
+    text = '\n'.join(lines)
+    if len(text) <= max_chars:
+        return text
+    head, tail = lines[:HEADER_LINES], lines[HEADER_LINES:]
+    while tail and len('\n'.join(head + tail)) > max_chars:
+        tail.pop(0)
+    return '\n'.join(head + tail)[:max_chars]
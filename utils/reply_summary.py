@@ -0,0 +1,70 @@
+from dataclasses import dataclass
+from typing import Optional, List, Dict
+
+# 摘要中最多列出幾筆發票兌獎結果，其餘只顯示數量
+MAX_INVOICE_LINES = 10
+
+
+@dataclass
+class DocumentResult:
+    """
+    一份單據的處理結果；reply_text 為只有這張圖片時的回覆
+    kind: receipt（收據）、invoice（發票）、einvoice（電子發票）、unknown（無法辨識或分析失敗）
+    amount: 已記到帳本的金額，沒有記帳時為 None
+    detail: 發票兌獎結果
+    """
+    kind: str
+    reply_text: str
+    amount: Optional[float] = None
+    category: Optional[str] = None
+    detail: Optional[str] = None
+
+
+def combine_reply_texts(reply_texts: List[str]) -> str:
+    """
+    一張照片有多份單據時合併成一則回覆
+    """
+    if len(reply_texts) == 1:
+        return reply_texts[0]
+    return f"\u2764 這張照片裡有 {len(reply_texts)} 張單據 \u2764\n\n" + "\n\n".join(
+        f"{i}. {text}" for i, text in enumerate(reply_texts, 1))
+
+
+def build_burst_summary(image_results: List[List[DocumentResult]]) -> str:
+    """
+    同一位使用者連續傳送的多張圖片合併成一則摘要：總支出、各類別金額與發票兌獎結果
+    image_results: 每張圖片中各份單據的結果
+    """
+    documents = [result for results in image_results for result in results]
+    recorded = [result for result in documents if result.amount is not None]
+    invoices = [result for result in documents if result.detail is not None]
+    unknown = sum(1 for result in documents if result.amount is None and result.detail is None)
+
+    lines = [f"\u2764 收到 {len(image_results)} 張圖片，共 {len(documents)} 張單據 \u2764"]
+    if recorded:
+        categories: Dict[str, float] = {}
+        for result in recorded:
+            category = result.category or '其他'
+            categories[category] = categories.get(category, 0) + result.amount
+        lines.append(f"支出已追蹤：{sum(result.amount for result in recorded):,.0f} 元（{len(recorded)} 筆）")
+        lines.extend(f"- {category}：{total:,.0f} 元"
+                     for category, total in sorted(categories.items(), key=lambda item: -item[1]))
+    if invoices:
+        lines.append(f"發票兌獎 {len(invoices)} 張：")
+        lines.extend(f"- {result.detail}" for result in invoices[:MAX_INVOICE_LINES])
+        if len(invoices) > MAX_INVOICE_LINES:
+            lines.append(f"- 其餘 {len(invoices) - MAX_INVOICE_LINES} 張省略")
+    if unknown:
+        lines.append(f"無法辨識或分析失敗：{unknown} 張")
+    return "\n".join(lines)
+
+
+def build_image_reply(image_results: List[List[DocumentResult]]) -> Optional[str]:
+    """
+    只有一張圖片時沿用原本的回覆，多張圖片時回覆摘要；沒有任何圖片時回傳 None
+    """
+    if not image_results:
+        return None
+    if len(image_results) == 1:
+        return combine_reply_texts([result.reply_text for result in image_results[0]])
+    return build_burst_summary(image_results)
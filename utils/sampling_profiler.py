@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import time
+import random
+import signal
+import logging
+import functools
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List, Tuple
+
+# 預設每 10 ms 取樣一次所有 thread 的 call stack
+DEFAULT_INTERVAL = 0.01
+# 只保留經過這些套件的 stack，閒置的 thread pool / server thread 不列入
+DEFAULT_INCLUDE = ('app', 'utils')
+MAX_STACK_DEPTH = 128
+# 每個 process 只保留最近幾份結果
+KEEP_PROFILES = 20
+
+
+class SamplingProfiler:
+    """
+    依需求開啟的取樣式 profiler，關閉時沒有任何背景 thread，也不影響請求。
+    開啟後由一條 thread 以固定間隔讀取 sys._current_frames()，
+    結束時輸出 collapsed stack（可直接交給 flamegraph.pl / speedscope）與各函式的 self / total 取樣數。
+
+    - 時間模式：start(seconds) 取樣 process 內所有 thread
+    - 比例模式：start(seconds, fraction) 只取樣被 track 包起來、且抽中的請求所在的 thread
+    """
+
+    def __init__(self, output_dir: str, interval: float = DEFAULT_INTERVAL, include=DEFAULT_INCLUDE):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.include = tuple(include)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._fraction: Optional[float] = None
+        self._tracked: Dict[int, int] = {}
+        self._current: Optional[Dict[str, Any]] = None
+        self._labels: Dict[Any, Tuple[str, bool]] = {}
+
+    @property
+    def active(self) -> bool:
+        return self._current is not None
+
+    def start(self, seconds: float, fraction: Optional[float] = None) -> str:
+        """
+        開始取樣 seconds 秒，回傳這份結果的 id；已在取樣中時拋出 RuntimeError
+        """
+        with self._lock:
+            if self._current is not None:
+                raise RuntimeError(f"profiler 已在執行中：{self._current['id']}")
+            profile_id = f"{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S%f')}-{os.getpid()}"
+            self._current = {
+                'id': profile_id,
+                'mode': 'fraction' if fraction is not None else 'duration',
+                'fraction': fraction,
+                'seconds': seconds,
+                'started_at': time.time(),
+                'samples': 0,
+            }
+            self._fraction = fraction
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(profile_id, seconds), name='sampling-profiler', daemon=True)
+            self._thread.start()
+        logging.info(f"開始取樣 profile {profile_id}：{seconds} 秒，fraction={fraction}")
+        return profile_id
+
+    def stop(self, timeout: Optional[float] = 5) -> Optional[str]:
+        """
+        提前結束取樣並寫出結果，回傳 id；沒有在取樣時回傳 None
+        """
+        thread = self._thread
+        current = self._current
+        if thread is None or current is None:
+            return None
+        self._stop.set()
+        thread.join(timeout)
+        return current['id']
+
+    def should_sample(self) -> bool:
+        """
+        比例模式下依 fraction 抽樣請求；關閉或時間模式時回傳 False
+        """
+        fraction = self._fraction
+        return fraction is not None and random.random() < fraction
+
+    def track(self, func):
+        """
+        包裝 func，執行期間比例模式會取樣所在的 thread
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            ident = threading.get_ident()
+            with self._lock:
+                self._tracked[ident] = self._tracked.get(ident, 0) + 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._tracked[ident] -= 1
+                    if self._tracked[ident] == 0:
+                        del self._tracked[ident]
+        return wrapper
+
+    def is_tracked(self) -> bool:
+        return threading.get_ident() in self._tracked
+
+    def status(self) -> Dict[str, Any]:
+        current = self._current
+        return {
+            'active': dict(current) if current else None,
+            'profiles': self.profiles(),
+        }
+
+    def profiles(self) -> List[str]:
+        """
+        已完成的結果 id，由新到舊
+        """
+        if not os.path.isdir(self.output_dir):
+            return []
+        ids = {name.rsplit('.', 1)[0] for name in os.listdir(self.output_dir)
+               if name.endswith('.collapsed') or name.endswith('.json')}
+        return sorted(ids, reverse=True)
+
+    def install_signal_handler(self, signum: int = signal.SIGUSR2, seconds: float = 30):
+        """
+        收到 signum 時開始取樣 seconds 秒（需在 main thread 呼叫）
+        """
+        def handler(signum, frame):
+            try:
+                self.start(seconds)
+            except RuntimeError as e:
+                logging.warning(str(e))
+        signal.signal(signum, handler)
+
+    def _run(self, profile_id: str, seconds: float):
+        stacks: Counter = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        own_ident = threading.get_ident()
+        try:
+            while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+                tracked_only = self._fraction is not None
+                with self._lock:
+                    tracked = set(self._tracked)
+                for ident, frame in sys._current_frames().items():
+                    if ident == own_ident or (tracked_only and ident not in tracked):
+                        continue
+                    stack = self._stack(frame)
+                    if stack:
+                        stacks[stack] += 1
+                samples += 1
+                self._current['samples'] = samples
+            self._write(profile_id, stacks, samples)
+        except Exception as e:
+            logging.error(f"profile {profile_id} 取樣失敗：{e}")
+        finally:
+            with self._lock:
+                self._current = None
+                self._fraction = None
+                self._thread = None
+        logging.info(f"profile {profile_id} 完成，共 {samples} 次取樣")
+
+    def _stack(self, frame) -> Optional[Tuple[str, ...]]:
+        labels = []
+        relevant = False
+        while frame is not None and len(labels) < MAX_STACK_DEPTH:
+            label, included = self._label(frame)
+            labels.append(label)
+            relevant = relevant or included
+            frame = frame.f_back
+        if not relevant:
+            return None
+        labels.reverse()
+        return tuple(labels)
+
+    def _label(self, frame) -> Tuple[str, bool]:
+        code = frame.f_code
+        cached = self._labels.get(code)
+        if cached is None:
+            module = frame.f_globals.get('__name__', '?')
+            name = getattr(code, 'co_qualname', code.co_name)
+            cached = (f"{module}:{name}", module.split('.')[0] in self.include)
+            self._labels[code] = cached
+        return cached
+
+    def _write(self, profile_id: str, stacks: Counter, samples: int):
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(os.path.join(self.output_dir, f"{profile_id}.collapsed"), 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{';'.join(stack)} {count}\n")
+        summary = dict(self._current, samples=samples, functions=aggregate_functions(stacks))
+        with open(os.path.join(self.output_dir, f"{profile_id}.json"), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        for old_id in self.profiles()[KEEP_PROFILES:]:
+            for suffix in ('.collapsed', '.json'):
+                path = os.path.join(self.output_dir, old_id + suffix)
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def aggregate_functions(stacks: Counter, top: int = 200) -> List[Dict[str, Any]]:
+    """
+    各函式的取樣數：self 為 stack 最上層（正在執行）的次數，total 為出現在 stack 中的次數（遞迴只算一次）
+    """
+    self_counts: Counter = Counter()
+    total_counts: Counter = Counter()
+    for stack, count in stacks.items():
+        self_counts[stack[-1]] += count
+        for label in set(stack):
+            total_counts[label] += count
+    stack_samples = sum(stacks.values()) or 1
+    return [
+        {
+            'function': label,
+            'self': self_counts[label],
+            'total': total,
+            'self_pct': round(self_counts[label] * 100 / stack_samples, 1),
+            'total_pct': round(total * 100 / stack_samples, 1),
+        }
+        for label, total in total_counts.most_common(top)
+    ]
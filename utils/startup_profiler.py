@@ -0,0 +1,82 @@
+import os
+import re
+import sys
+import time
+import argparse
+import subprocess
+from typing import List, Dict, Any
+
+_IMPORT_TIME_PATTERN = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+
+
+def parse_import_times(output: str) -> List[Dict[str, Any]]:
+    """
+    解析 python -X importtime 的輸出，回傳每個模組的 self / cumulative 時間（微秒）與巢狀深度
+    """
+    records = []
+    for line in output.splitlines():
+        match = _IMPORT_TIME_PATTERN.match(line)
+        if match:
+            records.append({
+                'module': match.group(4),
+                'self_us': int(match.group(1)),
+                'cumulative_us': int(match.group(2)),
+                'depth': (len(match.group(3)) - 1) // 2,
+            })
+    return records
+
+
+def summarize_by_package(records: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    依最上層套件加總 self 時間，例如 google.cloud.vision_v1.* 都算在 google
+    """
+    totals = {}
+    for record in records:
+        package = record['module'].split('.')[0]
+        totals[package] = totals.get(package, 0) + record['self_us']
+    return totals
+
+
+def profile_import(module: str, env: Dict[str, str] = None) -> Dict[str, Any]:
+    """
+    在獨立的 process 中匯入 module，回傳總耗時與各模組的匯入時間
+    """
+    run_env = dict(os.environ)
+    # 只量測匯入，不啟動背景 consumer
+    run_env.setdefault('JOB_CONSUMERS', '0')
+    run_env.update(env or {})
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        env=run_env, capture_output=True, text=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"匯入 {module} 失敗：{result.stderr[-2000:]}")
+    records = parse_import_times(result.stderr)
+    return {'module': module, 'wall_ms': wall_ms, 'records': records}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="量測匯入 app 的冷啟動時間，列出最耗時的模組")
+    parser.add_argument('module', nargs='?', default='app.app')
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    profile = profile_import(args.module)
+    records = profile['records']
+    print(f"匯入 {args.module}：process 總耗時 {profile['wall_ms']:.0f}ms，共 {len(records)} 個模組")
+
+    print(f"\n== 累計時間最長的直接匯入 (top {args.top}) ==")
+    direct = [record for record in records if record['depth'] <= 1]
+    for record in sorted(direct, key=lambda r: r['cumulative_us'], reverse=True)[:args.top]:
+        print(f"{record['cumulative_us'] / 1000:8.1f}ms  {record['module']}")
+
+    print(f"\n== 依套件加總 (top {args.top}) ==")
+    totals = summarize_by_package(records)
+    for package, self_us in sorted(totals.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{self_us / 1000:8.1f}ms  {package}")
+
+
+if __name__ == "__main__":
+    main()
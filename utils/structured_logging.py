@@ -0,0 +1,220 @@
+import os
+import re
+import sys
+import json
+import queue
+import atexit
+import random
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, Dict, Any
+
+# LINE 的 userId / groupId / roomId
+LINE_ID_PATTERN = re.compile(r'\b[UCR][0-9a-f]{32}\b')
+# 這些欄位只記錄 hash，仍可以串起同一位使用者的紀錄
+ID_FIELDS = ('user_id', 'target_id', 'group_id')
+# 這些欄位可能含收據、發票或訊息內容，只記錄長度
+TEXT_FIELDS = ('text', 'ocr_text', 'body', 'message_text')
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_MAX_MESSAGE_CHARS = 1000
+
+
+def hash_id(value: str) -> str:
+    """
+    以 hash 取代 LINE id，保留開頭的類型字元
+    """
+    return f"{value[:1]}#{hashlib.sha256(value.encode('utf-8')).hexdigest()[:10]}"
+
+
+def redact(text: str) -> str:
+    """
+    遮蔽文字中的 LINE id
+    """
+    return LINE_ID_PATTERN.sub(lambda match: hash_id(match.group(0)), text)
+
+
+def truncate(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}…(+{len(text) - max_chars} chars)"
+
+
+def redact_fields(fields: Dict[str, Any], max_chars: int) -> Dict[str, Any]:
+    redacted = {}
+    for key, value in fields.items():
+        if value is None:
+            redacted[key] = None
+        elif key in ID_FIELDS:
+            redacted[key] = hash_id(str(value))
+        elif key in TEXT_FIELDS:
+            redacted[key] = f"<redacted {len(str(value))} chars>"
+        elif isinstance(value, (int, float, bool)):
+            redacted[key] = value
+        else:
+            redacted[key] = truncate(redact(str(value)), max_chars)
+    return redacted
+
+
+class _LogStats:
+
+    def __init__(self):
+        self.enqueued = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self._lock = threading.Lock()
+
+    def count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {'enqueued': self.enqueued, 'dropped': self.dropped, 'sampled_out': self.sampled_out}
+
+
+_stats = _LogStats()
+
+
+class SamplingFilter(logging.Filter):
+    """
+    依類別（log_event 的 category）抽樣 INFO 以下的紀錄，WARNING 以上一律保留
+    """
+
+    def __init__(self, sample_rates: Optional[Dict[str, float]] = None, default_rate: float = 1.0):
+        super().__init__()
+        self.sample_rates = dict(sample_rates or {})
+        self.default_rate = default_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.sample_rates.get(getattr(record, 'category', None), self.default_rate)
+        if rate >= 1 or random.random() < rate:
+            return True
+        _stats.count('sampled_out')
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    每筆紀錄輸出一行 JSON；log_event 的欄位放在 fields 底下，不會覆蓋 ts、level、message 等欄位
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'category': getattr(record, 'category', None),
+            'message': record.getMessage(),
+            'pid': record.process,
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry['fields'] = fields
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class AsyncLogHandler(QueueHandler):
+    """
+    在呼叫端只做遮蔽與截斷，放入有上限的佇列後立即返回，由背景 thread 寫出；
+    佇列滿時直接丟棄並計數，不讓 worker 等待 I/O
+    """
+
+    def __init__(self, queue_size: int = DEFAULT_QUEUE_SIZE, max_message_chars: int = DEFAULT_MAX_MESSAGE_CHARS):
+        super().__init__(queue.Queue(queue_size))
+        self.queue_size = queue_size
+        self.max_message_chars = max_message_chars
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = truncate(redact(record.getMessage()), self.max_message_chars)
+        record.args = None
+        if record.exc_info:
+            record.exc_text = truncate(redact(logging.Formatter().formatException(record.exc_info)),
+                                       self.max_message_chars * 4)
+        record.exc_info = None
+        fields = getattr(record, 'fields', None)
+        if fields:
+            record.fields = redact_fields(fields, self.max_message_chars)
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+            _stats.count('enqueued')
+        except queue.Full:
+            _stats.count('dropped')
+
+
+_handler: Optional[AsyncLogHandler] = None
+_listener: Optional[QueueListener] = None
+_output: Optional[logging.Handler] = None
+
+
+def _start_listener():
+    global _listener
+    _listener = QueueListener(_handler.queue, _output, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener():
+    # 結束前寫出佇列中剩下的紀錄
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def _restart_after_fork():
+    # fork 後子 process 沒有父 process 的背景 thread，換一個新的佇列重新啟動
+    if _handler is None:
+        return
+    _handler.queue = queue.Queue(_handler.queue_size)
+    _start_listener()
+
+
+def configure_logging(level: str = 'INFO', queue_size: int = DEFAULT_QUEUE_SIZE,
+                      max_message_chars: int = DEFAULT_MAX_MESSAGE_CHARS,
+                      sample_rates: Optional[Dict[str, float]] = None, stream=None) -> AsyncLogHandler:
+    """
+    將 root logger 改為非同步的 JSON 輸出，取代原有的 handler；重複呼叫時只更新設定
+    """
+    global _handler, _output
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _handler is not None:
+        _handler.max_message_chars = max_message_chars
+        _handler.filters[0].sample_rates = dict(sample_rates or {})
+        return _handler
+
+    _output = logging.StreamHandler(stream or sys.stdout)
+    _output.setFormatter(JsonFormatter())
+    _handler = AsyncLogHandler(queue_size, max_message_chars)
+    _handler.addFilter(SamplingFilter(sample_rates))
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    _start_listener()
+    atexit.register(_stop_listener)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_restart_after_fork)
+    return _handler
+
+
+def log_event(category: str, message: str, level: int = logging.INFO, **fields):
+    """
+    寫一筆有類別與欄位的紀錄；id 與文字內容欄位會被遮蔽。
+    message 本身只遮蔽 LINE id，收據、發票或訊息內容要放在 text 等欄位，不要組進 message
+    """
+    logging.log(level, message, extra={'category': category, 'fields': fields})
+
+
+def log_stats() -> Dict[str, int]:
+    """
+    寫入佇列、因佇列已滿丟棄、以及被抽樣略過的紀錄數
+    """
+    return _stats.snapshot()
@@ -0,0 +1,165 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional, Dict, Any, List
+
+# 收集圖片的時間窗（毫秒），0 表示不批次，每張圖片各自呼叫 text_detection
+VISION_BATCH_WINDOW_MS = float(os.environ.get("VISION_BATCH_WINDOW_MS", 0))
+# batch_annotate_images 每個請求最多 16 張圖片
+VISION_BATCH_MAX_SIZE = int(os.environ.get("VISION_BATCH_MAX_SIZE", 16))
+VISION_BATCH_MAX_INFLIGHT = int(os.environ.get("VISION_BATCH_MAX_INFLIGHT", 2))
+# Vision RPC 的逾時秒數；等待批次結果時再加上收集時間窗
+VISION_TIMEOUT = float(os.environ.get("VISION_TIMEOUT", 30))
+
+
+class _PendingImage:
+    __slots__ = ('content', 'future', 'submitted_at')
+
+    def __init__(self, content: bytes):
+        self.content = content
+        self.future = Future()
+        self.submitted_at = time.perf_counter()
+
+
+class VisionBatcher:
+    """
+    在短時間窗內收集多張圖片，合併成一次 batch_annotate_images 呼叫，再把結果分送回各自的等待者。
+    同時記錄批次大小、排隊等待時間與 RPC 時間，用來評估時間窗對延遲的影響。
+    """
+
+    def __init__(self, client_factory: Callable[[], Any], window: float = 0.05,
+                 max_batch_size: int = VISION_BATCH_MAX_SIZE, max_inflight: int = VISION_BATCH_MAX_INFLIGHT,
+                 rpc_timeout: float = VISION_TIMEOUT):
+        self.client_factory = client_factory
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.rpc_timeout = rpc_timeout
+        self._client = None
+        self._queue: "queue.Queue[_PendingImage]" = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix='vision-batch')
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stats = {'batches': 0, 'images': 0, 'errors': 0, 'wait_ms_total': 0.0, 'rpc_ms_total': 0.0}
+
+    def submit(self, content: bytes) -> Future:
+        """
+        排入一張圖片，回傳之後會拿到 AnnotateImageResponse 的 Future
+        """
+        self._ensure_started()
+        item = _PendingImage(content)
+        self._queue.put(item)
+        return item.future
+
+    @property
+    def result_timeout(self) -> float:
+        """
+        等待單張圖片結果的建議逾時：收集時間窗加上 RPC 逾時
+        """
+        return self.window + self.rpc_timeout
+
+    def annotate(self, content: bytes, timeout: Optional[float] = None):
+        return self.submit(content).result(self.result_timeout if timeout is None else timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        batches = stats['batches'] or 1
+        images = stats['images'] or 1
+        stats['avg_batch_size'] = round(stats['images'] / batches, 2)
+        stats['avg_wait_ms'] = round(stats['wait_ms_total'] / images, 1)
+        stats['avg_rpc_ms'] = round(stats['rpc_ms_total'] / batches, 1)
+        return stats
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._collect, name='vision-batcher', daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = batch[0].submitted_at + self.window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._dispatch, batch)
+
+    def _get_client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = self.client_factory()
+            return self._client
+
+    def _dispatch(self, batch: List[_PendingImage]):
+        from google.cloud import vision
+
+        dispatched_at = time.perf_counter()
+        wait_ms = sum((dispatched_at - item.submitted_at) * 1000 for item in batch)
+        try:
+            requests = [
+                vision.AnnotateImageRequest(
+                    image=vision.Image(content=item.content),
+                    features=[vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)],
+                )
+                for item in batch
+            ]
+            response = self._get_client().batch_annotate_images(requests=requests, timeout=self.rpc_timeout)
+            rpc_ms = (time.perf_counter() - dispatched_at) * 1000
+            responses = list(response.responses)
+            error = None
+            if len(responses) < len(batch):
+                error = RuntimeError(f"Vision 批次回傳 {len(responses)} 筆結果，少於 {len(batch)} 張圖片")
+            for item, item_response in zip(batch, responses):
+                _resolve(item.future, result=item_response)
+            # 沒有對應結果的圖片不能讓呼叫端一直等待
+            for item in batch[len(responses):]:
+                _resolve(item.future, error=error)
+        except Exception as e:
+            rpc_ms = (time.perf_counter() - dispatched_at) * 1000
+            error = e
+            for item in batch:
+                _resolve(item.future, error=e)
+
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['images'] += len(batch)
+            self._stats['errors'] += 1 if error else 0
+            self._stats['wait_ms_total'] += wait_ms
+            self._stats['rpc_ms_total'] += rpc_ms
+        logging.info(f"Vision 批次 {len(batch)} 張，平均等待 {wait_ms / len(batch):.0f}ms，RPC {rpc_ms:.0f}ms")
+
+
+def _resolve(future: Future, result: Any = None, error: Optional[BaseException] = None):
+    # 呼叫端逾時或取消後 future 已完成，不能再設定結果
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+_vision_batcher: Optional[VisionBatcher] = None
+_vision_batcher_lock = threading.Lock()
+
+
+def get_vision_batcher(client_factory: Callable[[], Any]) -> Optional[VisionBatcher]:
+    """
+    取得共用的 VisionBatcher，VISION_BATCH_WINDOW_MS 為 0 時回傳 None
+    """
+    global _vision_batcher
+    if VISION_BATCH_WINDOW_MS <= 0:
+        return None
+    with _vision_batcher_lock:
+        if _vision_batcher is None:
+            _vision_batcher = VisionBatcher(client_factory, window=VISION_BATCH_WINDOW_MS / 1000)
+        return _vision_batcher
@@ -0,0 +1,160 @@
+import io
+import os
+import time
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional, Dict, Tuple
+
+import requests
+from PIL import Image
+
+# LINE 建議預覽圖 240x240 以內
+DEFAULT_PREVIEW_MAX_EDGE = 240
+_EXTENSIONS = {'image/png': '.png', 'image/jpeg': '.jpg', 'image/gif': '.gif'}
+
+
+@dataclass(frozen=True)
+class CachedWeatherImage:
+    product: str
+    timestamp: str
+    original: str
+    preview: str
+
+
+class WeatherImageCache:
+    """
+    中央氣象署產品圖片的本地快取。
+    同一產品在 check_interval 秒內不會重新詢問上游；之後以 ETag / Last-Modified 做條件式請求，
+    圖片有更新才下載一次並產生小尺寸預覽圖，檔名以產品與時間戳記命名，內容不會再變動，可以長期快取。
+    每個產品只保留最新的 keep 組圖片。
+    """
+
+    def __init__(self, cache_dir: str, preview_max_edge: int = DEFAULT_PREVIEW_MAX_EDGE, keep: int = 12,
+                 check_interval: float = 60, timeout: Tuple[float, float] = (3.05, 10)):
+        self.cache_dir = cache_dir
+        self.preview_max_edge = preview_max_edge
+        self.keep = keep
+        self.check_interval = check_interval
+        self.timeout = timeout
+        self.session = requests.Session()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._state: Dict[str, Dict] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    def get(self, product: str, url: str) -> Optional[CachedWeatherImage]:
+        """
+        取得產品最新的快取圖片，必要時才從上游下載；上游失敗時回傳上一次的圖片（沒有則為 None）
+        同一產品同時只有一個請求會詢問上游，其他請求等待並共用結果
+        """
+        with self._lock_for(product):
+            state = self._state.get(product)
+            if state and state['url'] == url and time.time() - state['checked_at'] < self.check_interval:
+                return state['image']
+            try:
+                image = self._refresh(product, url, state if state and state['url'] == url else None)
+            except Exception as e:
+                logging.error(f"更新 {product} 圖片快取失敗: {e}")
+                return state['image'] if state else None
+            return image
+
+    async def get_async(self, product: str, url: str) -> Optional[CachedWeatherImage]:
+        # 下載與縮圖都在 thread 中執行，不佔用 event loop
+        return await asyncio.to_thread(self.get, product, url)
+
+    def _lock_for(self, product: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(product, threading.Lock())
+
+    def _refresh(self, product: str, url: str, state: Optional[Dict]) -> CachedWeatherImage:
+        headers = {}
+        if state:
+            if state['etag']:
+                headers['If-None-Match'] = state['etag']
+            if state['last_modified']:
+                headers['If-Modified-Since'] = state['last_modified']
+
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and state:
+            state['checked_at'] = time.time()
+            return state['image']
+        if response.status_code != 200:
+            raise Exception(f"上游回應 {response.status_code}")
+
+        last_modified = response.headers.get('Last-Modified')
+        image = self._store(product, response.content, response.headers.get('Content-Type', ''), last_modified)
+        self._state[product] = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': last_modified,
+            'checked_at': time.time(),
+            'image': image,
+        }
+        return image
+
+    def _store(self, product: str, content: bytes, content_type: str,
+               last_modified: Optional[str]) -> CachedWeatherImage:
+        timestamp = _timestamp(last_modified)
+        extension = _EXTENSIONS.get(content_type.split(';')[0].strip(), '.png')
+        image = CachedWeatherImage(
+            product=product,
+            timestamp=timestamp,
+            original=f"{product}-{timestamp}{extension}",
+            preview=f"{product}-{timestamp}-preview.jpg",
+        )
+        # 其他 process 已經下載過同一張圖時不重複寫入
+        if not os.path.exists(os.path.join(self.cache_dir, image.preview)):
+            self._write(image.original, content)
+            self._write(image.preview, self._make_preview(content))
+            logging.info(f"快取 {product} 圖片 {timestamp}：原圖 {len(content)} bytes")
+            self._prune(product)
+        return image
+
+    def _make_preview(self, content: bytes) -> bytes:
+        preview = Image.open(io.BytesIO(content))
+        preview.draft('RGB', (self.preview_max_edge, self.preview_max_edge))
+        preview = preview.convert('RGB')
+        preview.thumbnail((self.preview_max_edge, self.preview_max_edge), Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        preview.save(output, 'JPEG', quality=80, optimize=True)
+        return output.getvalue()
+
+    def _write(self, filename: str, content: bytes):
+        # 先寫暫存檔再改名，靜態路由不會讀到寫一半的檔案
+        path = os.path.join(self.cache_dir, filename)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def _prune(self, product: str):
+        prefix = f"{product}-"
+        timestamps = sorted({
+            name[len(prefix):len(prefix) + 14] for name in os.listdir(self.cache_dir)
+            if name.startswith(prefix) and not name.endswith('.tmp')
+        }, reverse=True)
+        for timestamp in timestamps[self.keep:]:
+            for name in os.listdir(self.cache_dir):
+                if name.startswith(f"{prefix}{timestamp}"):
+                    try:
+                        os.remove(os.path.join(self.cache_dir, name))
+                    except FileNotFoundError:
+                        # 多個 worker 共用快取目錄，其他 process 可能已經刪除
+                        pass
+
+
+def _timestamp(last_modified: Optional[str]) -> str:
+    # 以上游的 Last-Modified 作為圖片時間，沒有時使用下載時間
+    when = None
+    if last_modified:
+        try:
+            when = parsedate_to_datetime(last_modified)
+        except (TypeError, ValueError):
+            when = None
+    if when is None:
+        when = datetime.now(timezone.utc)
+    return when.astimezone(timezone.utc).strftime('%Y%m%d%H%M%S')
@@ -0,0 +1,174 @@
+import csv
+import asyncio
+import json
+import time
+import logging
+import threading
+from typing import Optional, List, Dict, Any, Callable, Tuple, Awaitable
+
+from utils.sqlite_utils import SQLiteDatabase
+
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS winning_numbers (
+    year INTEGER NOT NULL,
+    period INTEGER NOT NULL,
+    numbers TEXT NOT NULL,
+    source TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (year, period)
+) WITHOUT ROWID;
+"""
+
+PRIZE_KEYS = ['special_prize', 'grand_prize', 'first_prize', 'additional_sixth_prize']
+
+
+def normalize_winning_numbers(data: Dict[str, Any]) -> Dict[str, List[str]]:
+    """
+    只保留四種獎項欄位，並統一為字串列表（CSV 以空白分隔多組號碼）
+    """
+    numbers = {}
+    for key in PRIZE_KEYS:
+        value = data.get(key) or []
+        if isinstance(value, str):
+            value = value.split()
+        numbers[key] = [str(num).strip() for num in value if str(num).strip()]
+    return numbers
+
+
+class WinningNumbersStore:
+    """
+    依期別存放的歷史中獎號碼。
+    已公布的中獎號碼不會再變動，因此讀過的期別會留在 process 記憶體中，之後的查詢不需碰資料庫。
+    """
+
+    def __init__(self, path: str):
+        self.db = SQLiteDatabase(path, STORE_SCHEMA)
+        self._cache: Dict[Tuple[int, int], Dict[str, List[str]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, period_info: Dict[str, Any]) -> Optional[Dict[str, List[str]]]:
+        """
+        取得該期中獎號碼，尚未收錄時回傳 None
+        """
+        key = (int(period_info['year']), int(period_info['period']))
+        numbers = self._cache.get(key)
+        if numbers is not None:
+            return numbers
+        row = self.db.connection().execute(
+            "SELECT numbers FROM winning_numbers WHERE year = ? AND period = ?", key
+        ).fetchone()
+        if row is None:
+            return None
+        numbers = json.loads(row['numbers'])
+        with self._lock:
+            self._cache[key] = numbers
+        return numbers
+
+    def put(self, period_info: Dict[str, Any], winning_numbers: Dict[str, Any], source: Optional[str] = None) -> bool:
+        """
+        寫入該期中獎號碼，回傳是否為新收錄或內容有變動
+        """
+        key = (int(period_info['year']), int(period_info['period']))
+        numbers = normalize_winning_numbers(winning_numbers)
+        encoded = json.dumps(numbers, ensure_ascii=False, sort_keys=True)
+        with self.db.transaction() as conn:
+            row = conn.execute("SELECT numbers FROM winning_numbers WHERE year = ? AND period = ?", key).fetchone()
+            if row is not None and row['numbers'] == encoded:
+                changed = False
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO winning_numbers (year, period, numbers, source, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key[0], key[1], encoded, source, time.time()),
+                )
+                changed = True
+        with self._lock:
+            self._cache[key] = numbers
+        return changed
+
+    def periods(self) -> List[Dict[str, int]]:
+        """
+        列出已收錄的期別
+        """
+        rows = self.db.connection().execute(
+            "SELECT year, period FROM winning_numbers ORDER BY year, period"
+        ).fetchall()
+        return [{'year': row['year'], 'period': row['period']} for row in rows]
+
+    def import_file(self, path: str) -> int:
+        """
+        從 JSON 或 CSV 匯入歷史中獎號碼，回傳新增或更新的期別數
+        JSON: [{"year": 2024, "period": 6, "special_prize": [...], ...}, ...]
+        CSV: year,period,special_prize,grand_prize,first_prize,additional_sixth_prize（多組號碼以空白分隔）
+        """
+        if path.endswith('.csv'):
+            with open(path, newline='', encoding='utf-8') as f:
+                records = list(csv.DictReader(f))
+        else:
+            with open(path, encoding='utf-8') as f:
+                records = json.load(f)
+        imported = 0
+        for record in records:
+            period_info = {'year': int(record['year']), 'period': int(record['period'])}
+            if self.put(period_info, record, source=f"import:{path}"):
+                imported += 1
+        logging.info(f"從 {path} 匯入 {imported} 期中獎號碼")
+        return imported
+
+
+def sync_winning_numbers(
+    store: WinningNumbersStore,
+    fetch_page: Callable[[str], Tuple[Dict[str, int], Dict[str, List[str]]]],
+    urls: List[str],
+) -> List[Dict[str, int]]:
+    """
+    從各個來源頁面抓取中獎號碼並寫入 store，回傳有新資料的期別
+    """
+    updated = []
+    for url in urls:
+        try:
+            period_info, winning_numbers = fetch_page(url)
+        except Exception as e:
+            logging.error(f"同步中獎號碼失敗 {url}: {e}")
+            continue
+        if store.put(period_info, winning_numbers, source=url):
+            logging.info(f"收錄 {period_info['year']} 年第 {period_info['period']} 期中獎號碼")
+            updated.append(period_info)
+    return updated
+
+
+async def sync_winning_numbers_async(
+    store: WinningNumbersStore,
+    fetch_page: Callable[[str], Awaitable[Tuple[Dict[str, int], Dict[str, List[str]]]]],
+    urls: List[str],
+) -> List[Dict[str, int]]:
+    """
+    sync_winning_numbers 的非同步版本：同時抓取各來源頁面，寫入 SQLite 在 thread 中執行
+    """
+    results = await asyncio.gather(*(fetch_page(url) for url in urls), return_exceptions=True)
+    updated = []
+    for url, result in zip(urls, results):
+        if isinstance(result, Exception):
+            logging.error(f"同步中獎號碼失敗 {url}: {result}")
+            continue
+        period_info, winning_numbers = result
+        if await asyncio.to_thread(store.put, period_info, winning_numbers, source=url):
+            logging.info(f"收錄 {period_info['year']} 年第 {period_info['period']} 期中獎號碼")
+            updated.append(period_info)
+    return updated
+
+
+# local use: python -m utils.winning_numbers_store <db_path> import <file> | sync
+if __name__ == "__main__":
+    import sys
+    from utils.invoice_processing import fetch_winning_numbers_page, ETAX_WINNING_NUMBER_URLS
+
+    if len(sys.argv) < 3:
+        print("usage: python -m utils.winning_numbers_store <db_path> import <file> | sync")
+        sys.exit(1)
+    winning_store = WinningNumbersStore(sys.argv[1])
+    if sys.argv[2] == 'import':
+        winning_store.import_file(sys.argv[3])
+    elif sys.argv[2] == 'sync':
+        sync_winning_numbers(winning_store, fetch_winning_numbers_page, ETAX_WINNING_NUMBER_URLS)
+    print("已收錄期別：", winning_store.periods())